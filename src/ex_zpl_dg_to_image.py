@@ -18,8 +18,5 @@ for dg_cmd in dg_cmds:
     if is_compressed:
         data = decompress(data, bytes_per_row)
     # Generate a PIL image
-    data_bits = chars_to_bits(data)
-    bits_total = size_byte_to_bit(bytes_total)
-    bits_per_row = size_byte_to_bit(bytes_per_row)
-    image = bits_to_image(bits_total, bits_per_row, data_bits)
+    image = bytes_to_image(bytes_total, bytes_per_row, hex_to_bytes(data))
     image.save('./img/dg_cmd_format.png')
@@ -18,8 +18,5 @@ for gf_cmd in gf_cmds:
     if is_compressed:
         data = decompress_z64(data)
     # Generate a PIL image
-    data_bits = chars_to_bits(data)
-    bits_total = size_byte_to_bit(binary_byte_count)
-    bits_per_row = size_byte_to_bit(bytes_per_row)
-    image = bits_to_image(bits_total, bits_per_row, data_bits)
+    image = bytes_to_image(binary_byte_count, bytes_per_row, hex_to_bytes(data))
     image.save('./img/gf_cmd_format.png')
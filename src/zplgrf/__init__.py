@@ -0,0 +1,20 @@
+from .codec import *
+from .parser import *
+from .raster import *
+from .graphics import *
+from .render import *
+from .metrics import *
+
+"""
+PIL modules that used to be importable from zplgrf, they are only imported when first accessed
+(e.g. `zplgrf.Image`) so codec and parser functions never load Pillow.
+They are deliberately not exported by `from zplgrf import *`, which would import Pillow again.
+"""
+pil_modules = ('Image', 'ImageChops', 'ImageDraw', 'ImageFont')
+
+
+def __getattr__(name):
+    if name in pil_modules:
+        import importlib
+        return importlib.import_module('PIL.{}'.format(name))
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
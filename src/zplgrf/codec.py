@@ -0,0 +1,830 @@
+import base64
+import binascii
+import re
+import zlib
+
+from .metrics import instrumented
+
+"""
+Data compression scheme recognized by the Zebra printer.
+A comma (,) fills the line, to the right, with zeros (0) until the specified line byte is filled.
+An exclamation mark (!) fills the line, to the right, with ones (1) until the specified line byte is filled.
+A colon (:) denotes repetition of the previous line.
+"""
+repeat_values = [',', '!', ':']
+
+"""
+Data compression scheme recognized by the Zebra printer.
+The following represent the repeat counts on a subsequent Hexadecimal value.
+Sending M6 to the printer is identical to sending the following hexadecimal data: 6666666.
+Several repeat values can be used together to achieve any value desired. vMB or MvB will send 327 hexadecimal B’s to the printer.
+"""
+repeat_counts = {
+    'G': 1,
+    'H': 2,
+    'I': 3,
+    'J': 4,
+    'K': 5,
+    'L': 6,
+    'M': 7,
+    'N': 8,
+    'O': 9,
+    'P': 10,
+    'Q': 11,
+    'R': 12,
+    'S': 13,
+    'T': 14,
+    'U': 15,
+    'V': 16,
+    'W': 17,
+    'X': 18,
+    'Y': 19,
+    'g': 20,
+    'h': 40,
+    'i': 60,
+    'j': 80,
+    'k': 100,
+    'l': 120,
+    'm': 140,
+    'n': 160,
+    'o': 180,
+    'p': 200,
+    'q': 220,
+    'r': 240,
+    's': 260,
+    't': 280,
+    'u': 300,
+    'v': 320,
+    'w': 340,
+    'x': 360,
+    'y': 380,
+    'z': 400,
+}
+
+"""
+Reversed repeat_counts.
+"""
+counts_repeat = dict([(value, key) for key, value in repeat_counts.items()])
+
+"""
+List of valid hexadecimal characters.
+"""
+hex_chars = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', 'A', 'B', 'C', 'D', 'E', 'F']
+
+"""
+Set of all characters that can only appear in compressed ~DG command data.
+"""
+compression_chars = frozenset(repeat_values + list(repeat_counts.keys()))
+
+"""
+Lookup tables used by the ~DG command data decompressor.
+`acs_count_table` maps every byte to its repeat count (0 for non repeat count characters).
+`acs_split_pattern` splits data into literal hex characters separated by runs of repeat counts or repeat values.
+`acs_token_pattern` matches runs of repeat counts, repeat values or literal hex characters one at a time.
+`acs_invalid_pattern` matches any character that is not allowed in compressed data.
+"""
+acs_count_table = [0] * 256
+for _count_char, _count in repeat_counts.items():
+    acs_count_table[ord(_count_char)] = _count
+del _count_char, _count
+
+acs_split_pattern = re.compile(rb'([G-Yg-z]+|[,!:]+)')
+acs_token_pattern = re.compile(rb'([G-Yg-z]+)|([,!:]+)|([0-9A-Fa-f]+)')
+acs_invalid_pattern = re.compile(rb'[^0-9A-Fa-fG-Yg-z,!:]')
+
+"""
+Pattern used by the ~DG command data compressor.
+Matches runs of 3 or more same hex characters (shorter runs are not shortened by repeat counts).
+"""
+acs_run_pattern = re.compile(r'([0-9A-F])\1{2,}')
+
+
+def size_byte_to_bit(byte_size):
+    """
+    Calculates size in bits from size in bytes (1 byte = 8 bits).
+
+    :param byte_size: size in bytes
+    :return: size in bits
+    """
+    return byte_size * 8
+
+
+def size_bit_to_byte(bit_size):
+    """
+    Calculates size in bytes from size in bits (1 byte = 8 bits).
+
+    :param bit_size: size in bits
+    :return: size in bytes
+    """
+    return int(bit_size / 8)
+
+
+def size_byte_to_char(byte_size):
+    """
+    Calculates size in chars from size in bytes (1 byte = 2 chars).
+
+    :param byte_size: size in bytes
+    :return: size in chars
+    """
+    return byte_size * 2
+
+
+@instrumented(result_size=lambda result: len(result[1]))
+def encode_data(data, bytes_per_row, encoding='auto', level=9):
+    """
+    Encodes packed bytes to ^GF (or ~DG for `hex` and `acs`) command data:
+        `hex` - uncompressed ASCII hexadecimal
+        `acs` - ASCII hexadecimal compressed with repeat counts and repeat values (see `compress`)
+        `z64` - zlib compressed, base64 encoded, with CRC (see `compress_z64`)
+        `b64` - base64 encoded, with CRC (see `encode_b64`)
+        `auto` - whichever of the above is the shortest
+
+    :param data: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :param encoding: one of `hex`, `acs`, `z64`, `b64` or `auto` (optional, default is `auto`)
+    :param level: zlib compression level for `z64` (optional, default is 9)
+    :return: used encoding, encoded command data
+    """
+    if encoding == 'hex':
+        return encoding, bytes_to_hex(data)
+    if encoding == 'acs':
+        return encoding, compress_bytes(data, bytes_per_row)
+    if encoding == 'z64':
+        return encoding, compress_z64(data, level)
+    if encoding == 'b64':
+        return encoding, encode_b64(data)
+    if encoding != 'auto':
+        raise ValueError('Unknown encoding {!r}'.format(encoding))
+
+    candidates = [encode_data(data, bytes_per_row, candidate, level) for candidate in ('acs', 'z64', 'b64')]
+    # uncompressed hex is never shorter than ACS, it is only built when ACS does not save anything
+    shortest = min(candidates, key=lambda candidate: len(candidate[1]))
+    if len(shortest[1]) >= size_byte_to_char(len(data)):
+        return encode_data(data, bytes_per_row, 'hex')
+    return shortest
+
+
+@instrumented()
+def clean(data):
+    """
+    Removes new lines, carriage returns and tabs from data.
+
+    :param data: ~DG command data
+    :return: cleaned ~DG command data
+    """
+    return data.replace('\n', '').replace('\r', '').replace('\t', '')
+
+
+def check_for_compression(data):
+    """
+    Checks if any repetition specific character is in data.
+
+    :param data: ~DG command data
+    :return: is ~DG command data compressed or not
+    """
+    return not compression_chars.isdisjoint(data)
+
+
+def check_for_z64_compression(data):
+    """
+    Checks if data starts with :Z64:.
+
+    :param data: ^GF command data
+    :return: is ^GF command data compressed or not
+    """
+    if data.startswith(':Z64:'):
+        return True
+    return False
+
+
+@instrumented()
+def decompress(data, bytes_per_row):
+    """
+    Decompresses ~DG command data:
+        Values from `repeat_counts` represent the repeat counts on a subsequent hexadecimal value.
+        Several repeat values can be used together to achieve any value desired. vMB or MvB will result in 327 hexadecimal B.
+        A comma (,) fills the line, to the right, with zeros (0) until the specified line byte is filled.
+        An exclamation mark (!) fills the line, to the right, with ones (1) until the specified line byte is filled.
+        A colon (:) denotes repetition of the previous line.
+
+    :param data: compressed ~DG command data
+    :param bytes_per_row: row width (in bytes) for ~DG command data
+    :return: decompressed ~DG command data
+    """
+    return bytes_to_hex(decompress_to_bytes(data, bytes_per_row))
+
+
+@instrumented()
+def decompress_to_bytes(data, bytes_per_row, bytes_total=None, strict=False):
+    """
+    Decompresses ~DG command data straight to packed bytes (see `decompress` for the compression scheme).
+    Data is split into runs with a single regex pass and expanded rows are appended to one buffer
+    with fill and copy operations. Only complete rows are returned.
+
+    :param data: compressed ~DG command data (string, bytes or bytearray)
+    :param bytes_per_row: row width (in bytes) for ~DG command data
+    :param bytes_total: total number of bytes in graphic (optional, limits the output)
+    :param strict: raise ValueError on invalid characters, row overflow, misplaced `:` and truncated data
+    :return: decompressed ~DG command data as packed bytes
+    """
+    if isinstance(data, str):
+        data = data.encode('ascii', 'replace')
+    if strict:
+        invalid = acs_invalid_pattern.search(data)
+        if invalid:
+            raise ValueError('Invalid ACS character {!r} at {}'.format(invalid.group().decode('ascii', 'replace'),
+                                                                      invalid.start()))
+    else:
+        data = acs_invalid_pattern.sub(b'', data)
+    chars_per_row = size_byte_to_char(bytes_per_row)
+    chars_total = size_byte_to_char(bytes_total) if bytes_total is not None else None
+    zeros_row = b'0' * chars_per_row
+    ones_row = b'F' * chars_per_row
+    counts_cache = {}
+
+    parts = acs_split_pattern.split(data)
+    out = bytearray(parts[0])
+
+    # separators (repeat counts or repeat values) are at odd indexes, literal hex characters at even indexes
+    for part_i in range(1, len(parts), 2):
+        separator = parts[part_i]
+        literal = parts[part_i + 1]
+
+        # process repeat counts on the first following hex character
+        if separator[0] > 58:
+            if literal:
+                count = counts_cache.get(separator)
+                if count is None:
+                    count = counts_cache[separator] = sum([acs_count_table[char] for char in separator])
+                if strict:
+                    row_i = len(out) // chars_per_row
+                    if row_i != (len(out) + count - 1) // chars_per_row:
+                        raise ValueError('ACS run of {} chars overflows row {}'.format(count, row_i))
+                out += literal[:1] * count
+                literal = literal[1:]
+
+        # process repeat value characters
+        else:
+            for value in separator:
+                row_fill = len(out) % chars_per_row
+                if value == 58:
+                    if strict and row_fill:
+                        raise ValueError('ACS row repeat inside row {}'.format(len(out) // chars_per_row))
+                    if row_fill:
+                        del out[-row_fill:]
+                    if len(out) >= chars_per_row:
+                        out += out[-chars_per_row:]
+                    elif strict:
+                        raise ValueError('ACS row repeat without previous row')
+                    else:
+                        out += zeros_row
+                elif value == 44:
+                    out += zeros_row[row_fill:]
+                else:
+                    out += ones_row[row_fill:]
+
+        out += literal
+
+    complete = len(out) - len(out) % chars_per_row
+    if strict and chars_total is not None and len(out) > chars_total:
+        raise ValueError('ACS data exceeds {} bytes'.format(bytes_total))
+    if strict and (complete != len(out) or (chars_total is not None and complete < chars_total)):
+        raise ValueError('ACS data truncated after {} complete rows'.format(complete // chars_per_row))
+    if chars_total is not None:
+        complete = min(complete, chars_total)
+    del out[complete:]
+    return bytes.fromhex(out.decode('ascii'))
+
+
+def check_for_b64_encoding(data):
+    """
+    Checks if data starts with :B64:.
+
+    :param data: ^GF command data
+    :return: is ^GF command data base64 encoded or not
+    """
+    return data.startswith(':B64:')
+
+
+def decompress_z64(data):
+    """
+    Decompresses Z64 compressed (or B64 encoded) ^GF command data to ASCII hexadecimal string
+    (see `decompress_z64_to_bytes`).
+
+    :param data: compressed ^GF command data
+    :return: decompressed ^GF command data
+    """
+    return bytes_to_hex(decompress_z64_to_bytes(data))
+
+
+@instrumented()
+def decompress_z64_to_bytes(data, max_bytes=None, verify=True, chunk_size=65536):
+    """
+    Decompresses Z64 compressed (or B64 encoded) ^GF command data to packed bytes (see `iter_z64_chunks`).
+
+    :param data: cleaned compressed command data (`:Z64:...:CRC` or `:B64:...:CRC`)
+    :param max_bytes: maximum number of decompressed bytes, usually total number of bytes in graphic (optional)
+    :param verify: verify CRC (if present)
+    :param chunk_size: number of base64 characters decoded at once (multiple of 4)
+    :return: packed bytes
+    """
+    return b''.join(iter_z64_chunks(data, max_bytes, verify, chunk_size))
+
+
+def iter_z64_chunks(data, max_bytes=None, verify=True, chunk_size=65536):
+    """
+    Decompresses Z64 compressed (or B64 encoded) ^GF command data in chunks with bounded memory:
+        base64 data is decoded `chunk_size` characters at a time,
+        decoded data is inflated with a zlib decompressobj producing at most `chunk_size` bytes per call,
+        CRC of base64 data is calculated along the way and checked at the end.
+    Decompressing more than `max_bytes` (e.g. a corrupt payload or a zlib bomb) raises ValueError
+    as soon as the limit is crossed, so does a CRC mismatch.
+
+    :param data: cleaned compressed command data (`:Z64:...:CRC` or `:B64:...:CRC`)
+    :param max_bytes: maximum number of decompressed bytes, usually total number of bytes in graphic (optional)
+    :param verify: verify CRC (if present)
+    :param chunk_size: number of base64 characters decoded at once (multiple of 4)
+    :return: generator of packed bytes chunks
+    """
+    if isinstance(data, str):
+        data = data.encode('latin-1')
+    is_z64 = data.startswith(b':Z64:')
+    if not is_z64 and not data.startswith(b':B64:'):
+        raise ValueError('Data is not Z64 compressed or B64 encoded')
+    base64_end = data.find(b':', 5)
+    base64_end = len(data) if base64_end == -1 else base64_end
+    expected_crc = data[base64_end + 1:].strip()
+    chunk_size = max(4, chunk_size - chunk_size % 4)
+    max_bytes = float('inf') if max_bytes is None else max_bytes
+
+    decompressor = zlib.decompressobj() if is_z64 else None
+    crc = 0
+    bytes_out = 0
+    for chunk_start in range(5, base64_end, chunk_size):
+        base64_chunk = data[chunk_start:min(chunk_start + chunk_size, base64_end)]
+        if verify:
+            crc = binascii.crc_hqx(base64_chunk, crc)
+        decoded = binascii.a2b_base64(base64_chunk)
+        while decoded:
+            if decompressor is None:
+                chunk, decoded = decoded, b''
+            else:
+                chunk = decompressor.decompress(decoded, chunk_size)
+                decoded = decompressor.unconsumed_tail
+            bytes_out += len(chunk)
+            if bytes_out > max_bytes:
+                raise ValueError('Decompressed data exceeds {} bytes'.format(max_bytes))
+            if chunk:
+                yield chunk
+    if decompressor is not None:
+        chunk = decompressor.flush()
+        bytes_out += len(chunk)
+        if bytes_out > max_bytes:
+            raise ValueError('Decompressed data exceeds {} bytes'.format(max_bytes))
+        if chunk:
+            yield chunk
+    if verify and expected_crc and int(expected_crc, 16) != crc:
+        raise ValueError('CRC mismatch: expected {}, calculated {:04X}'.format(
+            expected_crc.decode('latin-1'), crc))
+
+
+@instrumented()
+def decode_data(data, bytes_total, bytes_per_row, cache=None):
+    """
+    Decodes ~DG or ^GF command data (uncompressed, ACS compressed, Z64 compressed or B64 encoded) to packed bytes.
+    Z64 and B64 data is limited to `bytes_total` and its CRC is verified (see `iter_z64_chunks`).
+
+    :param data: ~DG or ^GF command data
+    :param bytes_total: total number of bytes in graphic
+    :param bytes_per_row: number of bytes per row
+    :param cache: `GraphicCache` to look decoded graphics up in and store them to (optional)
+    :return: packed bytes
+    """
+    data = clean(data)
+    if cache is not None:
+        key = cache.key(data, bytes_total, bytes_per_row)
+        bitmap = cache.get(key)
+        if bitmap is not None:
+            return bitmap
+
+    if check_for_z64_compression(data) or check_for_b64_encoding(data):
+        bitmap = decompress_z64_to_bytes(data, bytes_total)
+    elif check_for_compression(data):
+        bitmap = decompress_to_bytes(data, bytes_per_row, bytes_total)
+    else:
+        bitmap = hex_to_bytes(data[:size_byte_to_char(bytes_total)])
+
+    if cache is not None:
+        cache.put(key, bitmap)
+    return bitmap
+
+
+@instrumented()
+def decode_binary_data(data, compression_type, bytes_total):
+    """
+    Decodes binary (`B`) or compressed binary (`C`) ^GF command data to packed bytes.
+    Compressed data is inflated with a limit of `bytes_total` bytes.
+
+    :param data: ^GF command data (bytes, or string with one character per byte)
+    :param compression_type: `B` or `C`
+    :param bytes_total: total number of bytes in graphic (graphic field count)
+    :return: packed bytes
+    """
+    if isinstance(data, str):
+        data = data.encode('latin-1')
+    data = bytes(data)
+    if compression_type.upper() == 'B':
+        return data[:bytes_total]
+    if compression_type.upper() != 'C':
+        raise ValueError('Unknown binary compression type {!r}'.format(compression_type))
+    decompressor = zlib.decompressobj()
+    bitmap = decompressor.decompress(data, bytes_total)
+    if decompressor.unconsumed_tail or decompressor.decompress(b'', 1):
+        raise ValueError('Decompressed data exceeds {} bytes'.format(bytes_total))
+    return bitmap
+
+
+def iter_rows(data, bytes_total, bytes_per_row, first_row=0, last_row=None):
+    """
+    Decodes ~DG or ^GF command data (uncompressed, ACS compressed, Z64 compressed or B64 encoded) one row at a time,
+    so only about one row of decoded data is held in memory.
+
+    :param data: ~DG or ^GF command data
+    :param bytes_total: total number of bytes in graphic
+    :param bytes_per_row: number of bytes per row
+    :param first_row: index of first row to return (previous rows are decoded but skipped)
+    :param last_row: index after last row to return (optional, default is all rows), decoding stops there
+    :return: generator of rows (packed bytes)
+    """
+    data = clean(data)
+    rows_total = bytes_total // bytes_per_row
+    last_row = rows_total if last_row is None else min(last_row, rows_total)
+    if check_for_z64_compression(data) or check_for_b64_encoding(data):
+        rows = iter_z64_rows(data, bytes_per_row, max_bytes=bytes_total)
+    elif check_for_compression(data):
+        rows = iter_acs_rows(data, bytes_per_row)
+    else:
+        rows = iter_hex_rows(data, bytes_per_row)
+    for row_i, row in enumerate(rows):
+        if row_i >= last_row:
+            break
+        if row_i >= first_row:
+            yield row
+
+
+def iter_hex_rows(data, bytes_per_row):
+    """
+    Decodes uncompressed ~DG or ^GF command data one row at a time.
+
+    :param data: cleaned uncompressed command data
+    :param bytes_per_row: number of bytes per row
+    :return: generator of rows (packed bytes)
+    """
+    chars_per_row = size_byte_to_char(bytes_per_row)
+    for row_start in range(0, len(data) - chars_per_row + 1, chars_per_row):
+        yield bytes.fromhex(data[row_start:row_start + chars_per_row])
+
+
+def iter_acs_rows(data, bytes_per_row):
+    """
+    Decodes ACS compressed ~DG or ^GF command data one row at a time (see `decompress` for the compression scheme)
+    with a row state machine: only the current row and the previous one are held in memory.
+
+    :param data: cleaned compressed command data (string or bytes)
+    :param bytes_per_row: number of bytes per row
+    :return: generator of rows (packed bytes)
+    """
+    if isinstance(data, str):
+        data = data.encode('ascii', 'replace')
+    chars_per_row = size_byte_to_char(bytes_per_row)
+    zeros_row = b'0' * chars_per_row
+    ones_row = b'F' * chars_per_row
+    previous_row = bytes(bytes_per_row)
+    row = bytearray()
+    count = 0
+    for match in acs_token_pattern.finditer(data):
+        counts, values, literal = match.groups()
+        if counts:
+            count += sum([acs_count_table[char] for char in counts])
+            continue
+        if values:
+            count = 0
+            for value in values:
+                if value == 58:
+                    del row[:]
+                    yield previous_row
+                else:
+                    row += (zeros_row if value == 44 else ones_row)[len(row):]
+                    previous_row = bytes.fromhex(row.decode('ascii'))
+                    del row[:]
+                    yield previous_row
+            continue
+        if count:
+            row += literal[:1] * count
+            literal = literal[1:]
+            count = 0
+        row += literal
+        while len(row) >= chars_per_row:
+            previous_row = bytes.fromhex(row[:chars_per_row].decode('ascii'))
+            del row[:chars_per_row]
+            yield previous_row
+
+
+def iter_z64_rows(data, bytes_per_row, chunk_size=65536, max_bytes=None):
+    """
+    Decodes Z64 compressed (or B64 encoded) ^GF command data one row at a time (see `iter_z64_chunks`).
+
+    :param data: cleaned compressed command data (`:Z64:...:CRC` or `:B64:...:CRC`)
+    :param bytes_per_row: number of bytes per row
+    :param chunk_size: number of base64 characters decoded at once (multiple of 4)
+    :param max_bytes: maximum number of decompressed bytes (optional)
+    :return: generator of rows (packed bytes)
+    """
+    pending = b''
+    for chunk in iter_z64_chunks(data, max_bytes, chunk_size=max(chunk_size, bytes_per_row)):
+        pending += chunk
+        row_start = 0
+        while len(pending) - row_start >= bytes_per_row:
+            yield pending[row_start:row_start + bytes_per_row]
+            row_start += bytes_per_row
+        pending = pending[row_start:]
+
+
+def crc16(data):
+    """
+    Calculates CRC (error detection code) of ^GF command data (CRC-16-CCITT, initial value 0),
+    with the table driven implementation of binascii.
+
+    :param data: base64 encoded data (string or bytes)
+    :return: CRC as 4 uppercase hexadecimal characters
+    """
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    return '{:04X}'.format(binascii.crc_hqx(data, 0))
+
+
+@instrumented()
+def compress_z64(data, level=9):
+    """
+    Compresses packed bytes to ^GF command data:
+        Data is compressed with zlib.
+        Compressed data is base64 encoded.
+        `:Z64:` is added to the start, CRC (error detection code) of base64 data is added to the end.
+
+    :param data: packed bytes
+    :param level: zlib compression level (optional, default is 9)
+    :return: compressed ^GF command data
+    """
+    base64_encoded_data = base64.b64encode(zlib.compress(bytes(data), level))
+    return ':Z64:{}:{}'.format(base64_encoded_data.decode('ascii'), crc16(base64_encoded_data))
+
+
+@instrumented()
+def encode_b64(data):
+    """
+    Encodes packed bytes to ^GF command data:
+        Data is base64 encoded.
+        `:B64:` is added to the start, CRC (error detection code) of base64 data is added to the end.
+
+    :param data: packed bytes
+    :return: encoded ^GF command data
+    """
+    base64_encoded_data = base64.b64encode(bytes(data))
+    return ':B64:{}:{}'.format(base64_encoded_data.decode('ascii'), crc16(base64_encoded_data))
+
+
+def substrings_of_same_consecutive_chars(string):
+    """
+    Breaks string into a list of substrings of same consecutive characters.
+
+    :param string: string
+    :return: list of substrings of same consecutive characters
+    """
+    substrings = []
+    substring = []
+    for char_i in range(len(string)):
+        char = string[char_i]
+        if char_i == 0:
+            substring = [char]
+            continue
+        previous_char = string[char_i - 1]
+        if char == previous_char:
+            substring.append(char)
+        else:
+            substrings.append(''.join(substring))
+            substring = [char]
+    substrings.append(''.join(substring))
+    return substrings
+
+
+@instrumented()
+def compress(data, bytes_per_row):
+    """
+    Compresses ~DG command data:
+        Values from `repeat_counts` represent the repeat counts on a subsequent hexadecimal value.
+        Several repeat values can be used together to achieve any value desired. vMB or MvB will result in 327 hexadecimal B.
+        A comma (,) fills the line, to the right, with zeros (0) until the specified line byte is filled.
+        An exclamation mark (!) fills the line, to the right, with ones (1) until the specified line byte is filled.
+        A colon (:) denotes repetition of the previous line.
+
+    :param data: decompressed ~DG command data
+    :param bytes_per_row: row width (in bytes) for ~DG command data
+    :return: compressed ~DG command data
+    """
+    return compress_bytes(hex_to_bytes(data), bytes_per_row)
+
+
+def repeat_count_chars(count):
+    """
+    Generates the shortest combination of repeat count characters for a repeat count.
+    Lowercase characters are multiples of 20 and uppercase characters are 1 to 19, so every count
+    needs at most one uppercase character, at most one lowercase character below `z` and as many `z` as needed.
+
+    :param count: repeat count
+    :return: repeat count characters
+    """
+    chars = 'z' * (count // 400)
+    count %= 400
+    if count >= 20:
+        chars += counts_repeat[count - count % 20]
+    if count % 20:
+        chars += counts_repeat[count % 20]
+    return chars
+
+
+@instrumented()
+def compress_bytes(data, bytes_per_row):
+    """
+    Compresses packed bytes to ~DG command data (see `compress` for the compression scheme) in one pass over rows.
+    Every row is encoded with the shortest possible form:
+        a colon (:) if it repeats the previous row,
+        a comma (,) or an exclamation mark (!) if it only consists of zeros or ones,
+        otherwise runs of 3 or more characters are replaced with repeat counts and
+        trailing zeros or ones are replaced with a comma (,) or an exclamation mark (!).
+
+    :param data: packed bytes
+    :param bytes_per_row: row width (in bytes) for ~DG command data
+    :return: compressed ~DG command data
+    """
+    data = bytes(data)
+    chars = data.hex().upper()
+    chars_per_row = size_byte_to_char(bytes_per_row)
+    zeros_row = bytes(bytes_per_row)
+    ones_row = b'\xff' * bytes_per_row
+    counts_cache = {}
+
+    def compress_run(match):
+        run = match.group()
+        count = len(run)
+        count_chars = counts_cache.get(count)
+        if count_chars is None:
+            count_chars = counts_cache[count] = repeat_count_chars(count)
+        return count_chars + run[0]
+
+    compressed_rows = []
+    previous_row = None
+    for row_start in range(0, len(data), bytes_per_row):
+        row = data[row_start:row_start + bytes_per_row]
+
+        # check if current row is the same as previous row or full of either 0 or F
+        if row == previous_row:
+            compressed_rows.append(':')
+            continue
+        previous_row = row
+        if row == zeros_row:
+            compressed_rows.append(',')
+            continue
+        if row == ones_row:
+            compressed_rows.append('!')
+            continue
+
+        # replace trailing zeros or ones (only for complete rows) and compress remaining runs
+        line = chars[row_start * 2:row_start * 2 + chars_per_row]
+        fill = ''
+        if len(row) == bytes_per_row:
+            if line[-1] == '0':
+                line = line.rstrip('0')
+                fill = ','
+            elif line[-1] == 'F':
+                line = line.rstrip('F')
+                fill = '!'
+        compressed_rows.append(acs_run_pattern.sub(compress_run, line) + fill)
+
+    return ''.join(compressed_rows)
+
+
+def compression_ratio(bytes_total, data):
+    """
+    Calculates compression ratio of ~DG command data (uncompressed size / compressed size, in chars).
+
+    :param bytes_total: total number of bytes in graphic
+    :param data: compressed ~DG command data
+    :return: compression ratio
+    """
+    if not data:
+        return float('inf') if bytes_total else 1.0
+    return size_byte_to_char(bytes_total) / len(data)
+
+
+def hex_char_to_bits(hex_char):
+    """
+    Turns a valid hexadecimal character to a string of 4 bits.
+
+    :param hex_char: hexadecimal character
+    :return: string of 4 bits
+    """
+    return bin(int(hex_char, 16))[2:].zfill(4)
+
+
+def bits_to_hex_char(bits):
+    """
+    Turns a string of 4 bits to a valid hexadecimal character.
+
+    :param bits: string of 4 bits
+    :return: hexadecimal character
+    """
+    return hex(int(bits, 2))[2:].upper()
+
+
+@instrumented()
+def chars_to_bits(data):
+    """
+    Turns a string of hexadecimal characters to a string of bits.
+
+    :param data: string of hexadecimal characters
+    :return: string of bits
+    """
+    if not data:
+        return ''
+    return format(int(data, 16), '0{}b'.format(len(data) * 4))
+
+
+def bits_to_chars(data_bits):
+    """
+    Turns a string of bits to a string of hexadecimal characters.
+
+    :param data_bits: string of bits
+    :return: string of hexadecimal characters
+    """
+    chars_count = len(data_bits) // 4
+    if not chars_count:
+        return ''
+    return format(int(data_bits[:chars_count * 4], 2), '0{}X'.format(chars_count))
+
+
+@instrumented()
+def hex_to_bytes(data):
+    """
+    Turns a string of hexadecimal characters to packed bytes (1 bit per pixel, 1 = black).
+
+    :param data: string of hexadecimal characters
+    :return: packed bytes
+    """
+    return bytes.fromhex(data)
+
+
+def bytes_to_hex(data):
+    """
+    Turns packed bytes to a string of uppercase hexadecimal characters.
+
+    :param data: packed bytes
+    :return: string of hexadecimal characters
+    """
+    return data.hex().upper()
+
+
+def bits_to_bytes(bits_per_row, bits):
+    """
+    Packs a string of bits to bytes, padding every row to a whole number of bytes with zeros.
+
+    :param bits_per_row: number of bits per row
+    :param bits: string of bits
+    :return: number of bytes per row, packed bytes
+    """
+    bytes_per_row = -(-bits_per_row // 8)
+    padding = bytes_per_row * 8 - bits_per_row
+    if padding:
+        padding_bits = '0' * padding
+        bits = ''.join(
+            bits[i:i + bits_per_row] + padding_bits for i in range(0, len(bits), bits_per_row)
+        )
+    if not bits:
+        return bytes_per_row, b''
+    return bytes_per_row, int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+def bytes_to_bits(bits_per_row, data):
+    """
+    Unpacks bytes to a string of bits, dropping row padding.
+
+    :param bits_per_row: number of bits per row
+    :param data: packed bytes
+    :return: string of bits
+    """
+    if not data:
+        return ''
+    bits = format(int.from_bytes(data, 'big'), '0{}b'.format(len(data) * 8))
+    row_bits = -(-bits_per_row // 8) * 8
+    if row_bits == bits_per_row:
+        return bits
+    return ''.join(bits[i:i + bits_per_row] for i in range(0, len(bits), row_bits))
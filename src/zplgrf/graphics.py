@@ -0,0 +1,534 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .codec import decode_binary_data, decode_data, encode_data, size_byte_to_bit
+from .metrics import emit, hooks, instrumented, size_of
+from .parser import (break_dg_command, break_gf_command, break_xg_command, build_dg_command, build_gf_command,
+                     build_xg_command, graphic_commands, graphic_key, tokenize)
+from .raster import bytes_to_image, magnify_bitmap
+
+
+class GraphicCache:
+    """
+    Content addressed LRU cache of decoded graphics (packed bytes, see `decode_data`).
+    Graphics are keyed by a hash of cleaned command data and geometry, so the same graphic embedded in many
+    ~DG or ^GF commands is only decoded once.
+    Least recently used graphics are evicted when either `max_entries` or `max_bytes` is exceeded.
+    An optional second tier (e.g. `DirectoryCacheTier`) is checked on misses and receives every new graphic.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=268435456, tier=None):
+        """
+        :param max_entries: maximum number of cached graphics
+        :param max_bytes: maximum total size of cached graphics (in bytes)
+        :param tier: second tier cache with `get(key)` and `put(key, bitmap)` (optional)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.tier = tier
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.tier_hits = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(data, bytes_total, bytes_per_row):
+        """
+        Generates cache key of graphic.
+
+        :param data: cleaned ~DG or ^GF command data (string or bytes)
+        :param bytes_total: total number of bytes in graphic
+        :param bytes_per_row: number of bytes per row
+        :return: cache key (hexadecimal string)
+        """
+        import hashlib
+        if isinstance(data, str):
+            # zpl code is decoded as latin-1, so every distinct string gets distinct bytes
+            try:
+                data = data.encode('latin-1')
+            except UnicodeEncodeError:
+                # characters above latin-1 are invalid command data (ignored when decoding)
+                data = data.encode('utf-8', 'surrogatepass')
+        digest = hashlib.blake2b(data, digest_size=16)
+        digest.update('|{},{}'.format(bytes_total, bytes_per_row).encode('ascii'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Looks graphic up in cache (and second tier on miss).
+
+        :param key: cache key
+        :return: packed bytes or None if graphic is not cached
+        """
+        started = time.perf_counter() if hooks else None
+        with self.lock:
+            bitmap = self.entries.get(key)
+            if bitmap is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if bitmap is None and self.tier is not None:
+            bitmap = self.tier.get(key)
+            if bitmap is not None:
+                with self.lock:
+                    self.tier_hits += 1
+                self.put(key, bitmap, to_tier=False)
+        if started is not None:
+            emit('graphic_cache', started, 0, size_of(bitmap), bitmap is not None)
+        return bitmap
+
+    def put(self, key, bitmap, to_tier=True):
+        """
+        Stores graphic in cache (and second tier), evicting least recently used graphics if needed.
+
+        :param key: cache key
+        :param bitmap: packed bytes
+        :param to_tier: also store graphic in second tier
+        """
+        bitmap = bytes(bitmap)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            if len(bitmap) <= self.max_bytes and self.max_entries > 0:
+                self.entries[key] = bitmap
+                self.size += len(bitmap)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        if to_tier and self.tier is not None:
+            self.tier.put(key, bitmap)
+
+    def clear(self):
+        """
+        Removes all graphics from cache (second tier is not cleared).
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Generates cache statistics.
+
+        :return: dict with entries, size, hits, misses, tier_hits, evictions and hit_ratio
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'tier_hits': self.tier_hits,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class DirectoryCacheTier:
+    """
+    On-disk second tier for `GraphicCache`, storing every graphic as a file named by its cache key.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory to store graphics in (created if needed)
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """
+        :param key: cache key
+        :return: path of graphic file
+        """
+        return os.path.join(self.directory, '{}.bin'.format(key))
+
+    def get(self, key):
+        """
+        :param key: cache key
+        :return: packed bytes or None if graphic is not stored
+        """
+        try:
+            with open(self.path(key), 'rb') as in_file:
+                return in_file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, bitmap):
+        """
+        Stores graphic atomically (written to a temporary file first).
+
+        :param key: cache key
+        :param bitmap: packed bytes
+        """
+        import tempfile
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as out_file:
+            out_file.write(bitmap)
+        os.replace(tmp_path, self.path(key))
+
+
+class Graphic:
+    """
+    Graphic from a ~DG or ^GF command.
+    Only the header is parsed when a graphic is created, command data stays in zpl code as a (start, end) span
+    and is decoded to packed bytes the first time `bitmap`, `image` or `to_numpy` is used.
+    """
+
+    __slots__ = ('command', 'zpl', 'cmd_start', 'cmd_end', 'data_start', 'bytes_total', 'bytes_per_row',
+                 'device', 'image_name', 'extension', 'compression_type', 'binary_byte_count', 'cache', '_bitmap')
+
+    def __init__(self, command, zpl, cmd_start, cmd_end, data_start, bytes_total, bytes_per_row, device=None,
+                 image_name=None, extension=None, compression_type=None, binary_byte_count=None, cache=None):
+        """
+        :param command: `~DG` or `^GF`
+        :param zpl: zpl code containing the command (string, bytes, bytearray, mmap or memoryview)
+        :param cmd_start: start index of command inside zpl code
+        :param cmd_end: end index of command inside zpl code
+        :param data_start: start index of command data inside zpl code
+        :param bytes_total: total number of bytes in graphic
+        :param bytes_per_row: number of bytes per row
+        :param device: device to store image (~DG only)
+        :param image_name: image name (~DG only)
+        :param extension: extension (~DG only)
+        :param compression_type: compression type (^GF only)
+        :param binary_byte_count: binary byte count (^GF only)
+        :param cache: `GraphicCache` used when decoding (optional)
+        """
+        self.command = command
+        self.zpl = zpl
+        self.cmd_start = cmd_start
+        self.cmd_end = cmd_end
+        self.data_start = data_start
+        self.bytes_total = bytes_total
+        self.bytes_per_row = bytes_per_row
+        self.device = device
+        self.image_name = image_name
+        self.extension = extension
+        self.compression_type = compression_type
+        self.binary_byte_count = binary_byte_count
+        self.cache = cache
+        self._bitmap = None
+
+    @classmethod
+    def from_command(cls, zpl, cmd, cache=None):
+        """
+        Creates graphic from a ~DG or ^GF command found by `tokenize` (or `stream_tokenize`).
+
+        :param zpl: zpl code the command was found in (string, bytes, bytearray, mmap or memoryview)
+        :param cmd: command (see `tokenize`)
+        :param cache: `GraphicCache` used when decoding (optional)
+        :return: graphic
+        """
+        header_parts = 3 if cmd.command == '~DG' else 4
+        comma = ',' if isinstance(zpl, str) else b','
+        data_start = cmd.params_start
+        for _ in range(header_parts):
+            data_start = zpl.find(comma, data_start, cmd.end) + 1
+            if data_start == 0:
+                raise ValueError('{} command at {} has no data'.format(cmd.command, cmd.start))
+        header = zpl[cmd.params_start:data_start]
+        header = header if isinstance(header, str) else bytes(header).decode('latin-1')
+
+        if cmd.command == '~DG':
+            device, image_name, extension, bytes_total, bytes_per_row, data = break_dg_command('~DG' + header)
+            return cls(cmd.command, zpl, cmd.start, cmd.end, data_start, bytes_total, bytes_per_row,
+                       device=device, image_name=image_name, extension=extension, cache=cache)
+        compression_type, binary_byte_count, graphic_field_count, bytes_per_row, data = break_gf_command(
+            '^GF' + header)
+        return cls(cmd.command, zpl, cmd.start, cmd.end, data_start, graphic_field_count, bytes_per_row,
+                   compression_type=compression_type, binary_byte_count=binary_byte_count, cache=cache)
+
+    @property
+    def width(self):
+        """
+        :return: width in pixels (dots)
+        """
+        return size_byte_to_bit(self.bytes_per_row)
+
+    @property
+    def height(self):
+        """
+        :return: height in pixels (dots)
+        """
+        return self.bytes_total // self.bytes_per_row if self.bytes_per_row else 0
+
+    @property
+    def payload_size(self):
+        """
+        :return: size of (possibly compressed) command data in zpl code
+        """
+        return self.cmd_end - self.data_start
+
+    @property
+    def data(self):
+        """
+        :return: (possibly compressed) command data (string, binary data has one character per byte)
+        """
+        data = self.zpl[self.data_start:self.cmd_end]
+        return data if isinstance(data, str) else bytes(data).decode('latin-1')
+
+    @property
+    def cmd(self):
+        """
+        :return: original command (string), e.g. to re-emit the graphic without decoding it
+        """
+        cmd = self.zpl[self.cmd_start:self.cmd_end]
+        return cmd if isinstance(cmd, str) else bytes(cmd).decode('latin-1')
+
+    @property
+    def is_decoded(self):
+        """
+        :return: has command data been decoded already
+        """
+        return self._bitmap is not None
+
+    @property
+    def bitmap(self):
+        """
+        :return: packed bytes (1 bit per pixel, 1 = black), decoded on first use
+        """
+        if self._bitmap is None and self.compression_type in ('B', 'C', 'b', 'c'):
+            self._bitmap = decode_binary_data(self.data, self.compression_type, self.bytes_total)
+        elif self._bitmap is None:
+            self._bitmap = decode_data(self.data, self.bytes_total, self.bytes_per_row, self.cache)
+        return self._bitmap
+
+    @property
+    def image(self):
+        """
+        :return: PIL image (mode `1`)
+        """
+        return bytes_to_image(self.bytes_total, self.bytes_per_row, self.bitmap)
+
+    def to_numpy(self):
+        """
+        Generates a numpy array of pixels (requires numpy).
+
+        :return: boolean array of shape (height, width), True = black
+        """
+        import numpy
+
+        bitmap = numpy.frombuffer(self.bitmap, dtype=numpy.uint8)
+        bitmap = bitmap[:self.height * self.bytes_per_row].reshape(self.height, self.bytes_per_row)
+        return numpy.unpackbits(bitmap, axis=1).astype(bool)
+
+    def __repr__(self):
+        return '<Graphic {} {}x{} payload={}>'.format(self.command, self.width, self.height, self.payload_size)
+
+
+def find_graphics(zpl, cache=None):
+    """
+    Finds all ~DG and ^GF commands inside zpl code as lazily decoded graphics.
+
+    :param zpl: zpl code (string, bytes, bytearray or mmap)
+    :param cache: `GraphicCache` used when decoding (optional)
+    :return: generator of graphics (see `Graphic`)
+    """
+    for cmd in tokenize(zpl):
+        if cmd.command in graphic_commands:
+            yield Graphic.from_command(zpl, cmd, cache)
+
+
+@instrumented(data_name='zpl', result_size=lambda result: len(result[0]))
+def dedupe_graphics(zpl, min_count=2, name_prefix='DUP', device='R:', cache=None, only_if_smaller=True):
+    """
+    Rewrites inline ^GF graphics repeated inside zpl code into a single ~DG download (ACS compressed)
+    and ^XG recalls in place of every ^GF, so the field position (^FO/^FT) and ^FS of each occurrence are kept.
+    Graphics are matched by a hash of decoded packed bytes, so the same image in different encodings is matched too.
+    A graphic is only rewritten when that makes zpl code shorter (unless `only_if_smaller` is False),
+    ~DG is placed before the label (^XA) with the first occurrence. Other commands are kept byte for byte.
+
+    :param zpl: zpl code (string or bytes)
+    :param min_count: minimum number of occurrences of a graphic to rewrite it
+    :param name_prefix: prefix of generated image names (names are at most 8 characters)
+    :param device: device to store images on
+    :param cache: `GraphicCache` used when decoding (optional)
+    :param only_if_smaller: only rewrite graphics when that saves bytes
+    :return: rewritten zpl code (same type as `zpl`), report dict with graphics (^GF commands found),
+             deduplicated (graphics moved to ~DG), replaced (^GF commands replaced), bytes_in, bytes_out and
+             bytes_saved
+    """
+    import hashlib
+    is_text = isinstance(zpl, str)
+    text = zpl if is_text else bytes(zpl).decode('latin-1')
+    existing_names = set()
+    label_start = None
+    groups = OrderedDict()
+    graphics_count = 0
+    for cmd in tokenize(text):
+        if cmd.command == '^XA':
+            label_start = cmd.start
+        elif cmd.command == '^XZ':
+            label_start = None
+        elif cmd.command == '~DG':
+            existing_names.add(graphic_key(*break_dg_command(text[cmd.start:cmd.end])[:3]))
+        elif cmd.command == '^GF':
+            graphic = Graphic.from_command(text, cmd, cache)
+            if graphic.compression_type != 'A':
+                continue
+            graphics_count += 1
+            digest = hashlib.blake2b(graphic.bitmap, digest_size=16)
+            digest.update('|{},{}'.format(graphic.bytes_total, graphic.bytes_per_row).encode('ascii'))
+            groups.setdefault(digest.hexdigest(), []).append(
+                (graphic, cmd.start if label_start is None else label_start))
+
+    replacements = []
+    name_i = 0
+    for graphic_group in groups.values():
+        if len(graphic_group) < min_count:
+            continue
+        graphic, insert_at = graphic_group[0]
+        while True:
+            name_i += 1
+            image_name = '{}{}'.format(name_prefix, name_i)[:8]
+            if graphic_key(device, image_name) not in existing_names:
+                break
+        encoding, data = encode_data(graphic.bitmap, graphic.bytes_per_row, 'acs')
+        dg_cmd = build_dg_command(graphic.bytes_total, graphic.bytes_per_row, data, image_name, device=device)
+        xg_cmd = build_xg_command(image_name, device=device)
+        saved = sum(other.cmd_end - other.cmd_start for other, _ in graphic_group) - len(dg_cmd) - \
+            len(xg_cmd) * len(graphic_group)
+        if saved <= 0 and only_if_smaller:
+            continue
+        existing_names.add(graphic_key(device, image_name))
+        replacements.append((insert_at, insert_at, dg_cmd))
+        replacements.extend((other.cmd_start, other.cmd_end, xg_cmd) for other, _ in graphic_group)
+
+    parts = []
+    position = 0
+    # stable sort keeps ~DG before a ^GF starting at the same index
+    for start, end, replacement in sorted(replacements, key=lambda replacement: replacement[0]):
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+    output = ''.join(parts)
+
+    report = {
+        'graphics': graphics_count,
+        'deduplicated': sum(1 for start, end, replacement in replacements if start == end),
+        'replaced': sum(1 for start, end, replacement in replacements if start != end),
+        'bytes_in': len(text),
+        'bytes_out': len(output),
+        'bytes_saved': len(text) - len(output),
+    }
+    return (output if is_text else output.encode('latin-1')), report
+
+
+@instrumented(data_name='zpl', result_size=lambda result: len(result[0]))
+def optimize_zpl(zpl, command=None, encoding='auto', level=9, verify=True, cache=None):
+    """
+    Rewrites every ~DG and ^GF graphic inside zpl code to its smallest encoding, other commands are kept
+    byte for byte. ~DG graphics are encoded with ACS (or hex), ^GF graphics with ACS, Z64 or B64
+    (see `encode_data`). A graphic is only rewritten when its new command is shorter.
+    Optionally graphics are converted:
+        `dg` - every ^GF is downloaded with ~DG once and recalled with ^XG (see `dedupe_graphics`)
+        `gf` - every ^XG recall of a ~DG downloaded in zpl code is replaced by an inline ^GF
+               (magnification applied) and recalled ~DG commands are removed
+
+    :param zpl: zpl code (string or bytes)
+    :param command: convert graphics to `dg` or `gf` (optional, default keeps commands)
+    :param encoding: encoding of ^GF graphics (see `encode_data`), ~DG graphics use `acs` for `auto`, `z64` or `b64`
+    :param level: zlib compression level for `z64`
+    :param verify: decode every rewritten graphic and keep the original command if packed bytes differ
+    :param cache: `GraphicCache` used when decoding (optional)
+    :return: rewritten zpl code (same type as `zpl`), report dict with graphics (graphic commands found),
+             rewritten (re-encoded graphics), converted (graphics moved between ~DG and ^GF), verify_failures,
+             bytes_in, bytes_out and bytes_saved
+    """
+    if command not in (None, 'dg', 'gf'):
+        raise ValueError('Unknown graphic command {!r}'.format(command))
+    is_text = isinstance(zpl, str)
+    text = zpl if is_text else bytes(zpl).decode('latin-1')
+    bytes_in = len(text)
+    converted = 0
+    if command == 'dg':
+        text, report = dedupe_graphics(text, min_count=1, cache=cache, only_if_smaller=False)
+        converted = report['replaced']
+
+    cmds = list(tokenize(text))
+    # recalls are keyed by the start of the ~DG command that was current when they ran,
+    # a name downloaded again only affects later recalls
+    downloads = {}
+    recalls = {}
+    if command == 'gf':
+        for cmd in cmds:
+            if cmd.command == '~DG':
+                graphic = Graphic.from_command(text, cmd, cache)
+                downloads[graphic_key(graphic.device, graphic.image_name, graphic.extension)] = cmd.start
+                recalls[cmd.start] = []
+            elif cmd.command == '^XG':
+                device, image_name, extension, magnify_x, magnify_y = break_xg_command(text[cmd.start:cmd.end])
+                download_start = downloads.get(graphic_key(device, image_name, extension))
+                if download_start is not None:
+                    recalls[download_start].append((cmd, magnify_x, magnify_y))
+
+    replacements = []
+    graphics_count = 0
+    rewritten = 0
+    verify_failures = 0
+    for cmd in cmds:
+        if cmd.command not in graphic_commands:
+            continue
+        graphics_count += 1
+        graphic = Graphic.from_command(text, cmd, cache)
+        if recalls.get(cmd.start):
+            for recall_cmd, magnify_x, magnify_y in recalls[cmd.start]:
+                bitmap, bytes_per_row = magnify_bitmap(graphic.bitmap, graphic.bytes_per_row, magnify_x, magnify_y)
+                used_encoding, data = encode_data(bitmap, bytes_per_row, encoding, level)
+                replacements.append((recall_cmd.start, recall_cmd.end,
+                                     build_gf_command(len(bitmap), bytes_per_row, data)))
+                converted += 1
+            replacements.append((cmd.start, cmd.end, ''))
+            continue
+        if graphic.compression_type not in (None, 'A'):
+            continue
+
+        bitmap = graphic.bitmap
+        if cmd.command == '~DG':
+            used_encoding, data = encode_data(bitmap, graphic.bytes_per_row, 'hex' if encoding == 'hex' else 'acs')
+            new_cmd = build_dg_command(graphic.bytes_total, graphic.bytes_per_row, data, graphic.image_name,
+                                       graphic.extension, graphic.device)
+        else:
+            used_encoding, data = encode_data(bitmap, graphic.bytes_per_row, encoding, level)
+            new_cmd = build_gf_command(graphic.bytes_total, graphic.bytes_per_row, data)
+        # keep whitespace following the command (e.g. a line break before the next command)
+        old_cmd = text[cmd.start:cmd.end]
+        trailing = old_cmd[len(old_cmd.rstrip()):]
+        if len(new_cmd) + len(trailing) >= len(old_cmd):
+            continue
+        if verify and decode_data(data, graphic.bytes_total, graphic.bytes_per_row) != bitmap:
+            verify_failures += 1
+            continue
+        replacements.append((cmd.start, cmd.end, new_cmd + trailing))
+        rewritten += 1
+
+    parts = []
+    position = 0
+    for start, end, replacement in sorted(replacements, key=lambda replacement: replacement[0]):
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+    output = ''.join(parts)
+
+    report = {
+        'graphics': graphics_count,
+        'rewritten': rewritten,
+        'converted': converted,
+        'verify_failures': verify_failures,
+        'bytes_in': bytes_in,
+        'bytes_out': len(output),
+        'bytes_saved': bytes_in - len(output),
+    }
+    return (output if is_text else output.encode('latin-1')), report
@@ -0,0 +1,245 @@
+import contextlib
+import functools
+import threading
+import time
+from collections import namedtuple
+
+"""
+Installed instrumentation callbacks (see `add_hook`), instrumented functions skip all measuring while it is empty.
+"""
+hooks = []
+
+"""
+Event passed to instrumentation callbacks:
+    stage - name of instrumented function (or custom stage passed to `emit`)
+    duration - time spent in stage (in seconds), spans nest (e.g. `decode_data` includes `clean`)
+    bytes_in, bytes_out - size of stage input and output (0 if not applicable, e.g. PIL images)
+    cache_hit - True or False for cache lookups, None otherwise
+"""
+Event = namedtuple('Event', ['stage', 'duration', 'bytes_in', 'bytes_out', 'cache_hit'])
+
+"""
+Upper bounds of stage duration histogram buckets (in seconds), used by `MetricsAggregator`.
+"""
+duration_buckets = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def add_hook(callback):
+    """
+    Installs an instrumentation callback, enabling instrumentation.
+
+    :param callback: function receiving `Event`s, called synchronously from the instrumented thread
+    """
+    hooks.append(callback)
+
+
+def remove_hook(callback):
+    """
+    Removes an installed instrumentation callback, instrumentation is disabled when no callbacks are left.
+
+    :param callback: installed callback
+    """
+    hooks.remove(callback)
+
+
+@contextlib.contextmanager
+def instrumentation(callback):
+    """
+    Context manager installing an instrumentation callback for the duration of a block.
+
+    :param callback: function receiving `Event`s
+    :return: callback
+    """
+    add_hook(callback)
+    try:
+        yield callback
+    finally:
+        remove_hook(callback)
+
+
+def size_of(value):
+    """
+    Size of a stage input or output.
+
+    :param value: string, bytes or any other object
+    :return: length of sized objects, 0 otherwise
+    """
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+def emit(stage, started, bytes_in=0, bytes_out=0, cache_hit=None):
+    """
+    Sends an event to all installed callbacks.
+
+    :param stage: stage name
+    :param started: `time.perf_counter()` at the start of stage
+    :param bytes_in: size of stage input
+    :param bytes_out: size of stage output
+    :param cache_hit: True or False for cache lookups
+    """
+    event = Event(stage, time.perf_counter() - started, bytes_in, bytes_out, cache_hit)
+    for callback in hooks:
+        callback(event)
+
+
+def instrumented(data_index=0, data_name='data', result_size=size_of):
+    """
+    Decorator emitting an event (named after the function) for every call while instrumentation is enabled.
+    When it is disabled, the only overhead is an extra call and an emptiness check.
+
+    :param data_index: position of argument measured as `bytes_in` (None if input is not measured)
+    :param data_name: name of argument measured as `bytes_in` (when passed as keyword)
+    :param result_size: function measuring `bytes_out` from result (None if output is not measured)
+    :return: decorator
+    """
+    def decorator(function):
+        stage = function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not hooks:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            result = function(*args, **kwargs)
+            if data_index is None:
+                bytes_in = 0
+            else:
+                bytes_in = size_of(args[data_index] if len(args) > data_index else kwargs.get(data_name))
+            emit(stage, started, bytes_in, result_size(result) if result_size else 0)
+            return result
+        return wrapper
+    return decorator
+
+
+class MetricsAggregator:
+    """
+    Instrumentation callback aggregating events per stage: number of calls, total and maximum duration,
+    duration histogram, bytes in and out (their ratio is the compression ratio of encoding stages)
+    and cache hits and misses. Aggregated metrics are exported as JSON or Prometheus text.
+
+        aggregator = MetricsAggregator()
+        with instrumentation(aggregator):
+            ...
+        print(aggregator.to_prometheus())
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        with self.lock:
+            stage = self.stages.get(event.stage)
+            if stage is None:
+                stage = self.stages[event.stage] = {
+                    'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'buckets': [0] * len(duration_buckets),
+                    'bytes_in': 0, 'bytes_out': 0, 'cache_hits': 0, 'cache_misses': 0}
+            stage['count'] += 1
+            stage['seconds'] += event.duration
+            stage['max_seconds'] = max(stage['max_seconds'], event.duration)
+            for index, bound in enumerate(duration_buckets):
+                if event.duration <= bound:
+                    stage['buckets'][index] += 1
+                    break
+            stage['bytes_in'] += event.bytes_in
+            stage['bytes_out'] += event.bytes_out
+            if event.cache_hit is not None:
+                stage['cache_hits' if event.cache_hit else 'cache_misses'] += 1
+
+    def snapshot(self):
+        """
+        Copies aggregated metrics (picklable, so metrics of worker processes can be merged, see `merge`).
+
+        :return: dict of stage name to dict with count, seconds, max_seconds, buckets (non-cumulative counts
+                 of `duration_buckets`), bytes_in, bytes_out, cache_hits and cache_misses
+        """
+        with self.lock:
+            return {name: dict(stage, buckets=list(stage['buckets'])) for name, stage in self.stages.items()}
+
+    def merge(self, snapshot):
+        """
+        Adds metrics of a snapshot (see `snapshot`).
+
+        :param snapshot: snapshot of another aggregator
+        """
+        with self.lock:
+            for name, other in snapshot.items():
+                stage = self.stages.get(name)
+                if stage is None:
+                    self.stages[name] = dict(other, buckets=list(other['buckets']))
+                    continue
+                for key in ('count', 'seconds', 'bytes_in', 'bytes_out', 'cache_hits', 'cache_misses'):
+                    stage[key] += other[key]
+                stage['max_seconds'] = max(stage['max_seconds'], other['max_seconds'])
+                stage['buckets'] = [count + other_count for count, other_count in zip(stage['buckets'],
+                                                                                      other['buckets'])]
+
+    def reset(self):
+        """
+        Discards all aggregated metrics.
+        """
+        with self.lock:
+            self.stages = {}
+
+    def summary(self):
+        """
+        Aggregated metrics with derived values, sorted by total duration (hot paths first).
+
+        :return: list of dicts (see `snapshot`) with stage, mean_ms and ratio (bytes_out / bytes_in, None without
+                 input bytes)
+        """
+        summary = []
+        for name, stage in self.snapshot().items():
+            summary.append(dict(
+                stage, stage=name, mean_ms=stage['seconds'] / stage['count'] * 1000 if stage['count'] else 0.0,
+                ratio=stage['bytes_out'] / stage['bytes_in'] if stage['bytes_in'] else None))
+        summary.sort(key=lambda stage: stage['seconds'], reverse=True)
+        return summary
+
+    def to_json(self, indent=2):
+        """
+        Exports metrics as JSON (see `summary`).
+
+        :param indent: JSON indentation
+        :return: JSON string
+        """
+        import json
+        return json.dumps({'duration_buckets': duration_buckets, 'stages': self.summary()}, indent=indent)
+
+    def to_prometheus(self, prefix='zplgrf'):
+        """
+        Exports metrics in Prometheus text exposition format.
+
+        :param prefix: metric name prefix
+        :return: text
+        """
+        stages = sorted(self.snapshot().items())
+        lines = [
+            '# HELP {}_stage_seconds Time spent in pipeline stage.'.format(prefix),
+            '# TYPE {}_stage_seconds histogram'.format(prefix),
+        ]
+        for name, stage in stages:
+            cumulative = 0
+            for bound, count in zip(duration_buckets, stage['buckets']):
+                cumulative += count
+                lines.append('{}_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(prefix, name, bound, cumulative))
+            lines.append('{}_stage_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(prefix, name, stage['count']))
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {!r}'.format(prefix, name, stage['seconds']))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(prefix, name, stage['count']))
+        counters = [
+            ('bytes_in', 'stage_bytes_in_total', 'Bytes passed into pipeline stage.'),
+            ('bytes_out', 'stage_bytes_out_total', 'Bytes produced by pipeline stage.'),
+            ('cache_hits', 'cache_hits_total', 'Cache lookups that found a decoded graphic.'),
+            ('cache_misses', 'cache_misses_total', 'Cache lookups that did not find a decoded graphic.'),
+        ]
+        for key, metric, description in counters:
+            lines.append('# HELP {}_{} {}'.format(prefix, metric, description))
+            lines.append('# TYPE {}_{} counter'.format(prefix, metric))
+            for name, stage in stages:
+                if key.startswith('cache') and not stage['cache_hits'] + stage['cache_misses']:
+                    continue
+                lines.append('{}_{}{{stage="{}"}} {}'.format(prefix, metric, name, stage[key]))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,830 @@
+import bisect
+import mmap
+import re
+import zlib
+from collections import namedtuple
+
+from .metrics import instrumented
+
+"""
+Command found by `tokenize`: (start, end) index, command code with default prefix, prefix used and parameters start index.
+"""
+Command = namedtuple('Command', ['start', 'end', 'command', 'prefix', 'params_start'])
+
+"""
+Format commands followed by field data, which is only ended by the next format prefix.
+"""
+field_data_commands = frozenset(['FD', 'FV', 'FX'])
+
+"""
+Field resolved from label state (see `FieldResolver`):
+    start, end - span of field inside zpl code (first command after previous ^FS up to ^FS)
+    field_type - `text`, `graphic` or `barcode`
+    x, y - absolute field position (label home included, in pixels)
+    typeset - field is positioned by ^FT (lower left corner) instead of ^FO (upper left corner)
+    orientation - `N`, `R`, `I` or `B`
+    font_drive, font_name - font of text fields (font_drive is None for built in fonts)
+    char_height, char_width - character size (in pixels)
+    data - field data (hexadecimal escapes of ^FH decoded)
+    cmd - command drawing the field (^GF, ^XG or barcode command), None for text fields
+"""
+Field = namedtuple('Field', ['start', 'end', 'field_type', 'x', 'y', 'typeset', 'orientation', 'font_drive',
+                             'font_name', 'char_height', 'char_width', 'data', 'cmd'])
+
+"""
+Commands that download or print graphics.
+"""
+graphic_commands = frozenset(['~DG', '^GF'])
+
+
+@instrumented(data_name='zpl', result_size=None)
+def find_commands(zpl, cmd_start, cmd_end='^'):
+    """
+        Finds (start, end) indexes of all defined commands inside zpl code.
+
+        :param zpl: zpl code (string)
+        :return: (start, end) indexes of all defined commands inside zpl code
+        """
+    cmd_start = '\{}'.format(cmd_start) if cmd_start.startswith('^') else cmd_start
+    cmd_end = '\{}'.format(cmd_end) if cmd_end.startswith('^') else cmd_end
+    starts = [match.start() for match in re.finditer(cmd_start, zpl)]
+    possible_ends = [match.start() for match in re.finditer(cmd_end, zpl)]
+    cmds_indexes = []
+    for start in starts:
+        end_i = bisect.bisect_right(possible_ends, start)
+        if end_i < len(possible_ends):
+            cmds_indexes.append((start, possible_ends[end_i]))
+    return cmds_indexes
+
+
+def tokenize(zpl, start=0, format_prefix='^', control_prefix='~'):
+    """
+    Splits zpl code into commands in a single pass.
+    Respects prefix changes (`^CC`/`~CC` for format prefix, `^CT`/`~CT` for control prefix),
+    field data (`^FD`, `^FV` and `^FX` data is only ended by the format prefix) and
+    binary graphics (`^GFB` and `^GFC` data is exactly binary byte count bytes long).
+
+    Every command is a `Command` whose first two items are its (start, end) index, so it can be used with
+    `extract_command` and `extract_commands`. `command` is always normalized to the default prefixes (e.g. `^GF`),
+    `prefix` is the prefix character actually used and parameters are in zpl[params_start:end].
+
+    :param zpl: zpl code (string, bytes, bytearray or mmap)
+    :param start: index to start tokenizing from
+    :param format_prefix: format prefix in effect at `start` (optional, default is `^`)
+    :param control_prefix: control prefix in effect at `start` (optional, default is `~`)
+    :return: generator of commands inside zpl code
+    """
+    is_text = isinstance(zpl, str)
+    prefix_pattern = compile_prefix_pattern(format_prefix, control_prefix, is_text)
+    format_prefix_find = format_prefix if is_text else format_prefix.encode('latin-1')
+    zpl_len = len(zpl)
+
+    match = prefix_pattern.search(zpl, start)
+    while match:
+        cmd_start = match.start()
+        prefix = zpl[cmd_start:cmd_start + 1]
+        code = zpl[cmd_start + 1:cmd_start + 3].upper()
+        if not is_text:
+            prefix = prefix.decode('latin-1')
+            code = code.decode('latin-1')
+        params_start = min(cmd_start + 3, zpl_len)
+        is_format = prefix == format_prefix
+        command = ('^' if is_format else '~') + code
+
+        # process prefix changes before looking for the end of command, new prefix is the only parameter
+        search_start = params_start
+        if code == 'CC' or code == 'CT':
+            new_prefix = zpl[params_start:params_start + 1]
+            new_prefix = new_prefix if is_text else new_prefix.decode('latin-1')
+            if new_prefix and not new_prefix.isspace():
+                if code == 'CC':
+                    format_prefix = new_prefix
+                    format_prefix_find = format_prefix if is_text else format_prefix.encode('latin-1')
+                else:
+                    control_prefix = new_prefix
+                prefix_pattern = compile_prefix_pattern(format_prefix, control_prefix, is_text)
+                search_start += 1
+
+        # binary ^GF data can contain both prefixes, its length is given by binary byte count
+        binary_end = None
+        if is_format and code == 'GF':
+            binary_end = find_gf_binary_end(zpl, params_start, prefix_pattern)
+        if binary_end is not None:
+            end = binary_end
+            match = prefix_pattern.search(zpl, end)
+        # field data can contain the control prefix, only the format prefix ends it
+        elif is_format and code in field_data_commands:
+            end = zpl.find(format_prefix_find, search_start)
+            end = end if end != -1 else zpl_len
+            match = prefix_pattern.search(zpl, end)
+        else:
+            match = prefix_pattern.search(zpl, search_start)
+            end = match.start() if match else zpl_len
+
+        yield Command(cmd_start, end, command, prefix, params_start)
+
+
+def find_gf_binary_end(zpl, params_start, prefix_pattern):
+    """
+    Finds end of a binary (`B`) or compressed binary (`C`) ^GF command from its binary byte count.
+    A header that is cut off by the end of zpl code makes the command end there (it is incomplete).
+
+    :param zpl: zpl code (string, bytes, bytearray or mmap)
+    :param params_start: index of ^GF parameters
+    :param prefix_pattern: compiled regex matching either of the prefixes in effect
+    :return: end index of command or None if command is not binary (or its header is malformed)
+    """
+    compression_type = zpl[params_start:params_start + 1]
+    if compression_type not in ('B', 'C', 'b', 'c', b'B', b'C', b'b', b'c'):
+        return None
+    is_text = isinstance(zpl, str)
+    comma = ',' if is_text else b','
+    next_prefix = prefix_pattern.search(zpl, params_start)
+    header_limit = next_prefix.start() if next_prefix else len(zpl)
+    commas = []
+    position = params_start
+    while len(commas) < 4:
+        position = zpl.find(comma, position, header_limit)
+        if position == -1:
+            return len(zpl) if next_prefix is None else None
+        commas.append(position)
+        position += 1
+    binary_byte_count = zpl[commas[0] + 1:commas[1]]
+    binary_byte_count = (binary_byte_count if is_text else bytes(binary_byte_count).decode('latin-1')).strip()
+    if not binary_byte_count.isdigit():
+        return None
+    return min(commas[3] + 1 + int(binary_byte_count), len(zpl))
+
+
+def compile_prefix_pattern(format_prefix, control_prefix, is_text=True):
+    """
+    Compiles regex matching either of the prefixes.
+
+    :param format_prefix: format prefix
+    :param control_prefix: control prefix
+    :param is_text: compile pattern for strings (otherwise for bytes)
+    :return: compiled regex
+    """
+    pattern = '[{}{}]'.format(re.escape(format_prefix), re.escape(control_prefix))
+    return re.compile(pattern if is_text else pattern.encode('latin-1'))
+
+
+def apply_prefix_change(zpl, command, format_prefix, control_prefix):
+    """
+    Applies a `^CC`/`~CC`/`^CT`/`~CT` command (any other command is ignored) to prefixes in effect.
+
+    :param zpl: zpl code the command was found in (string, bytes, bytearray or mmap)
+    :param command: command (see `tokenize`)
+    :param format_prefix: format prefix in effect before the command
+    :param control_prefix: control prefix in effect before the command
+    :return: format prefix, control prefix in effect after the command
+    """
+    code = command.command[1:]
+    if code == 'CC' or code == 'CT':
+        new_prefix = zpl[command.params_start:command.params_start + 1]
+        new_prefix = new_prefix if isinstance(new_prefix, str) else new_prefix.decode('latin-1')
+        if new_prefix and not new_prefix.isspace():
+            if code == 'CC':
+                format_prefix = new_prefix
+            else:
+                control_prefix = new_prefix
+    return format_prefix, control_prefix
+
+
+@instrumented(data_name='zpl', result_size=None)
+def index_commands(zpl, start=0):
+    """
+    Tokenizes zpl code once and indexes all commands by command code (e.g. `^GF`, `~DG`, `^A@`).
+
+    :param zpl: zpl code (string)
+    :param start: index to start tokenizing from
+    :return: dict of command code to list of commands (see `tokenize`) in order of appearance
+    """
+    commands_index = {}
+    for command in tokenize(zpl, start):
+        commands_index.setdefault(command.command, []).append(command)
+    return commands_index
+
+
+def stream_tokenize(stream, offset=0, chunk_size=1048576, format_prefix='^', control_prefix='~'):
+    """
+    Tokenizes zpl code from a binary file object, mmap or bytes-like object incrementally (see `tokenize`).
+
+    A file object is read in chunks and only the chunk and the command that is not complete yet are kept in memory
+    (the read size doubles while a single command does not fit). A mmap or bytes-like object is tokenized in place.
+
+    :param stream: binary file object, mmap, bytes or bytearray
+    :param offset: byte offset to start tokenizing from
+    :param chunk_size: number of bytes to read at once from a file object
+    :param format_prefix: format prefix in effect at `offset` (optional, default is `^`)
+    :param control_prefix: control prefix in effect at `offset` (optional, default is `~`)
+    :return: generator of buffer, byte offset of buffer inside stream, command (see `tokenize`) relative to buffer
+    """
+    if isinstance(stream, (mmap.mmap, bytes, bytearray)):
+        for command in tokenize(stream, offset, format_prefix, control_prefix):
+            yield stream, 0, command
+        return
+
+    if offset:
+        if stream.seekable():
+            stream.seek(offset)
+        else:
+            to_skip = offset
+            while to_skip > 0:
+                skipped = len(stream.read(min(to_skip, chunk_size)))
+                if not skipped:
+                    return
+                to_skip -= skipped
+
+    buffer = b''
+    buffer_offset = offset
+    read_size = chunk_size
+    while True:
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buffer = buffer + chunk if buffer else chunk
+
+        # every command but the last one is complete, the last one is only complete at the end of stream
+        consumed = len(buffer)
+        for command in tokenize(buffer, 0, format_prefix, control_prefix):
+            if command.end == len(buffer) and not eof:
+                consumed = command.start
+                break
+            format_prefix, control_prefix = apply_prefix_change(buffer, command, format_prefix, control_prefix)
+            yield buffer, buffer_offset, command
+
+        if eof:
+            return
+        read_size = chunk_size if consumed else read_size * 2
+        buffer = buffer[consumed:]
+        buffer_offset += consumed
+
+
+def stream_commands(stream, offset=0, chunk_size=1048576, format_prefix='^', control_prefix='~'):
+    """
+    Tokenizes zpl code from a binary file object, mmap or bytes-like object incrementally (see `stream_tokenize`).
+    Commands are returned as memoryview slices of the read data instead of copies.
+    Command indexes are absolute, so tokenizing can be resumed from any command's end with `offset`.
+
+    :param stream: binary file object, mmap, bytes or bytearray
+    :param offset: byte offset to start tokenizing from
+    :param chunk_size: number of bytes to read at once from a file object
+    :param format_prefix: format prefix in effect at `offset` (optional, default is `^`)
+    :param control_prefix: control prefix in effect at `offset` (optional, default is `~`)
+    :return: generator of command (see `tokenize`), memoryview of command bytes
+    """
+    view = None
+    for buffer, buffer_offset, command in stream_tokenize(stream, offset, chunk_size, format_prefix, control_prefix):
+        if view is None or view.obj is not buffer:
+            view = memoryview(buffer)
+        if buffer_offset:
+            command = Command(buffer_offset + command.start, buffer_offset + command.end, command.command,
+                              command.prefix, buffer_offset + command.params_start)
+            yield command, view[command.start - buffer_offset:command.end - buffer_offset]
+        else:
+            yield command, view[command.start:command.end]
+
+
+def stream_labels(stream, offset=0, chunk_size=1048576):
+    """
+    Finds labels (from `^XA` to `^XZ` inclusive) in zpl code from a binary file object, mmap or bytes-like object
+    incrementally (see `stream_tokenize`).
+    Labels are returned as memoryview slices of the read data, only labels spanning more than one read chunk
+    of a file object are copied.
+
+    :param stream: binary file object, mmap, bytes or bytearray
+    :param offset: byte offset to start from
+    :param chunk_size: number of bytes to read at once from a file object
+    :return: generator of label (start, end) byte index, memoryview of label bytes
+    """
+    label_buffer = None
+    label_buffer_offset = 0
+    label_start = 0
+    label_parts = []
+    for buffer, buffer_offset, command in stream_tokenize(stream, offset, chunk_size):
+        if command.command == '^XA':
+            label_buffer = buffer
+            label_buffer_offset = buffer_offset
+            label_start = command.start
+            label_parts = []
+        if label_buffer is None:
+            continue
+
+        # label continues in the next chunk, copy its part from the previous chunk
+        if buffer is not label_buffer:
+            label_parts.append(bytes(label_buffer[label_start:buffer_offset - label_buffer_offset]))
+            label_buffer = buffer
+            label_buffer_offset = buffer_offset
+            label_start = 0
+
+        if command.command == '^XZ':
+            label_view = memoryview(label_buffer)[label_start:command.params_start]
+            if label_parts:
+                label_parts.append(label_view)
+                label_view = memoryview(b''.join(label_parts))
+            label_end = buffer_offset + command.params_start
+            yield (label_end - len(label_view), label_end), label_view
+            label_buffer = None
+            label_parts = []
+
+
+def stream_graphics(stream, offset=0, chunk_size=1048576):
+    """
+    Finds graphic commands (`~DG` and `^GF`) in zpl code from a binary file object, mmap or bytes-like object
+    incrementally (see `stream_commands`).
+
+    :param stream: binary file object, mmap, bytes or bytearray
+    :param offset: byte offset to start from
+    :param chunk_size: number of bytes to read at once from a file object
+    :return: generator of command (see `tokenize`), memoryview of command bytes
+    """
+    for command, view in stream_commands(stream, offset, chunk_size):
+        if command.command in graphic_commands:
+            yield command, view
+
+
+def extract_command(zpl, index):
+    """
+    Extracts command based on (start, end) inside zpl code.
+
+    :param zpl: zpl code (string)
+    :param index: (start, end) index of command
+    :return: extracted command
+    """
+    return zpl[index[0]:index[1]]
+
+
+def extract_commands(zpl, indexes):
+    """
+    Extracts all commands based on (start, end) inside zpl code.
+
+    :param zpl: zpl code (string)
+    :param indexes: (start, end) indexes of commands
+    :return: extracted commands
+    """
+    cmds = []
+    for start_stop_index in indexes:
+        cmds.append(zpl[start_stop_index[0]:start_stop_index[1]])
+    return cmds
+
+
+def write_zpl(dg_cmd, upper_lext_x=0, upper_left_y=0, magnify_x=1, magnify_y=1):
+    """
+    Generates zpl code with ~DG command
+    
+    :param dg_cmd: ~DG command
+    :param upper_lext_x: upper left x-axis location (in dots)
+    :param upper_left_y: upper left y-axis location (in dots)
+    :param magnify_x: magnification factor on the x-axis
+    :param magnify_y: magnification factor on the y-axis
+    :return: zpl code
+    """""
+    device, image_name, extension, bytes_total, bytes_per_row, data = break_dg_command(dg_cmd)
+    xg_cmd = build_xg_command(image_name, extension, device, magnify_x, magnify_y)
+    fo_cmd = '^FO{},{}{}^FS'.format(upper_lext_x, upper_left_y, xg_cmd)
+    return '{}^XA{}^XZ'.format(dg_cmd, fo_cmd)
+
+
+def break_dg_command(dg_cmd):
+    """
+    Extracts ~DG command parameters:
+        dox,t,w,data
+        d - device to store image (optional, default is `R:`)
+        o - image name
+        x - extension (optional, always is `.GRF`)
+        t - total number of bytes in graphic
+        w - number of bytes per row
+        data - ASCII hexadecimal string defining image (possibly compressed)
+
+    :param dg_cmd: ~DG command (string)
+    :return: device, image_name, extension, bytes_total, bytes_per_row, data from ~DG command
+    """
+    dg_cmd_parts = dg_cmd[3:].split(",", 3)
+    dox = dg_cmd_parts[0]
+    dox_parts = dox.split('.')
+    if ':' not in dox_parts[0]:
+        device = 'R:'
+        image_name = dox_parts[0]
+    else:
+        do_parts = dox_parts[0].split(':')
+        device = do_parts[0] + ':'
+        image_name = do_parts[1]
+    extension = '.GRF'
+
+    bytes_total = int(dg_cmd_parts[1])
+    bytes_per_row = int(dg_cmd_parts[2])
+    data = dg_cmd_parts[3]
+
+    return device, image_name, extension, bytes_total, bytes_per_row, data
+
+
+def break_gf_command(gf_cmd):
+    """
+    Extracts ^GF command parameters:
+        a,b,c,d,data
+        a - compression type
+            = A - ASCII hexadecimal
+            = B - binary
+            = C - compressed binary
+        b - binary byte count
+        c - graphic field count
+        d - bytes per row
+        data - ASCII hexadecimal string defining image (possibly compressed) or binary byte count bytes of
+               packed bytes (`B`) or zlib compressed packed bytes (`C`)
+
+    :param gf_cmd: ^GF command (string, or bytes for binary data which is then returned as bytes)
+    :return: compression_type, binary_byte_count, graphic_field_count, bytes_per_row, data from ^GF command
+    """
+    if isinstance(gf_cmd, (bytes, bytearray, memoryview)):
+        gf_cmd_parts = bytes(gf_cmd[3:]).split(b',', 4)
+        gf_cmd_parts[:4] = [part.decode('latin-1') for part in gf_cmd_parts[:4]]
+    else:
+        gf_cmd_parts = gf_cmd[3:].split(",", 4)
+    compression_type = gf_cmd_parts[0]
+    binary_byte_count = int(gf_cmd_parts[1])
+    graphic_field_count = int(gf_cmd_parts[2])
+    bytes_per_row = int(gf_cmd_parts[3])
+    data = gf_cmd_parts[4]
+
+    return compression_type, binary_byte_count, graphic_field_count, bytes_per_row, data
+
+
+def break_fd_command(fd_cmd):
+    """
+    Extracts ^FD command parameters:
+        a - data string
+
+    :param fd_cmd: ^FD command (string)
+    :return: data from ^FD command
+    """
+    data = fd_cmd[3:]
+    return data
+
+
+def break_lh_command(lh_cmd):
+    """
+    Extracts ^LH command parameters:
+        x - x-axis position (in pixels)
+        y - y-axis position (in pixels)
+
+    :param lh_cmd: ^LH command (string)
+    :return: x, y from ^LH command
+    """
+    x_y = lh_cmd[3:].split(',')
+    return int(x_y[0]), int(x_y[1])
+
+
+def break_ft_command(ft_cmd):
+    """
+    Extracts ^FT command parameters:
+        x - x-axis position (in pixels)
+        y - y-axis position (in pixels)
+
+    :param ft_cmd: ^FT command (string)
+    :return: x, y from ^FT command
+    """
+    x_y = ft_cmd[3:].split(',')
+    return int(x_y[0] or 0), int(x_y[1] or 0) if len(x_y) > 1 else 0
+
+
+def break_aat_command(aat_cmd):
+    """
+    Extracts ^A@ command parameters:
+        x - x-axis position (in pixels)
+        y - y-axis position (in pixels)
+
+    :param aat_cmd: ^A@ command (string)
+    :return: field_orientation, char_height, width, font_drive, font_name from ^A@ command
+    """
+    parts = aat_cmd[3:].split(',')
+    field_orientation = parts[0]
+    char_height = int(parts[1])
+    width = int(parts[2])
+    font = parts[3]
+    font_drive = 'R:'
+    if ':' in font:
+        font_drive = '{}:'.format(font.split(':')[0])
+        font_name = font.split(':')[1]
+    else:
+        font_name = font
+    return field_orientation, char_height, width, font_drive, font_name
+
+
+def break_fo_command(fo_cmd):
+    """
+    Extracts ^FO command parameters:
+        x - x-axis position (in pixels)
+        y - y-axis position (in pixels)
+
+    :param fo_cmd: ^FO command (string)
+    :return: x, y from ^FO command
+    """
+    x_y = fo_cmd[3:].split(',')
+    return int(x_y[0] or 0), int(x_y[1] or 0) if len(x_y) > 1 else 0
+
+
+def break_xg_command(xg_cmd):
+    """
+    Extracts ^XG command parameters:
+        d:o.x,mx,my
+        d - device the image is stored on (optional, default is `R:`)
+        o - image name
+        x - extension (optional, always is `.GRF`)
+        mx - magnification factor on the x-axis (optional, default is 1)
+        my - magnification factor on the y-axis (optional, default is 1)
+
+    :param xg_cmd: ^XG command (string)
+    :return: device, image_name, extension, magnify_x, magnify_y from ^XG command
+    """
+    parts = xg_cmd[3:].strip().split(',')
+    dox_parts = parts[0].split('.')
+    if ':' in dox_parts[0]:
+        device, image_name = dox_parts[0].split(':', 1)
+        device = device + ':'
+    else:
+        device = 'R:'
+        image_name = dox_parts[0]
+    extension = '.GRF'
+    magnify_x = int(parts[1]) if len(parts) > 1 and parts[1].strip() else 1
+    magnify_y = int(parts[2]) if len(parts) > 2 and parts[2].strip() else 1
+    return device, image_name, extension, magnify_x, magnify_y
+
+
+def break_a_command(a_cmd):
+    """
+    Extracts ^A command parameters (built in fonts, ^A@ is handled by `break_aat_command`):
+        fo,h,w
+        f - font name (single character)
+        o - field orientation (optional, empty uses ^FW default)
+        h - character height (in pixels) (optional)
+        w - character width (in pixels) (optional)
+
+    :param a_cmd: ^A command (string)
+    :return: font_name, field_orientation, char_height, char_width (None for omitted parameters)
+    """
+    font_name = a_cmd[2:3]
+    parts = a_cmd[3:].strip().split(',')
+    field_orientation = parts[0].strip()[:1] or None
+    char_height = int(parts[1]) if len(parts) > 1 and parts[1].strip() else None
+    char_width = int(parts[2]) if len(parts) > 2 and parts[2].strip() else None
+    return font_name, field_orientation, char_height, char_width
+
+
+def break_cf_command(cf_cmd):
+    """
+    Extracts ^CF command parameters:
+        f,h,w
+        f - default font name (optional)
+        h - default character height (in pixels) (optional)
+        w - default character width (in pixels) (optional)
+
+    :param cf_cmd: ^CF command (string)
+    :return: font_name, char_height, char_width (None for omitted parameters)
+    """
+    parts = cf_cmd[3:].strip().split(',')
+    font_name = parts[0].strip() or None
+    char_height = int(parts[1]) if len(parts) > 1 and parts[1].strip() else None
+    char_width = int(parts[2]) if len(parts) > 2 and parts[2].strip() else None
+    return font_name, char_height, char_width
+
+
+def build_dg_command(bytes_total, bytes_per_row, data, image_name, extension='.GRF', device='R:'):
+    """
+    Generates ~DG command from parameters:
+        dox,t,w,data
+        d - device to store image (optional, default is `R:`)
+        o - image name
+        x - extension (optional, always is `.GRF`)
+        t - total number of bytes in graphic
+        w - number of bytes per row
+        data - ASCII hexadecimal string defining image (possibly compressed)
+
+    :param bytes_total: total number of bytes in graphic
+    :param bytes_per_row: number of bytes per row
+    :param data: ASCII hexadecimal string defining image
+    :param image_name: image name
+    :param extension: extension (optional, always is `.GRF`)
+    :param device: device to store image (optional, default is `R:`)
+    :return: ~DG command (string)
+    """
+    return '~DG{}{}{},{},{},{}'.format(device, image_name, extension, bytes_total, bytes_per_row, data)
+
+
+def build_xg_command(image_name, extension='.GRF', device='R:', magnify_x=1, magnify_y=1):
+    """
+    Generates ^XG command (recalls a graphic stored by ~DG) from parameters:
+        d:o.x,mx,my
+
+    :param image_name: image name
+    :param extension: extension (optional, always is `.GRF`)
+    :param device: device the image is stored on (optional, default is `R:`)
+    :param magnify_x: magnification factor on the x-axis
+    :param magnify_y: magnification factor on the y-axis
+    :return: ^XG command (string)
+    """
+    return '^XG{}{}{},{},{}'.format(device, image_name, extension, magnify_x, magnify_y)
+
+
+def build_gf_command(bytes_total, bytes_per_row, data, compression_type='A'):
+    """
+    Generates ^GF command from parameters:
+        a,b,c,d,data
+        a - compression type (`A` - ASCII hexadecimal, possibly ACS, Z64 or B64 encoded)
+        b - binary byte count (same as graphic field count for ASCII hexadecimal)
+        c - graphic field count (total number of bytes in graphic)
+        d - bytes per row
+        data - ASCII hexadecimal string defining image (possibly compressed)
+
+    :param bytes_total: total number of bytes in graphic
+    :param bytes_per_row: number of bytes per row
+    :param data: ASCII hexadecimal string defining image
+    :param compression_type: compression type (optional, default is `A`)
+    :return: ^GF command (string)
+    """
+    return '^GF{},{},{},{},{}'.format(compression_type, bytes_total, bytes_total, bytes_per_row, data)
+
+
+def build_gf_binary_command(data, bytes_per_row, compression_type='B', level=9):
+    """
+    Generates binary ^GF command from packed bytes:
+        `B` - packed bytes as they are (half the size of uncompressed ASCII hexadecimal)
+        `C` - zlib compressed packed bytes (as Z64 without base64 encoding and CRC)
+
+    :param data: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :param compression_type: `B` or `C`
+    :param level: zlib compression level for `C`
+    :return: ^GF command (bytes)
+    """
+    data = bytes(data)
+    if compression_type == 'B':
+        payload = data
+    elif compression_type == 'C':
+        payload = zlib.compress(data, level)
+    else:
+        raise ValueError('Unknown binary compression type {!r}'.format(compression_type))
+    header = '^GF{},{},{},{},'.format(compression_type, len(payload), len(data), bytes_per_row)
+    return header.encode('ascii') + payload
+
+
+"""
+Commands starting a field without ^FO/^FT position (see `FieldResolver`), besides ^A font and ^B barcode commands.
+"""
+field_start_commands = ('^FD', '^FV', '^FH', '^GF', '^XG')
+
+
+class FieldResolver:
+    """
+    Single pass state machine resolving fields of labels from their commands:
+        ^LH sets label home, ^FW default orientation, ^CF default font (kept until changed).
+        ^FO/^FT set field position, ^A/^A@ field font, ^FH hexadecimal indicator of field data.
+        ^FD/^FV set field data, ^GF/^XG make a graphic field and ^B (except ^BY) a barcode field.
+        ^FS ends field and emits it as `Field`, field state is reset (so do ^XZ and a ^FO/^FT after field content,
+        as printers accept fields without ^FS).
+    ^XA resets field state, defaults set by ^LH, ^FW and ^CF are kept across labels as on a printer.
+    """
+
+    def __init__(self):
+        self.home_x, self.home_y = 0, 0
+        self.default_orientation = 'N'
+        self.default_font = (None, 'A', 9, 5)
+        self.reset_field()
+
+    def reset_field(self):
+        """
+        Resets state of current field.
+        """
+        self.field_start = None
+        self.field_x, self.field_y, self.typeset = 0, 0, False
+        self.orientation = None
+        self.font = None
+        self.hex_indicator = None
+        self.data = None
+        self.field_type = 'text'
+        self.field_cmd = None
+
+    def feed(self, zpl, cmd):
+        """
+        Updates state with a command.
+
+        :param zpl: zpl code the command was found in (string, bytes, bytearray or mmap)
+        :param cmd: command (see `tokenize`)
+        :return: resolved field (see `Field`) if the command ended one, None otherwise
+        """
+        code = cmd.command
+        if code == '^XA':
+            self.reset_field()
+            return None
+        # fields without a position start at their first field command,
+        # label level commands (e.g. ^PW, ^LS, ^BY) in between fields never start one
+        if self.field_start is None and (code in field_start_commands or code.startswith('^A') or
+                                         (code.startswith('^B') and code != '^BY')):
+            self.field_start = cmd.start
+        params = zpl[cmd.params_start:cmd.end]
+        params = params if isinstance(params, str) else bytes(params).decode('latin-1')
+
+        if code == '^FS' or code == '^XZ':
+            field = self.resolve(cmd.end if code == '^FS' else cmd.start)
+            self.reset_field()
+            return field
+        if code == '^FD' or code == '^FV':
+            self.data = params.rstrip('\r\n')
+        elif code == '^FO' or code == '^FT':
+            # a new position after field content ends a field missing its ^FS
+            field = self.resolve(cmd.start)
+            if field is not None:
+                self.reset_field()
+            # the position command in effect starts the field (not a font or an earlier position without content)
+            self.field_start = cmd.start
+            self.field_x, self.field_y = break_fo_command(code + params.strip())
+            self.typeset = code == '^FT'
+            return field
+        elif code == '^LH':
+            self.home_x, self.home_y = break_fo_command(code + params.strip())
+        elif code == '^A@':
+            parts = params.strip().split(',')
+            self.orientation = parts[0][:1] or None
+            font = parts[3].strip() if len(parts) > 3 else ''
+            font_drive, font_name = 'R:', font
+            if ':' in font:
+                font_drive, font_name = font.split(':', 1)
+                font_drive += ':'
+            char_height = int(parts[1]) if len(parts) > 1 and parts[1].strip() else None
+            char_width = int(parts[2]) if len(parts) > 2 and parts[2].strip() else None
+            self.font = (font_drive, font_name, char_height, char_width)
+        elif code.startswith('^A'):
+            font_name, self.orientation, char_height, char_width = break_a_command(code + params)
+            self.font = (None, font_name, char_height, char_width)
+        elif code == '^CF':
+            font_name, char_height, char_width = break_cf_command(code + params)
+            default_drive, default_name, default_height, default_width = self.default_font
+            if char_height is not None and char_width is None:
+                char_width = default_width * char_height // default_height if default_height else char_height
+            elif char_width is not None and char_height is None:
+                char_height = default_height
+            self.default_font = (default_drive if font_name is None else None, font_name or default_name,
+                                 char_height or default_height, char_width or default_width)
+        elif code == '^FW':
+            self.default_orientation = params.strip()[:1] or self.default_orientation
+        elif code == '^FH':
+            self.hex_indicator = params.strip()[:1] or '_'
+        elif code == '^GF' or code == '^XG':
+            self.field_type, self.field_cmd = 'graphic', cmd
+        elif code.startswith('^B') and code != '^BY':
+            self.field_type, self.field_cmd = 'barcode', cmd
+        return None
+
+    def resolve(self, end):
+        """
+        Resolves current field.
+
+        :param end: end index of field (end of ^FS)
+        :return: resolved field (see `Field`) or None if there is no field
+        """
+        if self.data is None and self.field_cmd is None:
+            return None
+        default_drive, default_name, default_height, default_width = self.default_font
+        if self.font is None:
+            font_drive, font_name, char_height, char_width = self.default_font
+        else:
+            font_drive, font_name, char_height, char_width = self.font
+            if char_height is None and char_width is None:
+                char_height, char_width = default_height, default_width
+            elif char_height is None:
+                char_height = char_width
+            elif char_width is None:
+                char_width = char_height
+        data = self.data
+        if data is not None and self.hex_indicator is not None:
+            data = re.sub(re.escape(self.hex_indicator) + '([0-9A-Fa-f]{2})',
+                          lambda match: chr(int(match.group(1), 16)), data)
+        return Field(self.field_start, end, self.field_type, self.home_x + self.field_x, self.home_y + self.field_y,
+                     self.typeset, self.orientation or self.default_orientation, font_drive, font_name, char_height,
+                     char_width, data, self.field_cmd)
+
+
+def resolve_fields(zpl, cmds=None):
+    """
+    Resolves all fields inside zpl code in a single pass (see `FieldResolver`).
+
+    :param zpl: zpl code (string, bytes, bytearray or mmap)
+    :param cmds: commands of zpl code (optional, default is `tokenize(zpl)`)
+    :return: generator of resolved fields (see `Field`)
+    """
+    resolver = FieldResolver()
+    for cmd in tokenize(zpl) if cmds is None else cmds:
+        field = resolver.feed(zpl, cmd)
+        if field is not None:
+            yield field
+
+
+def graphic_key(device, image_name, extension='.GRF'):
+    """
+    Generates key of a stored graphic, as used by `render_label` for ~DG downloads and ^XG recalls.
+
+    :param device: device the image is stored on (e.g. `R:`)
+    :param image_name: image name
+    :param extension: extension
+    :return: key (e.g. `R:LOGO.GRF`)
+    """
+    return '{}{}{}'.format(device, image_name, extension).upper()
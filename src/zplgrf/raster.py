@@ -0,0 +1,703 @@
+import itertools
+import os
+import re
+import struct
+import zlib
+from collections import namedtuple
+
+from .codec import bits_to_bytes, bytes_to_bits, iter_rows, size_byte_to_bit
+from .metrics import instrumented
+
+"""
+Methods of converting images to black and white (see `image_to_monochrome`).
+"""
+monochrome_methods = ('threshold', 'otsu', 'floyd-steinberg', 'ordered')
+
+"""
+8x8 Bayer matrix used for ordered dithering.
+"""
+bayer_matrix = [
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+]
+
+"""
+Byte translation table inverting all bits.
+"""
+invert_table = bytes(255 - value for value in range(256))
+
+"""
+Byte translation table reversing the order of bits (used when rotating by 180 degrees).
+"""
+reverse_table = bytes(int('{:08b}'.format(value)[::-1], 2) for value in range(256))
+
+"""
+Byte translation tables mapping bytes to `0` or `1` characters of a single bit (most significant bit first),
+used to read columns of packed bytes when rotating by 90 or 270 degrees.
+"""
+bit_tables = [bytes(0x30 | ((value >> (7 - bit_i)) & 1) for value in range(256)) for bit_i in range(8)]
+
+"""
+Rotations (clockwise, in degrees) of field orientations (`^FW`, `^A`).
+"""
+orientation_degrees = {'N': 0, 'R': 90, 'I': 180, 'B': 270}
+
+"""
+PIL colors.
+"""
+color_black = (0, 0, 0, 255)
+color_white = (255, 255, 255, 255)
+
+"""
+Difference of two packed bitmaps (see `diff_bitmaps`):
+    identical - both bitmaps have the same pixels (a smaller bitmap is padded with white)
+    changed_pixels - number of differing pixels
+    width, height - size of compared area (in pixels, the larger size of both bitmaps)
+    boxes - bounding boxes of changed regions as (left, top, right, bottom) tuples, right and bottom exclusive
+"""
+BitmapDiff = namedtuple('BitmapDiff', ['identical', 'changed_pixels', 'width', 'height', 'boxes'])
+
+
+@instrumented(data_index=2, result_size=None)
+def bytes_to_image(bytes_total, bytes_per_row, data, mode='1'):
+    """
+    Generates a PIL image directly from packed bytes (1 bit per pixel, 1 = black).
+
+    :param bytes_total: total number of bytes
+    :param bytes_per_row: number of bytes per row
+    :param data: packed bytes to generate image from
+    :param mode: PIL mode of returned image (`1`, `L`, `RGB` or `RGBA`)
+    :return: PIL image
+    """
+    from PIL import Image
+    height = bytes_total // bytes_per_row
+    data = bytes(data[:height * bytes_per_row]).ljust(height * bytes_per_row, b'\x00')
+    image = Image.frombytes('1', (size_byte_to_bit(bytes_per_row), height), data, 'raw', '1;I')
+    if mode != '1':
+        image = image.convert(mode)
+    return image
+
+
+def image_to_grayscale(image):
+    """
+    Converts PIL image of any mode to grayscale (mode `L`), transparent pixels are composited over white.
+
+    :param image: PIL image
+    :return: PIL image (mode `L`)
+    """
+    from PIL import ImageChops
+    if image.mode == 'P' and 'transparency' in image.info:
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La'):
+        gray, alpha = image.convert('LA').split()
+        # white + (gray - white) * alpha, i.e. darkness scaled by opacity
+        return ImageChops.invert(ImageChops.multiply(ImageChops.invert(gray), alpha))
+    return image.convert('L')
+
+
+def otsu_threshold(histogram):
+    """
+    Finds threshold maximizing between class variance of a grayscale histogram (Otsu's method).
+
+    :param histogram: list of 256 pixel counts (see `PIL.Image.histogram`)
+    :return: threshold (pixels >= threshold are white)
+    """
+    total = sum(histogram)
+    value_sum = sum(value * count for value, count in enumerate(histogram))
+    best_threshold, best_variance = 128, -1.0
+    background_count, background_sum = 0, 0
+    for value in range(255):
+        background_count += histogram[value]
+        background_sum += value * histogram[value]
+        foreground_count = total - background_count
+        if not background_count or not foreground_count:
+            continue
+        mean_difference = background_sum / background_count - (value_sum - background_sum) / foreground_count
+        variance = background_count * foreground_count * mean_difference * mean_difference
+        if variance > best_variance:
+            best_threshold, best_variance = value + 1, variance
+    return best_threshold
+
+
+def ordered_threshold_map(width, height):
+    """
+    Generates a grayscale image tiled with Bayer matrix thresholds (minus one) for ordered dithering.
+
+    :param width: width in pixels
+    :param height: height in pixels
+    :return: PIL image (mode `L`)
+    """
+    from PIL import Image
+    size = len(bayer_matrix)
+    rows = []
+    for matrix_row in bayer_matrix:
+        row = bytes(int((value + 0.5) * 256 / (size * size)) - 1 for value in matrix_row)
+        rows.append((row * (width // size + 1))[:width])
+    data = b''.join(rows) * (height // size + 1)
+    return Image.frombytes('L', (width, height), data[:width * height])
+
+
+def image_to_monochrome(image, method='threshold', threshold=128):
+    """
+    Converts PIL image of any mode (including transparency) to black and white using Pillow's C paths:
+        threshold - pixels darker than `threshold` become black
+        otsu - threshold is picked from image histogram (Otsu's method)
+        floyd-steinberg - Floyd-Steinberg error diffusion dithering
+        ordered - ordered (8x8 Bayer matrix) dithering, keeps large flat areas free of noise
+
+    :param image: PIL image
+    :param method: conversion method (see `monochrome_methods`)
+    :param threshold: threshold for `threshold` method (0-256)
+    :return: PIL image (mode `1`)
+    """
+    from PIL import Image, ImageChops
+    if method not in monochrome_methods:
+        raise ValueError('Unknown monochrome method: {}'.format(method))
+    if image.mode == '1':
+        return image
+    gray = image_to_grayscale(image)
+    if method == 'floyd-steinberg':
+        return gray.convert('1', dither=Image.FLOYDSTEINBERG)
+    if method == 'ordered':
+        gray = ImageChops.subtract(gray, ordered_threshold_map(*gray.size))
+        threshold = 1
+    elif method == 'otsu':
+        threshold = otsu_threshold(gray.histogram())
+    table = [0] * threshold + [255] * (256 - threshold)
+    return gray.point(table[:256], '1')
+
+
+@instrumented(data_name='image', result_size=lambda result: len(result[2]))
+def image_to_bytes(image, method='threshold', threshold=128):
+    """
+    Generates packed bytes (1 bit per pixel, 1 = black) from PIL image of any mode.
+    Rows are padded with white to a whole number of bytes.
+
+    :param image: PIL image
+    :param method: conversion method of images that are not black and white (see `image_to_monochrome`)
+    :param threshold: threshold for `threshold` method (0-256)
+    :return: total number of bytes, number of bytes per row, packed bytes generated from image
+    """
+    image = image_to_monochrome(image, method, threshold)
+    bytes_per_row = -(-image.size[0] // 8)
+    data = image.tobytes('raw', '1;I')
+    return len(data), bytes_per_row, data
+
+
+def write_png_rows(rows, bytes_per_row, height, out_file, level=6):
+    """
+    Writes rows of packed bytes straight to a 1-bit grayscale PNG file, one row at a time
+    (PIL is not used, so the whole image is never held in memory).
+    Missing rows are written white, extra rows are not consumed.
+
+    :param rows: iterable of rows (packed bytes, 1 = black)
+    :param bytes_per_row: number of bytes per row
+    :param height: number of rows in image
+    :param out_file: binary file object or file path
+    :param level: zlib compression level
+    :return: number of rows written from `rows`
+    """
+    if isinstance(out_file, (str, bytes, os.PathLike)):
+        with open(out_file, 'wb') as path_file:
+            return write_png_rows(rows, bytes_per_row, height, path_file, level)
+
+    def write_chunk(chunk_type, chunk_data):
+        out_file.write(struct.pack('>I', len(chunk_data)))
+        out_file.write(chunk_type)
+        out_file.write(chunk_data)
+        out_file.write(struct.pack('>I', zlib.crc32(chunk_data, zlib.crc32(chunk_type))))
+
+    out_file.write(b'\x89PNG\r\n\x1a\n')
+    write_chunk(b'IHDR', struct.pack('>IIBBBBB', size_byte_to_bit(bytes_per_row), height, 1, 0, 0, 0, 0))
+
+    # every scanline starts with filter type 0, PNG uses 0 for black so rows are inverted
+    compressor = zlib.compressobj(level)
+    pending = []
+    pending_size = 0
+    rows_written = 0
+    white_scanline = b'\x00' + b'\xff' * bytes_per_row
+    # rows after `height` are not even taken from `rows`, so a streaming decoder stops there
+    for row in itertools.islice(rows, height):
+        pending.append(compressor.compress(b'\x00' + bytes(row[:bytes_per_row]).translate(invert_table)))
+        pending_size += len(pending[-1])
+        rows_written += 1
+        if pending_size >= 65536:
+            write_chunk(b'IDAT', b''.join(pending))
+            pending = []
+            pending_size = 0
+    for _ in range(height - rows_written):
+        pending.append(compressor.compress(white_scanline))
+    pending.append(compressor.flush())
+    write_chunk(b'IDAT', b''.join(pending))
+    write_chunk(b'IEND', b'')
+    return rows_written
+
+
+def iter_row_tiles(rows, bytes_per_row, tile_height, mode='1'):
+    """
+    Groups rows of packed bytes into PIL images of at most `tile_height` rows each.
+
+    :param rows: iterable of rows (packed bytes, 1 = black)
+    :param bytes_per_row: number of bytes per row
+    :param tile_height: number of rows per tile
+    :param mode: PIL mode of returned images (see `bytes_to_image`)
+    :return: generator of row index of tile top, PIL image
+    """
+    tile_rows = []
+    top = 0
+    for row in rows:
+        tile_rows.append(row)
+        if len(tile_rows) == tile_height:
+            yield top, bytes_to_image(tile_height * bytes_per_row, bytes_per_row, b''.join(tile_rows), mode)
+            top += tile_height
+            tile_rows = []
+    if tile_rows:
+        yield top, bytes_to_image(len(tile_rows) * bytes_per_row, bytes_per_row, b''.join(tile_rows), mode)
+
+
+def save_png(data, bytes_total, bytes_per_row, out_file, first_row=0, last_row=None, level=6):
+    """
+    Decodes ~DG or ^GF command data row by row straight into a PNG file (see `iter_rows` and `write_png_rows`),
+    optionally cropped to a range of rows.
+
+    :param data: ~DG or ^GF command data
+    :param bytes_total: total number of bytes in graphic
+    :param bytes_per_row: number of bytes per row
+    :param out_file: binary file object or file path
+    :param first_row: index of first row to save
+    :param last_row: index after last row to save (optional, default is all rows)
+    :param level: zlib compression level
+    :return: number of rows saved
+    """
+    rows_total = bytes_total // bytes_per_row
+    last_row = rows_total if last_row is None else min(last_row, rows_total)
+    height = max(last_row - first_row, 0)
+    rows = iter_rows(data, bytes_total, bytes_per_row, first_row, last_row)
+    return write_png_rows(rows, bytes_per_row, height, out_file, level)
+
+
+@instrumented(data_index=2, data_name='bits', result_size=None)
+def bits_to_image(bits_total, bits_per_row, bits):
+    """
+    Generates a PIL image from bits.
+
+    :param bits_total: total number of bits
+    :param bits_per_row: number of bits per row
+    :param bits: bits to generate image from
+    :return: PIL image
+    """
+    height = int((bits_total / bits_per_row))
+    bytes_per_row, data = bits_to_bytes(bits_per_row, bits[:height * bits_per_row])
+
+    image = bytes_to_image(height * bytes_per_row, bytes_per_row, data, mode='RGBA')
+    if image.size[0] != bits_per_row:
+        image = image.crop((0, 0, bits_per_row, height))
+
+    return image
+
+
+@instrumented(data_name='image')
+def image_to_bits(image):
+    """
+    Generates a string of bits from PIL image.
+
+    :param image: PIL image
+    :return: total number of bits, number of bits per row, bits generated from image
+    """
+    bits_per_row = image.size[0]
+    height = image.size[1]
+    bits_total = height * bits_per_row
+    bytes_total, bytes_per_row, data = image_to_bytes(image)
+    return bits_total, bits_per_row, bytes_to_bits(bits_per_row, data)
+
+
+def magnify_bitmap(bitmap, bytes_per_row, magnify_x=1, magnify_y=1):
+    """
+    Magnifies packed bytes by integer factors (every pixel becomes magnify_x by magnify_y pixels).
+
+    :param bitmap: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :param magnify_x: magnification factor on the x-axis
+    :param magnify_y: magnification factor on the y-axis
+    :return: magnified packed bytes, number of bytes per row of magnified packed bytes
+    """
+    if magnify_x == 1 and magnify_y == 1:
+        return bitmap, bytes_per_row
+
+    rows = [bitmap[i:i + bytes_per_row] for i in range(0, len(bitmap) - bytes_per_row + 1, bytes_per_row)]
+    if magnify_x != 1:
+        # every byte expands to magnify_x bytes, looked up in a table of all 256 byte values
+        byte_bits = 8 * magnify_x
+        expansion = []
+        for value in range(256):
+            expanded = 0
+            for bit_i in range(8):
+                if value & (0x80 >> bit_i):
+                    expanded |= ((1 << magnify_x) - 1) << (byte_bits - (bit_i + 1) * magnify_x)
+            expansion.append(expanded.to_bytes(magnify_x, 'big'))
+        rows = [b''.join(map(expansion.__getitem__, row)) for row in rows]
+        bytes_per_row *= magnify_x
+    if magnify_y != 1:
+        rows = [row for row in rows for _ in range(magnify_y)]
+    return b''.join(rows), bytes_per_row
+
+
+def rotate_bitmap(bitmap, bytes_per_row, rotation, width=None):
+    """
+    Rotates packed bytes clockwise by 90, 180 or 270 degrees (field orientations `R`, `I` and `B`).
+    Columns are read with byte slices and translation tables, so pixels never leave C level loops.
+
+    :param bitmap: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :param rotation: 0, 90, 180 or 270 degrees, or field orientation (`N`, `R`, `I` or `B`)
+    :param width: width in pixels (optional, default is all bits of a row), padding columns beyond it are dropped
+    :return: rotated packed bytes, number of bytes per row of rotated packed bytes
+    """
+    rotation = orientation_degrees.get(rotation, rotation)
+    if rotation not in (0, 90, 180, 270):
+        raise ValueError('Unsupported rotation {!r}'.format(rotation))
+    width = size_byte_to_bit(bytes_per_row) if width is None else width
+    height = len(bitmap) // bytes_per_row if bytes_per_row else 0
+    bitmap = bytes(bitmap[:height * bytes_per_row])
+    if rotation == 0 or not height or not width:
+        return bitmap, bytes_per_row
+    if rotation == 180:
+        # reversing all bytes reverses the order of rows and of bytes in a row, bits are reversed by a table
+        bitmap = bitmap[::-1].translate(reverse_table)
+        padding = size_byte_to_bit(bytes_per_row) - width
+        if padding:
+            bitmap, bytes_per_row = crop_bitmap(bitmap, bytes_per_row, padding, 0, width, height)
+        return bitmap, bytes_per_row
+
+    # every column becomes a row: bottom to top for 90 degrees, right to left columns for 270 degrees
+    new_bytes_per_row = -(-height // 8)
+    padding = b'0' * (size_byte_to_bit(new_bytes_per_row) - height)
+    columns = range(width) if rotation == 90 else range(width - 1, -1, -1)
+    step = -1 if rotation == 90 else 1
+    byte_columns = [bitmap[byte_i::bytes_per_row] for byte_i in range(bytes_per_row)]
+    rows = [byte_columns[x // 8].translate(bit_tables[x % 8])[::step] + padding for x in columns]
+    return int(b''.join(rows), 2).to_bytes(new_bytes_per_row * width, 'big'), new_bytes_per_row
+
+
+def crop_bitmap(bitmap, bytes_per_row, left, top, width, height):
+    """
+    Crops packed bytes, the area outside of the bitmap is white.
+
+    :param bitmap: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :param left: x-axis position of left edge of cropped area (in pixels)
+    :param top: y-axis position of top edge of cropped area (in pixels)
+    :param width: width of cropped area (in pixels)
+    :param height: height of cropped area (in pixels)
+    :return: cropped packed bytes, number of bytes per row of cropped packed bytes
+    """
+    if width < 0 or height < 0:
+        raise ValueError('Cropped area has negative size {}x{}'.format(width, height))
+    new_bytes_per_row = -(-width // 8)
+    bitmap_height = len(bitmap) // bytes_per_row if bytes_per_row else 0
+    bits = size_byte_to_bit(bytes_per_row)
+    blank_row = bytes(new_bytes_per_row)
+    first_row, last_row = max(top, 0), min(top + height, bitmap_height)
+
+    if left >= 0 and left % 8 == 0 and left + size_byte_to_bit(new_bytes_per_row) <= bits:
+        # byte aligned area, rows are sliced and only the last byte of a row is masked
+        start = left // 8
+        rows = [bitmap[row_i * bytes_per_row + start:row_i * bytes_per_row + start + new_bytes_per_row]
+                for row_i in range(first_row, last_row)]
+        cropped = bytearray(b''.join(rows))
+        if width % 8 and cropped:
+            last_mask = (0xFF00 >> (width % 8)) & 0xFF
+            cropped[new_bytes_per_row - 1::new_bytes_per_row] = cropped[new_bytes_per_row - 1::new_bytes_per_row]\
+                .translate(bytes(value & last_mask for value in range(256)))
+        cropped = bytes(cropped)
+    else:
+        shift = bits - left - width
+        mask = (1 << width) - 1
+        padding = size_byte_to_bit(new_bytes_per_row) - width
+        rows = []
+        for row_i in range(first_row, last_row):
+            row = bitmap[row_i * bytes_per_row:(row_i + 1) * bytes_per_row]
+            if not row.strip(b'\x00'):
+                rows.append(blank_row)
+                continue
+            row = int.from_bytes(row, 'big')
+            row = (row >> shift if shift >= 0 else row << -shift) & mask
+            rows.append((row << padding).to_bytes(new_bytes_per_row, 'big'))
+        cropped = b''.join(rows)
+    if first_row > top or last_row < top + height:
+        cropped = (blank_row * min(max(first_row - top, 0), height) + cropped
+                   + blank_row * min(max(top + height - max(last_row, first_row), 0), height))
+    return cropped, new_bytes_per_row
+
+
+def invert_bitmap(bitmap, bytes_per_row, width=None):
+    """
+    Inverts packed bytes (black becomes white and white becomes black).
+
+    :param bitmap: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :param width: width in pixels (optional, default is all bits of a row), padding bits beyond it stay white
+    :return: inverted packed bytes
+    """
+    inverted = bitmap.translate(invert_table)
+    padding = size_byte_to_bit(bytes_per_row) - width if width is not None else 0
+    if padding <= 0:
+        return bytes(inverted)
+    inverted = bytearray(inverted)
+    if padding >= 8:
+        # whole padding bytes are cleared, the last partially used byte is masked
+        for byte_i in range(bytes_per_row - padding // 8, bytes_per_row):
+            inverted[byte_i::bytes_per_row] = bytes(len(inverted[byte_i::bytes_per_row]))
+        padding %= 8
+    if padding:
+        last_mask = (0xFF << padding) & 0xFF
+        byte_i = -(-width // 8) - 1
+        inverted[byte_i::bytes_per_row] = inverted[byte_i::bytes_per_row].translate(
+            bytes(value & last_mask for value in range(256)))
+    return bytes(inverted)
+
+
+def trim_bitmap(bitmap, bytes_per_row):
+    """
+    Trims blank (white) margins of packed bytes, the number of bytes per row and bytes total shrink accordingly.
+    Blank rows are found by stripping zero bytes and blank columns from byte columns of the remaining rows,
+    so only the cropped rows themselves are shifted. A blank bitmap is trimmed to a single white byte.
+
+    :param bitmap: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :return: trimmed packed bytes (bytes total is their length), number of bytes per row of trimmed packed bytes,
+             x-axis and y-axis offsets of trimmed area (in pixels, add them to field origin to keep placement)
+    """
+    height = len(bitmap) // bytes_per_row if bytes_per_row else 0
+    bitmap = bytes(bitmap[:height * bytes_per_row])
+    first = len(bitmap) - len(bitmap.lstrip(b'\x00'))
+    if first == len(bitmap):
+        return b'\x00', 1, 0, 0
+    top = first // bytes_per_row
+    bottom = (len(bitmap.rstrip(b'\x00')) - 1) // bytes_per_row + 1
+    rows = bitmap[top * bytes_per_row:bottom * bytes_per_row]
+
+    def column_bits(byte_i):
+        # OR of all (distinct) bytes of a byte column
+        value = 0
+        for column_byte in set(rows[byte_i::bytes_per_row]):
+            value |= column_byte
+        return value
+
+    byte_columns = [byte_i for byte_i in range(bytes_per_row) if rows[byte_i::bytes_per_row].strip(b'\x00')]
+    first_column, last_column = byte_columns[0], byte_columns[-1]
+    left = first_column * 8 + 8 - column_bits(first_column).bit_length()
+    last_bits = column_bits(last_column)
+    right = last_column * 8 + 8 - ((last_bits & -last_bits).bit_length() - 1)
+    if left == 0 and last_column == bytes_per_row - 1 and top == 0 and bottom == height:
+        return bitmap, bytes_per_row, 0, 0
+    trimmed, new_bytes_per_row = crop_bitmap(rows, bytes_per_row, left, 0, right - left, bottom - top)
+    return trimmed, new_bytes_per_row, left, top
+
+
+def or_bitmap(canvas, canvas_bytes_per_row, bitmap, bytes_per_row, x, y):
+    """
+    Draws packed bytes onto a canvas of packed bytes in place (bitwise OR, black wins), clipped to the canvas.
+    Rows are combined as integers, so every row costs a few C level operations instead of a loop over pixels.
+
+    :param canvas: canvas packed bytes (bytearray)
+    :param canvas_bytes_per_row: number of bytes per row of canvas
+    :param bitmap: packed bytes to draw
+    :param bytes_per_row: number of bytes per row of packed bytes to draw
+    :param x: x-axis position of left edge (in pixels, may be negative)
+    :param y: y-axis position of top edge (in pixels, may be negative)
+    """
+    if not bytes_per_row or not canvas_bytes_per_row:
+        return
+    canvas_height = len(canvas) // canvas_bytes_per_row
+    height = len(bitmap) // bytes_per_row
+    canvas_bits = size_byte_to_bit(canvas_bytes_per_row)
+    canvas_mask = (1 << canvas_bits) - 1
+    shift = canvas_bits - size_byte_to_bit(bytes_per_row) - x
+    for row_i in range(max(0, -y), min(height, canvas_height - y)):
+        row = bitmap[row_i * bytes_per_row:(row_i + 1) * bytes_per_row]
+        if not row.strip(b'\x00'):
+            continue
+        row = int.from_bytes(row, 'big')
+        row = (row << shift if shift >= 0 else row >> -shift) & canvas_mask
+        start = (y + row_i) * canvas_bytes_per_row
+        row |= int.from_bytes(canvas[start:start + canvas_bytes_per_row], 'big')
+        canvas[start:start + canvas_bytes_per_row] = row.to_bytes(canvas_bytes_per_row, 'big')
+
+
+def popcount(value):
+    """
+    Counts set bits of a non-negative integer.
+
+    :param value: integer (e.g. packed bytes converted with `int.from_bytes`)
+    :return: number of set bits
+    """
+    try:
+        return value.bit_count()
+    except AttributeError:
+        return bin(value).count('1')
+
+
+def bitmap_digest(bitmap, bytes_per_row):
+    """
+    Generates content hash of packed bytes, e.g. to store digests of a whole label catalog
+    and quickly reject unchanged labels (see `diff_bitmaps`).
+
+    :param bitmap: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :return: hexadecimal digest
+    """
+    import hashlib
+    digest = hashlib.blake2b(bitmap, digest_size=16)
+    digest.update('|{}'.format(bytes_per_row).encode('ascii'))
+    return digest.hexdigest()
+
+
+def pad_bitmap(bitmap, bytes_per_row, new_bytes_per_row, height):
+    """
+    Pads packed bytes with white on the right and bottom (or cuts incomplete rows off).
+
+    :param bitmap: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :param new_bytes_per_row: number of bytes per row of padded packed bytes (at least `bytes_per_row`)
+    :param height: number of rows of padded packed bytes (at least the number of complete rows)
+    :return: padded packed bytes
+    """
+    rows_total = len(bitmap) // bytes_per_row if bytes_per_row else 0
+    bitmap = bytes(bitmap[:rows_total * bytes_per_row])
+    if new_bytes_per_row != bytes_per_row:
+        padding = bytes(new_bytes_per_row - bytes_per_row)
+        bitmap = b''.join(bitmap[start:start + bytes_per_row] + padding
+                          for start in range(0, len(bitmap), bytes_per_row))
+    return bitmap.ljust(height * new_bytes_per_row, b'\x00')
+
+
+def changed_boxes(xor, bytes_per_row, merge_distance=8):
+    """
+    Finds bounding boxes of set pixels, e.g. of XOR of two bitmaps.
+    Changed rows closer than `merge_distance` form a band, bands are split into boxes by columns
+    without changes (at least `merge_distance` pixels wide, rounded down to whole bytes).
+    Rows are compared as bytes and combined as integers, so pixels are never visited one by one.
+
+    :param xor: packed bytes
+    :param bytes_per_row: number of bytes per row
+    :param merge_distance: maximum distance of changes merged into a single box (in pixels)
+    :return: list of (left, top, right, bottom) boxes, right and bottom exclusive
+    """
+    if not bytes_per_row:
+        return []
+    zero_row = bytes(bytes_per_row)
+    rows = [xor[start:start + bytes_per_row] for start in range(0, len(xor) - bytes_per_row + 1, bytes_per_row)]
+    changed_rows = [row_i for row_i, row in enumerate(rows) if row != zero_row]
+    bands = []
+    for row_i in changed_rows:
+        if bands and row_i - bands[-1][-1] <= merge_distance:
+            bands[-1].append(row_i)
+        else:
+            bands.append([row_i])
+
+    segment_pattern = re.compile(rb'[^\x00]+(?:\x00{0,%d}[^\x00]+)*' % max(0, merge_distance // 8 - 1))
+    boxes = []
+    for band in bands:
+        combined = 0
+        for row_i in band:
+            combined |= int.from_bytes(rows[row_i], 'big')
+        combined = combined.to_bytes(bytes_per_row, 'big')
+        segments = [match.span() for match in segment_pattern.finditer(combined)]
+        for start, end in segments:
+            left = size_byte_to_bit(start) + 8 - combined[start].bit_length()
+            last = combined[end - 1]
+            right = size_byte_to_bit(end) - (last & -last).bit_length() + 1
+            if len(segments) == 1:
+                top, bottom = band[0], band[-1]
+            else:
+                segment_rows = [row_i for row_i in band if rows[row_i][start:end].strip(b'\x00')]
+                top, bottom = segment_rows[0], segment_rows[-1]
+            boxes.append((left, top, right, bottom + 1))
+    return boxes
+
+
+@instrumented(result_size=None)
+def diff_bitmaps(bitmap_a, bytes_per_row_a, bitmap_b, bytes_per_row_b=None, digest_a=None, digest_b=None,
+                 merge_distance=8):
+    """
+    Compares two packed bitmaps (e.g. rendered labels, see `render_label`).
+    Equal digests (see `bitmap_digest`) reject unchanged bitmaps without looking at their bytes, otherwise equal
+    bitmaps are rejected with a single bytes comparison. Changed bitmaps are XORed as integers, differing pixels
+    are counted with popcount and changed regions are boxed (see `changed_boxes`).
+
+    :param bitmap_a: packed bytes (e.g. baseline)
+    :param bytes_per_row_a: number of bytes per row of `bitmap_a`
+    :param bitmap_b: packed bytes (e.g. candidate)
+    :param bytes_per_row_b: number of bytes per row of `bitmap_b` (optional, default is `bytes_per_row_a`)
+    :param digest_a: digest of `bitmap_a` (optional)
+    :param digest_b: digest of `bitmap_b` (optional)
+    :param merge_distance: maximum distance of changes merged into a single box (in pixels)
+    :return: `BitmapDiff`
+    """
+    if bytes_per_row_b is None:
+        bytes_per_row_b = bytes_per_row_a
+    bytes_per_row = max(bytes_per_row_a, bytes_per_row_b)
+    height = max(len(bitmap_a) // bytes_per_row_a if bytes_per_row_a else 0,
+                 len(bitmap_b) // bytes_per_row_b if bytes_per_row_b else 0)
+    width = size_byte_to_bit(bytes_per_row)
+    if digest_a is not None and digest_a == digest_b:
+        return BitmapDiff(True, 0, width, height, [])
+
+    bitmap_a = pad_bitmap(bitmap_a, bytes_per_row_a, bytes_per_row, height)
+    bitmap_b = pad_bitmap(bitmap_b, bytes_per_row_b, bytes_per_row, height)
+    if bitmap_a == bitmap_b:
+        return BitmapDiff(True, 0, width, height, [])
+
+    xor = int.from_bytes(bitmap_a, 'big') ^ int.from_bytes(bitmap_b, 'big')
+    changed_pixels = popcount(xor)
+    boxes = changed_boxes(xor.to_bytes(len(bitmap_a), 'big'), bytes_per_row, merge_distance)
+    return BitmapDiff(False, changed_pixels, width, height, boxes)
+
+
+def diff_image(bitmap_a, bytes_per_row_a, bitmap_b, bytes_per_row_b=None, diff=None, removed_color=(255, 0, 0),
+               added_color=(0, 160, 0), box_color=(0, 0, 255)):
+    """
+    Generates a PIL image highlighting differences of two packed bitmaps: pixels black in both are black,
+    pixels only black in `bitmap_a` are `removed_color`, pixels only black in `bitmap_b` are `added_color`
+    and changed regions are outlined with `box_color`.
+
+    :param bitmap_a: packed bytes (e.g. baseline)
+    :param bytes_per_row_a: number of bytes per row of `bitmap_a`
+    :param bitmap_b: packed bytes (e.g. candidate)
+    :param bytes_per_row_b: number of bytes per row of `bitmap_b` (optional, default is `bytes_per_row_a`)
+    :param diff: `BitmapDiff` of both bitmaps (optional, computed if not given)
+    :param removed_color: RGB color of pixels only black in `bitmap_a`
+    :param added_color: RGB color of pixels only black in `bitmap_b`
+    :param box_color: RGB color of changed region outlines (None draws no outlines)
+    :return: PIL image (mode `RGB`)
+    """
+    from PIL import Image, ImageDraw
+    if bytes_per_row_b is None:
+        bytes_per_row_b = bytes_per_row_a
+    if diff is None:
+        diff = diff_bitmaps(bitmap_a, bytes_per_row_a, bitmap_b, bytes_per_row_b)
+    bytes_per_row = max(bytes_per_row_a, bytes_per_row_b)
+    bytes_total = bytes_per_row * diff.height
+    value_a = int.from_bytes(pad_bitmap(bitmap_a, bytes_per_row_a, bytes_per_row, diff.height), 'big')
+    value_b = int.from_bytes(pad_bitmap(bitmap_b, bytes_per_row_b, bytes_per_row, diff.height), 'big')
+
+    image = Image.new('RGB', (diff.width, diff.height), (255, 255, 255))
+    layers = [(value_a & value_b, (0, 0, 0)), (value_a & ~value_b, removed_color), (value_b & ~value_a, added_color)]
+    for value, color in layers:
+        if value:
+            # set bits are white in raw mode `1` (unlike `bytes_to_image`), so the mask covers black pixels
+            mask = Image.frombytes('1', (size_byte_to_bit(bytes_per_row), diff.height),
+                                   value.to_bytes(bytes_total, 'big'))
+            image.paste(color, (0, 0), mask)
+    if box_color is not None and diff.boxes:
+        draw = ImageDraw.Draw(image)
+        for left, top, right, bottom in diff.boxes:
+            draw.rectangle((left - 2, top - 2, right + 1, bottom + 1), outline=box_color)
+    return image
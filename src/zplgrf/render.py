@@ -0,0 +1,334 @@
+import os
+import threading
+from collections import OrderedDict
+
+from .codec import size_byte_to_bit
+from .graphics import Graphic
+from .metrics import instrumented
+from .parser import FieldResolver, break_xg_command, graphic_key, tokenize
+from .raster import bytes_to_image, image_to_bytes, magnify_bitmap, or_bitmap
+
+"""
+Font used for ^A@ fields whose font is not registered (see `FontRegistry`), bundled in fonts/.
+Its sizing is calibrated so text matches labels printed with Zebra's TT0003M_ font: the original example script
+drew the 57 dots high ^A@N,57,56,E:TT0003M_ fields of zpl_gf/example.zpl with AndaleMono at 60 pixels and placed
+their baseline 43 dots below the field origin (the font's ascent at 60 pixels), both scale with character height.
+"""
+default_font_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'AndaleMono.ttf')
+default_font_size_scale = 60 / 57
+default_font_baseline_scale = 43 / 57
+
+
+@instrumented(data_index=None, result_size=None)
+def label_placements(zpl, cmds, stored_graphics, cache=None, text_renderer=None, resolver=None):
+    """
+    Resolves where fields of a label are placed (field positions, fonts and orientation by `FieldResolver`):
+        ^XG recalls a stored graphic with magnification, ^GF draws an inline graphic.
+        ~DG stores a graphic in `stored_graphics`.
+        ^FD/^FV fields are drawn as text (only with a `text_renderer`).
+        ^FO positions upper left corner of field, ^FT lower left corner of graphic or baseline of text.
+
+    :param zpl: zpl code (string, bytes, bytearray or mmap)
+    :param cmds: commands of zpl code (see `tokenize`)
+    :param stored_graphics: dict of graphic key (see `graphic_key`) to graphic (see `Graphic`), updated by ~DG
+    :param cache: `GraphicCache` used when decoding (optional)
+    :param text_renderer: `TextRenderer` used for ^FD fields (optional, text is skipped without it)
+    :param resolver: `FieldResolver` keeping state across labels (optional)
+    :return: dict of label settings (`^PW`, `^LL` if present), list of (bitmap, bytes_per_row, x, y) placements
+    """
+    settings = {}
+    placements = []
+    resolver = resolver or FieldResolver()
+    for cmd in cmds:
+        code = cmd.command
+        if code == '~DG':
+            graphic = Graphic.from_command(zpl, cmd, cache)
+            stored_graphics[graphic_key(graphic.device, graphic.image_name, graphic.extension)] = graphic
+            continue
+        if code == '^PW' or code == '^LL':
+            params = zpl[cmd.params_start:cmd.end]
+            params = (params if isinstance(params, str) else bytes(params).decode('latin-1')).strip()
+            if params:
+                settings[code] = int(params.split(',')[0])
+            continue
+        field = resolver.feed(zpl, cmd)
+        if field is None:
+            continue
+
+        if field.field_type == 'graphic':
+            field_cmd = field.cmd
+            if field_cmd.command == '^GF':
+                graphic = Graphic.from_command(zpl, field_cmd, cache)
+                magnify_x, magnify_y = 1, 1
+            else:
+                params = zpl[field_cmd.params_start:field_cmd.end]
+                params = params if isinstance(params, str) else bytes(params).decode('latin-1')
+                device, image_name, extension, magnify_x, magnify_y = break_xg_command('^XG' + params)
+                graphic = stored_graphics.get(graphic_key(device, image_name, extension))
+                if graphic is None:
+                    continue
+            bitmap, bytes_per_row = magnify_bitmap(graphic.bitmap, graphic.bytes_per_row, magnify_x, magnify_y)
+            height = len(bitmap) // bytes_per_row if bytes_per_row else 0
+            placements.append((bitmap, bytes_per_row, field.x, field.y - (height if field.typeset else 0)))
+        elif field.field_type == 'text' and text_renderer is not None and field.data:
+            bitmap, bytes_per_row, baseline = text_renderer.render(
+                field.data, field.font_drive, field.font_name, field.char_height, field.orientation)
+            placements.append((bitmap, bytes_per_row, field.x, field.y - (baseline if field.typeset else 0)))
+    return settings, placements
+
+
+@instrumented(data_name='zpl', result_size=lambda result: len(result[2]))
+def render_label(zpl, stored_graphics=None, cache=None, width=None, height=None, text_renderer=None):
+    """
+    Renders a label (^XA...^XZ, see `label_placements` for supported commands) to packed bytes at printer resolution.
+    Label size is taken from `width`/`height`, then from ^PW/^LL, then from the extent of graphics.
+
+    :param zpl: zpl code of the label (string, bytes, bytearray or mmap), ~DG commands before ^XA are stored too
+    :param stored_graphics: dict of graphic key (see `graphic_key`) to graphic (see `Graphic`) for ^XG recalls
+    :param cache: `GraphicCache` used when decoding (optional)
+    :param width: label width in pixels (dots) (optional)
+    :param height: label height in pixels (dots) (optional)
+    :param text_renderer: `TextRenderer` used for ^FD fields (optional, text is skipped without it)
+    :return: width, height, packed bytes of label (rows padded to whole bytes)
+    """
+    stored_graphics = {} if stored_graphics is None else stored_graphics
+    settings, placements = label_placements(zpl, tokenize(zpl), stored_graphics, cache, text_renderer)
+    return compose_label(settings, placements, width, height)
+
+
+@instrumented(data_index=None, result_size=lambda result: len(result[2]))
+def compose_label(settings, placements, width=None, height=None):
+    """
+    Composes graphic placements (see `label_placements`) onto a blank label with bitwise OR.
+
+    :param settings: dict of label settings (`^PW`, `^LL`)
+    :param placements: list of (bitmap, bytes_per_row, x, y) placements
+    :param width: label width in pixels (dots) (optional)
+    :param height: label height in pixels (dots) (optional)
+    :return: width, height, packed bytes of label
+    """
+    if width is None:
+        width = settings.get('^PW') or max(
+            [x + size_byte_to_bit(bytes_per_row) for bitmap, bytes_per_row, x, y in placements] or [0])
+    if height is None:
+        height = settings.get('^LL') or max(
+            [y + len(bitmap) // bytes_per_row for bitmap, bytes_per_row, x, y in placements if bytes_per_row] or [0])
+    width = max(width, 0)
+    height = max(height, 0)
+    canvas_bytes_per_row = -(-width // 8)
+    canvas = bytearray(canvas_bytes_per_row * height)
+    for bitmap, bytes_per_row, x, y in placements:
+        or_bitmap(canvas, canvas_bytes_per_row, bitmap, bytes_per_row, x, y)
+
+    # clear padding bits beyond label width
+    padding = size_byte_to_bit(canvas_bytes_per_row) - width
+    if padding and height:
+        mask = (0xff << padding) & 0xff
+        for last_byte_i in range(canvas_bytes_per_row - 1, len(canvas), canvas_bytes_per_row):
+            canvas[last_byte_i] &= mask
+    return width, height, bytes(canvas)
+
+
+def render_labels(zpl, cache=None, width=None, height=None, text_renderer=None):
+    """
+    Renders all labels (^XA...^XZ) inside zpl code, ~DG downloads are kept for ^XG recalls in later labels.
+
+    :param zpl: zpl code (string, bytes, bytearray or mmap)
+    :param cache: `GraphicCache` used when decoding (optional)
+    :param width: label width in pixels (dots) (optional, see `render_label`)
+    :param height: label height in pixels (dots) (optional, see `render_label`)
+    :param text_renderer: `TextRenderer` used for ^FD fields (optional, text is skipped without it)
+    :return: generator of label (start, end) index, width, height, packed bytes of label
+    """
+    stored_graphics = {}
+    resolver = FieldResolver()
+    label_cmds = None
+    label_start = 0
+    for cmd in tokenize(zpl):
+        if cmd.command == '^XA':
+            label_cmds = []
+            label_start = cmd.start
+        if label_cmds is None:
+            if cmd.command == '~DG':
+                label_placements(zpl, [cmd], stored_graphics, cache)
+            continue
+        label_cmds.append(cmd)
+        if cmd.command == '^XZ':
+            settings, placements = label_placements(
+                zpl, label_cmds, stored_graphics, cache, text_renderer, resolver)
+            label_cmds = None
+            if not placements and '^PW' not in settings and width is None:
+                continue
+            label_width, label_height, bitmap = compose_label(settings, placements, width, height)
+            yield (label_start, cmd.params_start), label_width, label_height, bitmap
+
+
+def render_label_image(zpl, stored_graphics=None, cache=None, width=None, height=None, mode='1',
+                       text_renderer=None):
+    """
+    Renders a label (see `render_label`) to a PIL image.
+
+    :param zpl: zpl code of the label
+    :param stored_graphics: dict of graphic key (see `graphic_key`) to graphic (see `Graphic`) for ^XG recalls
+    :param cache: `GraphicCache` used when decoding (optional)
+    :param width: label width in pixels (dots) (optional)
+    :param height: label height in pixels (dots) (optional)
+    :param mode: PIL mode of returned image (see `bytes_to_image`)
+    :param text_renderer: `TextRenderer` used for ^FD fields (optional, text is skipped without it)
+    :return: PIL image
+    """
+    width, height, bitmap = render_label(zpl, stored_graphics, cache, width, height, text_renderer)
+    bytes_per_row = -(-width // 8)
+    image = bytes_to_image(len(bitmap), bytes_per_row, bitmap, mode)
+    if image.size[0] != width:
+        image = image.crop((0, 0, width, height))
+    return image
+
+
+class FontRegistry:
+    """
+    Maps ZPL fonts (drive and name, as in ^A@ commands) to local font files and keeps loaded fonts.
+    Every (path, size) pair is loaded only once, so labels with many fields of the same font and size
+    do not read the font file again.
+    Fonts that are not registered fall back to `default_path`.
+    """
+
+    def __init__(self, default_path=default_font_path, default_size_scale=default_font_size_scale,
+                 default_baseline_scale=default_font_baseline_scale):
+        """
+        :param default_path: font file used for fonts that are not registered
+        :param default_size_scale: font size (in pixels) per dot of character height of default font
+        :param default_baseline_scale: baseline offset from top per dot of character height of default font
+                                       (None uses font ascent)
+        """
+        self.default = (default_path, default_size_scale, default_baseline_scale)
+        self.entries = {}
+        self.fonts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(font_drive, font_name):
+        """
+        Generates registry key of ZPL font, device defaults to `R:` and extension to `.TTF`.
+
+        :param font_drive: font drive (e.g. `R:` or `E:`)
+        :param font_name: font name (e.g. `TT0003M_` or `TT0003M_.TTF`)
+        :return: registry key (e.g. `E:TT0003M_.TTF`)
+        """
+        if '.' not in font_name:
+            font_name += '.TTF'
+        return '{}{}'.format(font_drive or 'R:', font_name).upper()
+
+    def register(self, font_drive, font_name, path, size_scale=1.0, baseline_scale=None):
+        """
+        Registers a local font file for a ZPL font.
+
+        :param font_drive: font drive (e.g. `E:`)
+        :param font_name: font name (e.g. `TT0003M_`)
+        :param path: font file path (TrueType or OpenType)
+        :param size_scale: font size (in pixels) per dot of character height
+        :param baseline_scale: baseline offset from top per dot of character height (None uses font ascent)
+        """
+        self.entries[self.key(font_drive, font_name)] = (path, size_scale, baseline_scale)
+
+    def resolve(self, font_drive, font_name):
+        """
+        :param font_drive: font drive
+        :param font_name: font name
+        :return: path, size_scale, baseline_scale of registered (or default) font
+        """
+        return self.entries.get(self.key(font_drive, font_name), self.default)
+
+    def font(self, path, size):
+        """
+        Loads a font, once per (path, size).
+
+        :param path: font file path
+        :param size: font size (in pixels)
+        :return: PIL font
+        """
+        from PIL import ImageFont
+        with self.lock:
+            font = self.fonts.get((path, size))
+            if font is None:
+                font = self.fonts[(path, size)] = ImageFont.truetype(path, size)
+            return font
+
+
+class TextRenderer:
+    """
+    Renders text fields to packed bytes (1 bit per pixel, 1 = black), see `label_placements`.
+    Rendered runs (field text with its font, height and orientation) are kept in an LRU cache,
+    since labels tend to repeat the same texts (headers, units, static captions) across fields and labels.
+    """
+
+    def __init__(self, registry=None, max_entries=4096):
+        """
+        :param registry: `FontRegistry` (optional, default maps all fonts to the default font)
+        :param max_entries: maximum number of cached runs
+        """
+        self.registry = registry or FontRegistry()
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def render(self, text, font_drive, font_name, char_height, orientation='N'):
+        """
+        Renders text (character width of ^A@ is not applied, scalable fonts keep their proportions).
+        Rotated fields (`R`, `I`, `B`) are rotated around their upper left corner.
+
+        :param text: text to render
+        :param font_drive: font drive (see `FontRegistry`)
+        :param font_name: font name (see `FontRegistry`)
+        :param char_height: character height (in dots)
+        :param orientation: field orientation (`N`, `R`, `I` or `B`)
+        :return: packed bytes, number of bytes per row, baseline offset from top (in dots)
+        """
+        from PIL import Image, ImageDraw
+        key = (text, font_drive, font_name, char_height, orientation)
+        with self.lock:
+            run = self.entries.get(key)
+            if run is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return run
+            self.misses += 1
+
+        path, size_scale, baseline_scale = self.registry.resolve(font_drive, font_name)
+        font = self.registry.font(path, max(1, int(size_scale * char_height)))
+        ascent, descent = font.getmetrics()
+        if hasattr(font, 'getbbox'):
+            text_width = font.getbbox(text)[2]
+        else:
+            text_width = font.getsize(text)[0]
+        image = Image.new('1', (max(1, text_width), ascent + descent), 1)
+        ImageDraw.Draw(image).text((0, 0), text, fill=0, font=font)
+        if orientation in ('R', 'I', 'B'):
+            image = image.transpose({'R': Image.ROTATE_270, 'I': Image.ROTATE_180, 'B': Image.ROTATE_90}[orientation])
+        bytes_total, bytes_per_row, bitmap = image_to_bytes(image)
+        baseline = ascent if baseline_scale is None else int(round(baseline_scale * char_height))
+        run = (bitmap, bytes_per_row, baseline)
+
+        with self.lock:
+            self.entries[key] = run
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return run
+
+    def stats(self):
+        """
+        Generates cache statistics.
+
+        :return: dict with entries, fonts, hits, misses and hit_ratio
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'fonts': len(self.registry.fonts),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,388 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import zplgrf
+from zplgrf import *
+
+"""
+Repository root with bundled ZPL fixtures (zpl_dg/ and zpl_gf/), they are the default fixtures when running
+from a source checkout, an installed `zplgrf-bench` needs fixture paths as arguments.
+"""
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+"""
+Benchmarked stages, in pipeline order.
+"""
+stages = [
+    'tokenize',
+    'clean',
+    'decompress',
+    'chars_to_bits',
+    'bits_to_image',
+    'image_to_bits',
+    'compress',
+    'decode_bytes',
+    'bytes_to_image',
+    'image_to_bytes',
+    'compress_bytes',
+    'rotate_bitmap',
+    'trim_bitmap',
+    'round_trip',
+]
+
+"""
+Cold start checks: name, statement run in a fresh interpreter and optional modules it must not load.
+"""
+import_checks = [
+    ('import', 'import zplgrf', ('PIL', 'numpy')),
+    ('codec', 'import zplgrf; zplgrf.decode_data(zplgrf.compress_z64(bytes(1000)), 1000, 10)', ('PIL', 'numpy')),
+    ('parser', 'import zplgrf; zpl = "~DGR:A.GRF,1,1,00^XA^XZ"; '
+               'zplgrf.break_dg_command(zplgrf.extract_commands(zpl, zplgrf.find_commands(zpl, "~DG"))[0])',
+     ('PIL', 'numpy')),
+    ('raster', 'import zplgrf; zplgrf.bytes_to_image(1, 1, bytes(1))', ('numpy',)),
+]
+
+
+def fixture_encoding(data):
+    """
+    Detects the encoding of cleaned ~DG or ^GF command data.
+
+    :param data: cleaned ~DG or ^GF command data
+    :return: `z64`, `b64`, `acs` or `hex` (see `encode_data`)
+    """
+    if check_for_z64_compression(data):
+        return 'z64'
+    if check_for_b64_encoding(data):
+        return 'b64'
+    if check_for_compression(data):
+        return 'acs'
+    return 'hex'
+
+
+def relative_name(path):
+    """
+    Names a fixture by its path relative to `fixtures_dir` (so names in saved results do not depend on
+    the working directory), paths outside of it are kept as given.
+
+    :param path: ZPL fixture path
+    :return: fixture name
+    """
+    name = os.path.relpath(os.path.abspath(path), os.path.abspath(fixtures_dir))
+    if name.startswith(os.pardir):
+        return path
+    return name.replace(os.sep, '/')
+
+
+def load_fixture(path):
+    """
+    Loads the first graphic command of a ZPL fixture.
+
+    :param path: ZPL file path
+    :return: dict with zpl, cmd (~DG or ^GF), raw data, bytes_total and bytes_per_row
+    """
+    with open(path, 'rb') as in_file:
+        zpl = in_file.read().decode('latin-1')
+    for cmd in tokenize(zpl):
+        if cmd.command == '~DG':
+            device, image_name, extension, bytes_total, bytes_per_row, data = break_dg_command(
+                extract_command(zpl, cmd))
+        elif cmd.command == '^GF':
+            # graphic field count is the decoded size, binary byte count is only the size of the payload
+            compression_type, binary_byte_count, bytes_total, bytes_per_row, data = break_gf_command(
+                extract_command(zpl, cmd))
+        else:
+            continue
+        return {'zpl': zpl, 'cmd': cmd.command, 'data': data, 'bytes_total': bytes_total,
+                'bytes_per_row': bytes_per_row}
+    return None
+
+
+def scale_fixture(fixture, scale):
+    """
+    Generates a synthetic fixture `scale` times taller (graphic rows tiled vertically) with `scale` labels,
+    keeping the original command type and compression.
+
+    :param fixture: fixture (see `load_fixture`)
+    :param scale: scale factor
+    :return: scaled fixture
+    """
+    bytes_per_row = fixture['bytes_per_row']
+    bitmap = decode_data(fixture['data'], fixture['bytes_total'], bytes_per_row) * scale
+    bytes_total = len(bitmap)
+    encoding, data = encode_data(bitmap, bytes_per_row, fixture_encoding(clean(fixture['data'])))
+    if fixture['cmd'] == '~DG':
+        cmd = build_dg_command(bytes_total, bytes_per_row, data, 'BENCH')
+        zpl = cmd + '^XA^FO0,0^XGR:BENCH.GRF,1,1^FS^XZ' * scale
+    else:
+        cmd = build_gf_command(bytes_total, bytes_per_row, data)
+        zpl = '^XA^FO0,0{}^FS^XZ'.format(cmd) * scale
+    return {'zpl': zpl, 'cmd': fixture['cmd'], 'data': data, 'bytes_total': bytes_total,
+            'bytes_per_row': bytes_per_row}
+
+
+def stage_functions(fixture):
+    """
+    Prepares inputs of every stage (outside of timing) and returns a function running only that stage.
+
+    :param fixture: fixture (see `load_fixture`)
+    :return: dict of stage name to function without arguments
+    """
+    zpl = fixture['zpl']
+    bytes_total = fixture['bytes_total']
+    bytes_per_row = fixture['bytes_per_row']
+    raw_data = fixture['data']
+    data = clean(raw_data)
+    encoding = fixture_encoding(data)
+    # B64 data is only base64 encoded, it is decoded by the same function as Z64
+    is_base64 = encoding in ('z64', 'b64')
+    is_compressed = encoding != 'hex'
+
+    if is_base64:
+        decompressed = decompress_z64(data)
+    elif is_compressed:
+        decompressed = decompress(data, bytes_per_row)
+    else:
+        decompressed = data
+    decompressed = decompressed[:size_byte_to_char(bytes_total)]
+    bits = chars_to_bits(decompressed)
+    bits_total = size_byte_to_bit(bytes_total)
+    bits_per_row = size_byte_to_bit(bytes_per_row)
+    rgba_image = bits_to_image(bits_total, bits_per_row, bits)
+    bitmap = hex_to_bytes(decompressed)
+    image = bytes_to_image(bytes_total, bytes_per_row, bitmap)
+
+    def run_decompress():
+        if is_base64:
+            return decompress_z64(data)
+        if is_compressed:
+            return decompress(data, bytes_per_row)
+        return data
+
+    def run_round_trip():
+        decoded = decode_data(raw_data, bytes_total, bytes_per_row)
+        decoded_image = bytes_to_image(bytes_total, bytes_per_row, decoded)
+        encoded_total, encoded_per_row, encoded = image_to_bytes(decoded_image)
+        return compress_bytes(encoded, encoded_per_row)
+
+    return {
+        'tokenize': lambda: index_commands(zpl),
+        'clean': lambda: clean(raw_data),
+        'decompress': run_decompress,
+        'chars_to_bits': lambda: chars_to_bits(decompressed),
+        'bits_to_image': lambda: bits_to_image(bits_total, bits_per_row, bits),
+        'image_to_bits': lambda: image_to_bits(rgba_image),
+        'compress': lambda: compress(decompressed, bytes_per_row),
+        'decode_bytes': lambda: decode_data(raw_data, bytes_total, bytes_per_row),
+        'bytes_to_image': lambda: bytes_to_image(bytes_total, bytes_per_row, bitmap),
+        'image_to_bytes': lambda: image_to_bytes(image),
+        'compress_bytes': lambda: compress_bytes(bitmap, bytes_per_row),
+        'rotate_bitmap': lambda: rotate_bitmap(bitmap, bytes_per_row, 90),
+        'trim_bitmap': lambda: trim_bitmap(bitmap, bytes_per_row),
+        'round_trip': run_round_trip,
+    }
+
+
+def time_function(function, repeat, min_time=0.05):
+    """
+    Times a function, running it repeatedly until `min_time` passes for each of `repeat` measurements.
+
+    :param function: function without arguments
+    :param repeat: number of measurements
+    :param min_time: minimum duration of a single measurement (in seconds)
+    :return: dict with min_ms, median_ms and number of calls per measurement
+    """
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or calls >= 1024:
+            break
+        calls *= 2
+    timings = [elapsed / calls]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(calls):
+            function()
+        timings.append((time.perf_counter() - started) / calls)
+    return {
+        'min_ms': min(timings) * 1000,
+        'median_ms': statistics.median(timings) * 1000,
+        'calls': calls,
+    }
+
+
+def time_import(statement, forbidden=(), repeat=5):
+    """
+    Times a statement in fresh interpreters (so every import is cold), interpreter startup is not included.
+
+    :param statement: python statement
+    :param forbidden: modules the statement must not load
+    :param repeat: number of measurements (one interpreter each)
+    :return: dict with min_ms, median_ms, number of calls per measurement and forbidden modules that were loaded
+    """
+    script = '\n'.join([
+        'import sys, time',
+        'sys.path.insert(0, {!r})'.format(os.path.dirname(os.path.dirname(os.path.abspath(zplgrf.__file__)))),
+        'started = time.perf_counter()',
+        statement,
+        'elapsed = time.perf_counter() - started',
+        'print(elapsed, *[module for module in {!r} if module in sys.modules])'.format(tuple(forbidden)),
+    ])
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout.split()
+        timings.append(float(output[0]))
+        loaded = output[1:]
+    return {
+        'min_ms': min(timings) * 1000,
+        'median_ms': statistics.median(timings) * 1000,
+        'calls': 1,
+        'loaded': loaded,
+    }
+
+
+def run_imports(repeat=5, out=sys.stdout):
+    """
+    Runs all cold start checks (see `import_checks`).
+
+    :param repeat: number of measurements per check
+    :param out: stream for progress output
+    :return: dict of check name to timing (see `time_import`)
+    """
+    results = {}
+    for name, statement, forbidden in import_checks:
+        results[name] = timing = time_import(statement, forbidden, repeat)
+        out.write('{:<50} {:<16} {:>10.3f} ms{}\n'.format('cold start', name, timing['median_ms'], ''.join(
+            '  LOADED {}'.format(module) for module in timing['loaded'])))
+    return results
+
+
+def run(fixture_paths, scales=(1,), selected_stages=None, repeat=5, min_time=0.05, imports=True, out=sys.stdout):
+    """
+    Runs all selected stages on all fixtures (and their scaled up variants) and cold start checks.
+
+    :param fixture_paths: list of ZPL fixture paths
+    :param scales: scale factors of synthetic fixtures (1 is the fixture itself)
+    :param selected_stages: stages to run (optional, default is all)
+    :param repeat: number of measurements per stage
+    :param min_time: minimum duration of a single measurement (in seconds)
+    :param imports: run cold start checks (see `run_imports`), stored as `cold start` fixture
+    :param out: stream for progress output
+    :return: results dict (meta and results of every `fixture (xScale)` and stage)
+    """
+    selected_stages = selected_stages or stages
+    results = {}
+    if imports:
+        results['cold start'] = run_imports(repeat, out)
+    for path in fixture_paths:
+        fixture = load_fixture(path)
+        if fixture is None:
+            continue
+        name = relative_name(path)
+        for scale in scales:
+            scaled = fixture if scale == 1 else scale_fixture(fixture, scale)
+            fixture_name = name if scale == 1 else '{} (x{})'.format(name, scale)
+            functions = stage_functions(scaled)
+            results[fixture_name] = {}
+            for stage in selected_stages:
+                results[fixture_name][stage] = timing = time_function(functions[stage], repeat, min_time)
+                out.write('{:<50} {:<16} {:>10.3f} ms\n'.format(fixture_name, stage, timing['median_ms']))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compares results to a baseline.
+    A stage regressed if its median is more than `threshold` (relative) slower than in baseline.
+
+    :param results: results (see `run`)
+    :param baseline: baseline results (see `run`)
+    :param threshold: allowed relative slowdown
+    :return: list of (fixture, stage, baseline median_ms, median_ms, relative change) of all compared stages,
+             list of regressed ones
+    """
+    comparisons = []
+    regressions = []
+    for fixture_name, fixture_results in results['results'].items():
+        baseline_results = baseline['results'].get(fixture_name, {})
+        for stage, timing in fixture_results.items():
+            if stage not in baseline_results:
+                continue
+            baseline_ms = baseline_results[stage]['median_ms']
+            change = timing['median_ms'] / baseline_ms - 1 if baseline_ms else 0.0
+            comparison = (fixture_name, stage, baseline_ms, timing['median_ms'], change)
+            comparisons.append(comparison)
+            if change > threshold:
+                regressions.append(comparison)
+    return comparisons, regressions
+
+
+def main(argv=None):
+    """
+    Command line entry point:
+        zplgrf_bench.py [FIXTURE...] [--scale N...] [--stages STAGE...] [--repeat N]
+                        [--no-imports] [--save JSON] [--baseline JSON] [--threshold RELATIVE]
+
+    :param argv: command line arguments (optional, default is sys.argv[1:])
+    :return: exit code (1 if any stage regressed compared to baseline or a cold start check loaded
+             a module it must not load, 2 if no fixtures were found)
+    """
+    parser = argparse.ArgumentParser(description='Benchmark zplgrf pipeline stages on bundled fixtures.')
+    parser.add_argument('fixtures', nargs='*', default=[
+        os.path.join(fixtures_dir, 'zpl_dg', '*.zpl'), os.path.join(fixtures_dir, 'zpl_gf', '*.zpl')],
+        help='fixture files or glob patterns (default: all bundled fixtures of a source checkout)')
+    parser.add_argument('--scale', nargs='+', type=int, default=[1],
+                        help='scale factors of synthetic fixtures, 1 is the fixture itself (default: 1)')
+    parser.add_argument('--stages', nargs='+', choices=stages, default=None, help='stages to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='number of measurements per stage (default: 5)')
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='minimum duration of a single measurement in seconds (default: 0.05)')
+    parser.add_argument('--no-imports', action='store_true', help='skip cold start (import time) checks')
+    parser.add_argument('--save', help='save results as JSON')
+    parser.add_argument('--baseline', help='compare results to baseline JSON')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative slowdown compared to baseline (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    fixture_paths = sorted(set(path for pattern in args.fixtures for path in glob.glob(pattern)))
+    if not fixture_paths:
+        parser.error('no fixtures found in {}'.format(' '.join(args.fixtures)))
+    results = run(fixture_paths, args.scale, args.stages, args.repeat, args.min_time, not args.no_imports)
+    if args.save:
+        with open(args.save, 'w') as out_file:
+            json.dump(results, out_file, indent=2, sort_keys=True)
+
+    loaded = any(timing['loaded'] for timing in results['results'].get('cold start', {}).values())
+    if not args.baseline:
+        return 1 if loaded else 0
+    with open(args.baseline) as in_file:
+        baseline = json.load(in_file)
+    comparisons, regressions = compare(results, baseline, args.threshold)
+    for fixture_name, stage, baseline_ms, median_ms, change in comparisons:
+        sys.stdout.write('{:<50} {:<16} {:>10.3f} -> {:>10.3f} ms {:>+8.1%}{}\n'.format(
+            fixture_name, stage, baseline_ms, median_ms, change, '  REGRESSION' if change > args.threshold else ''))
+    sys.stdout.write('{} of {} stages regressed by more than {:.0%}\n'.format(
+        len(regressions), len(comparisons), args.threshold))
+    return 1 if regressions or loaded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,443 @@
+import argparse
+import glob
+import itertools
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from zplgrf import *
+
+"""
+File extensions recognized as ZPL code and as images.
+"""
+zpl_extensions = ('.zpl', '.prn', '.txt', '.grf')
+image_extensions = ('.png', '.bmp', '.gif', '.jpg', '.jpeg', '.tif', '.tiff')
+
+"""
+Binary ^GF encodings and their compression types.
+"""
+binary_encodings = {'binary': 'B', 'compressed-binary': 'C'}
+
+
+def expand_inputs(inputs, extensions=zpl_extensions + image_extensions):
+    """
+    Expands input files, directories (searched recursively) and glob patterns to a sorted list of files
+    with one of `extensions` (files given explicitly are always included).
+
+    :param inputs: list of files, directories or glob patterns
+    :param extensions: recognized file extensions
+    :return: list of file paths
+    """
+    paths = set()
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            candidates = glob.glob(os.path.join(input_path, '**', '*'), recursive=True)
+        elif glob.has_magic(input_path):
+            candidates = glob.glob(input_path, recursive=True)
+        else:
+            candidates = [input_path]
+        for candidate in candidates:
+            if os.path.isdir(candidate):
+                continue
+            if candidate.lower().endswith(extensions) or candidate == input_path:
+                paths.add(candidate)
+    return sorted(paths)
+
+
+def output_stems(paths):
+    """
+    Generates output file names (without extension) for input files, prefixed with parent directory name
+    for files whose names are not unique.
+
+    :param paths: list of file paths
+    :return: list of output file names
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    duplicates = set(stem for stem in stems if stems.count(stem) > 1)
+    return [
+        '{}_{}'.format(os.path.basename(os.path.dirname(os.path.abspath(path))), stem) if stem in duplicates else stem
+        for path, stem in zip(paths, stems)
+    ]
+
+
+def convert_zpl_file(path, output_dir, stem):
+    """
+    Decodes all ~DG and ^GF commands from a ZPL file and saves them as PNG images
+    named `<stem>_<graphic index>.png`.
+
+    :param path: ZPL file path
+    :param output_dir: directory to save images to
+    :param stem: output file name (without extension)
+    :return: number of converted graphics
+    """
+    with open(path, 'rb') as in_file:
+        zpl = in_file.read()
+    graphics_count = 0
+    for graphic in find_graphics(zpl):
+        graphic.image.save(os.path.join(output_dir, '{}_{}.png'.format(stem, graphics_count)))
+        graphics_count += 1
+    return graphics_count
+
+
+def image_to_zpl(image, image_name='IMAGE', command='dg', encoding='auto', level=9, method='threshold',
+                 threshold=128, trim=False):
+    """
+    Encodes an image to ZPL code with a ~DG command (recalled with ^XG) or an inline ^GF command.
+
+    :param image: PIL image
+    :param image_name: name of graphic stored with ~DG (reduced to at most 8 alphanumeric characters)
+    :param command: `dg` or `gf`
+    :param encoding: data encoding (see `encode_data`), ~DG commands only support `hex`, `acs` or `auto`,
+                     ^GF commands also support `binary` and `compressed-binary` (see `build_gf_binary_command`)
+    :param level: zlib compression level for `z64` and `compressed-binary`
+    :param method: conversion method of images that are not black and white (see `image_to_monochrome`)
+    :param threshold: threshold for `threshold` method (0-256)
+    :param trim: trim blank margins (see `trim_bitmap`), the field origin is moved so the graphic keeps its placement
+    :return: ZPL code (bytes)
+    """
+    bytes_total, bytes_per_row, bitmap = image_to_bytes(image, method, threshold)
+    x = y = 0
+    if trim:
+        bitmap, bytes_per_row, x, y = trim_bitmap(bitmap, bytes_per_row)
+        bytes_total = len(bitmap)
+    if command == 'dg':
+        if encoding not in ('auto', 'hex', 'acs'):
+            raise ValueError('~DG command does not support {} encoding'.format(encoding))
+        encoding, data = encode_data(bitmap, bytes_per_row, 'acs' if encoding == 'auto' else encoding)
+        image_name = ''.join(char for char in image_name.upper() if char.isalnum())[:8] or 'IMAGE'
+        zpl = write_zpl(build_dg_command(bytes_total, bytes_per_row, data, image_name), x, y)
+    elif encoding in binary_encodings:
+        gf_cmd = build_gf_binary_command(bitmap, bytes_per_row, binary_encodings[encoding], level)
+        zpl = '^XA^FO{},{}{}^FS^XZ'.format(x, y, gf_cmd.decode('latin-1'))
+    else:
+        encoding, data = encode_data(bitmap, bytes_per_row, encoding, level)
+        zpl = '^XA^FO{},{}{}^FS^XZ'.format(x, y, build_gf_command(bytes_total, bytes_per_row, data))
+    return zpl.encode('latin-1')
+
+
+def convert_image_file(path, output_dir, stem, command='dg', encoding='auto', level=9, method='threshold',
+                       threshold=128, trim=False):
+    """
+    Encodes an image file to ZPL code (see `image_to_zpl`) and saves it as `<stem>.zpl`.
+
+    :param path: image file path
+    :param output_dir: directory to save ZPL code to
+    :param stem: output file name (without extension), also used as name of graphic stored with ~DG
+    :param command: `dg` or `gf`
+    :param encoding: data encoding (see `image_to_zpl`)
+    :param level: zlib compression level for `z64` and `compressed-binary`
+    :param method: conversion method of images that are not black and white (see `image_to_monochrome`)
+    :param threshold: threshold for `threshold` method (0-256)
+    :param trim: trim blank margins (see `image_to_zpl`)
+    :return: number of converted graphics
+    """
+    from PIL import Image
+    with Image.open(path) as image:
+        zpl = image_to_zpl(image, stem, command, encoding, level, method, threshold, trim)
+    with open(os.path.join(output_dir, '{}.zpl'.format(stem)), 'wb') as out_file:
+        out_file.write(zpl)
+    return 1
+
+
+def optimize_zpl_file(path, output_dir, stem, command=None, encoding='auto', level=9, verify=True):
+    """
+    Rewrites a ZPL file with every graphic in its smallest encoding (see `optimize_zpl`) and saves it as
+    `<stem>.zpl`, written atomically so the input file itself can be the output.
+
+    :param path: ZPL file path
+    :param output_dir: directory to save ZPL code to
+    :param stem: output file name (without extension)
+    :param command: convert graphics to `dg` or `gf` (optional, default keeps commands)
+    :param encoding: data encoding of ^GF commands (see `encode_data`)
+    :param level: zlib compression level for `z64`
+    :param verify: verify every rewritten graphic decodes to the same packed bytes
+    :return: number of rewritten graphics
+    """
+    with open(path, 'rb') as in_file:
+        zpl = in_file.read()
+    zpl, report = optimize_zpl(zpl, command, encoding, level, verify)
+    if report['verify_failures']:
+        raise ValueError('{} graphics did not verify and were kept as they were'.format(report['verify_failures']))
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out_file:
+        out_file.write(zpl)
+    os.replace(tmp_path, os.path.join(output_dir, '{}.zpl'.format(stem)))
+    return report['rewritten'] + report['converted']
+
+
+def optimize_file(task):
+    """
+    Optimizes a single ZPL file (see `optimize_zpl_file`).
+    Runs in worker processes, so errors are returned instead of raised.
+
+    :param task: (path, output_dir, stem, options) tuple, options are keyword arguments of `optimize_zpl_file`
+    :return: path, number of rewritten graphics, number of bytes read, error message or None
+    """
+    path, output_dir, stem, options = task
+    try:
+        bytes_in = os.path.getsize(path)
+        return path, optimize_zpl_file(path, output_dir, stem, **options), bytes_in, None
+    except Exception as e:
+        return path, 0, 0, '{}: {}'.format(type(e).__name__, e)
+
+
+def convert_file(task):
+    """
+    Converts a single file, ZPL code to images or an image to ZPL code depending on its extension.
+    Runs in worker processes, so errors are returned instead of raised.
+
+    :param task: (path, output_dir, stem, options) tuple, options are keyword arguments of `convert_image_file`
+    :return: path, number of converted graphics, number of bytes read, error message or None
+    """
+    path, output_dir, stem, options = task
+    try:
+        bytes_in = os.path.getsize(path)
+        if path.lower().endswith(image_extensions):
+            graphics_count = convert_image_file(path, output_dir, stem, **options)
+        else:
+            graphics_count = convert_zpl_file(path, output_dir, stem)
+        return path, graphics_count, bytes_in, None
+    except Exception as e:
+        return path, 0, 0, '{}: {}'.format(type(e).__name__, e)
+
+
+def convert(inputs, output_dir, workers=None, chunksize=None, options=None, out=sys.stdout, err=sys.stderr,
+            task_function=convert_file, extensions=zpl_extensions + image_extensions):
+    """
+    Converts all input files on a process pool and reports throughput and errors.
+
+    :param inputs: list of files, directories or glob patterns
+    :param output_dir: directory to save outputs to (created if needed)
+    :param workers: number of worker processes (optional, default is number of CPUs, 0 or 1 converts in process)
+    :param chunksize: number of files submitted to a worker at once (optional, default depends on number of files)
+    :param options: keyword arguments of `convert_image_file` (optional)
+    :param out: stream for statistics
+    :param err: stream for error report
+    :param task_function: function converting a single file (`convert_file` or `optimize_file`)
+    :param extensions: file extensions of inputs (see `expand_inputs`)
+    :return: exit code (0 if all files were converted, 1 otherwise)
+    """
+    paths = expand_inputs(inputs, extensions)
+    os.makedirs(output_dir, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tasks = [(path, output_dir, stem, options or {}) for path, stem in zip(paths, output_stems(paths))]
+    if not chunksize:
+        chunksize = max(1, min(64, len(tasks) // (max(workers, 1) * 4)))
+
+    started = time.perf_counter()
+    if workers <= 1 or len(tasks) <= 1:
+        results = [task_function(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = list(pool.imap_unordered(task_function, tasks, chunksize))
+    elapsed = max(time.perf_counter() - started, 1e-9)
+
+    errors = sorted((path, error) for path, graphics_count, bytes_in, error in results if error)
+    graphics_total = sum(result[1] for result in results)
+    bytes_total = sum(result[2] for result in results)
+    out.write('{} files ({} failed), {} graphics, {:.2f} MB in {:.2f} s\n'.format(
+        len(results), len(errors), graphics_total, bytes_total / 1e6, elapsed))
+    out.write('{:.1f} files/s, {:.1f} graphics/s, {:.2f} MB/s\n'.format(
+        len(results) / elapsed, graphics_total / elapsed, bytes_total / 1e6 / elapsed))
+    for path, error in errors:
+        err.write('{}: {}\n'.format(path, error))
+    return 1 if errors or not paths else 0
+
+
+def diff_zpl_file(task):
+    """
+    Renders all labels of a baseline and a candidate ZPL file and compares them label by label
+    (see `diff_bitmaps`, labels without any graphics are skipped), identical files are not rendered at all.
+    Highlight images (see `diff_image`) of changed labels are saved as `<stem>_<label index>.png`.
+    Runs in worker processes, so errors are returned instead of raised.
+
+    :param task: (baseline path, candidate path, output_dir or None, stem, options) tuple, options may hold
+                 `text` (render ^FD text fields) and `merge_distance` (see `changed_boxes`)
+    :return: candidate path, number of compared labels (None for identical files), list of (label index,
+             `BitmapDiff`) of changed labels, error message or None
+    """
+    baseline_path, path, output_dir, stem, options = task
+    try:
+        with open(baseline_path, 'rb') as in_file:
+            baseline = in_file.read()
+        with open(path, 'rb') as in_file:
+            candidate = in_file.read()
+        if baseline == candidate:
+            return path, None, [], None
+
+        text_renderer = TextRenderer() if options.get('text', True) else None
+        cache = GraphicCache()
+        labels = itertools.zip_longest(render_labels(baseline, cache, text_renderer=text_renderer),
+                                       render_labels(candidate, cache, text_renderer=text_renderer),
+                                       fillvalue=(None, 0, 0, b''))
+        labels_total = 0
+        changed = []
+        for label_i, ((_, width_a, _, bitmap_a), (_, width_b, _, bitmap_b)) in enumerate(labels):
+            labels_total += 1
+            bytes_per_row_a = -(-width_a // 8)
+            bytes_per_row_b = -(-width_b // 8)
+            diff = diff_bitmaps(bitmap_a, bytes_per_row_a, bitmap_b, bytes_per_row_b,
+                                merge_distance=options.get('merge_distance', 8))
+            if diff.identical:
+                continue
+            changed.append((label_i, diff))
+            if output_dir is not None:
+                image = diff_image(bitmap_a, bytes_per_row_a, bitmap_b, bytes_per_row_b, diff)
+                image.save(os.path.join(output_dir, '{}_{}.png'.format(stem, label_i)))
+        return path, labels_total, changed, None
+    except Exception as e:
+        return path, 0, [], '{}: {}'.format(type(e).__name__, e)
+
+
+def diff(baseline, candidate, output_dir=None, workers=None, chunksize=None, options=None, out=sys.stdout,
+         err=sys.stderr):
+    """
+    Compares rendered labels of baseline and candidate ZPL files on a process pool (see `diff_zpl_file`)
+    and reports changed labels. Directories are compared file by file (matched by relative path).
+
+    :param baseline: baseline ZPL file or directory
+    :param candidate: candidate ZPL file or directory
+    :param output_dir: directory to save highlight images of changed labels to (optional, created if needed)
+    :param workers: number of worker processes (optional, default is number of CPUs, 0 or 1 compares in process)
+    :param chunksize: number of files submitted to a worker at once (optional, default depends on number of files)
+    :param options: options of `diff_zpl_file` (optional)
+    :param out: stream for statistics and changed labels
+    :param err: stream for error report
+    :return: exit code (0 if all labels are identical, 1 otherwise)
+    """
+    if os.path.isdir(baseline) and os.path.isdir(candidate):
+        baseline_paths = dict((os.path.relpath(path, baseline), path)
+                              for path in expand_inputs([baseline], zpl_extensions))
+        candidate_paths = dict((os.path.relpath(path, candidate), path)
+                               for path in expand_inputs([candidate], zpl_extensions))
+        pairs = [(baseline_paths[name], candidate_paths[name]) for name in sorted(candidate_paths)
+                 if name in baseline_paths]
+        missing = [(path, 'missing in {}'.format(candidate)) for name, path in sorted(baseline_paths.items())
+                   if name not in candidate_paths]
+        missing += [(path, 'missing in {}'.format(baseline)) for name, path in sorted(candidate_paths.items())
+                    if name not in baseline_paths]
+    else:
+        pairs = [(baseline, candidate)]
+        missing = []
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stems = output_stems([path for baseline_path, path in pairs])
+    tasks = [(baseline_path, path, output_dir, stem, options or {})
+             for (baseline_path, path), stem in zip(pairs, stems)]
+    if not chunksize:
+        chunksize = max(1, min(64, len(tasks) // (max(workers, 1) * 4)))
+
+    started = time.perf_counter()
+    if workers <= 1 or len(tasks) <= 1:
+        results = [diff_zpl_file(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = list(pool.imap_unordered(diff_zpl_file, tasks, chunksize))
+    elapsed = max(time.perf_counter() - started, 1e-9)
+
+    results.sort()
+    errors = [(path, error) for path, labels_count, changed, error in results if error] + missing
+    identical_total = sum(1 for result in results if result[1] is None and not result[3])
+    labels_total = sum(result[1] or 0 for result in results)
+    changed_total = sum(len(result[2]) for result in results)
+    for path, labels_count, changed, error in results:
+        for label_i, label_diff in changed:
+            out.write('{} label {}: {} pixels changed in {}\n'.format(
+                path, label_i, label_diff.changed_pixels, ' '.join(
+                    '({},{})-({},{})'.format(*box) for box in label_diff.boxes)))
+    out.write('{} files ({} failed, {} identical), {} labels compared, {} changed in {:.2f} s\n'.format(
+        len(results), len(errors), identical_total, labels_total, changed_total, elapsed))
+    for path, error in errors:
+        err.write('{}: {}\n'.format(path, error))
+    return 1 if errors or changed_total or not pairs else 0
+
+
+def main(argv=None):
+    """
+    Command line entry point:
+        zplgrf convert [-o OUTPUT_DIR] [-w WORKERS] [--chunksize N] [--command dg|gf] [--encoding ENCODING]
+                       [--level LEVEL] [--monochrome METHOD] [--threshold THRESHOLD] INPUT...
+        zplgrf optimize [-o OUTPUT_DIR] [-w WORKERS] [--chunksize N] [--command dg|gf] [--encoding ENCODING]
+                        [--level LEVEL] [--no-verify] INPUT...
+        zplgrf diff [-o OUTPUT_DIR] [-w WORKERS] [--chunksize N] [--no-text] [--merge-distance N] BASELINE CANDIDATE
+
+    :param argv: command line arguments (optional, default is sys.argv[1:])
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(prog='zplgrf', description='Utilities to work with GRF images from ZPL.')
+    subparsers = parser.add_subparsers(dest='subcommand')
+    subparsers.required = True
+
+    convert_parser = subparsers.add_parser(
+        'convert', help='convert ZPL files to PNG images and images to ZPL files')
+    convert_parser.add_argument('inputs', nargs='+', help='files, directories or glob patterns')
+    convert_parser.add_argument('-o', '--output-dir', default='.', help='output directory (default: .)')
+    convert_parser.add_argument('-w', '--workers', type=int, default=None,
+                                help='number of worker processes, 0 runs in process (default: number of CPUs)')
+    convert_parser.add_argument('--chunksize', type=int, default=None,
+                                help='number of files submitted to a worker at once')
+    convert_parser.add_argument('--command', choices=['dg', 'gf'], default='dg',
+                                help='ZPL command generated from images (default: dg)')
+    convert_parser.add_argument('--encoding', choices=['auto', 'hex', 'acs', 'z64', 'b64'] + list(binary_encodings),
+                                default='auto',
+                                help='data encoding of generated commands (default: auto)')
+    convert_parser.add_argument('--level', type=int, default=9,
+                                help='zlib compression level for z64 and compressed-binary (default: 9)')
+    convert_parser.add_argument('--monochrome', choices=monochrome_methods, default='threshold',
+                                help='conversion of images to black and white (default: threshold)')
+    convert_parser.add_argument('--threshold', type=int, default=128,
+                                help='pixels darker than threshold become black (default: 128)')
+    convert_parser.add_argument('--trim', action='store_true',
+                                help='trim blank margins of images, field origin keeps their placement')
+
+    optimize_parser = subparsers.add_parser(
+        'optimize', help='rewrite graphics of ZPL files to their smallest encoding, other commands are kept')
+    optimize_parser.add_argument('inputs', nargs='+', help='files, directories or glob patterns')
+    optimize_parser.add_argument('-o', '--output-dir', default='.',
+                                 help='output directory, may be the input directory (default: .)')
+    optimize_parser.add_argument('-w', '--workers', type=int, default=None,
+                                 help='number of worker processes, 0 runs in process (default: number of CPUs)')
+    optimize_parser.add_argument('--chunksize', type=int, default=None,
+                                 help='number of files submitted to a worker at once')
+    optimize_parser.add_argument('--command', choices=['dg', 'gf'], default=None,
+                                 help='convert graphics to ~DG downloads or inline ^GF (default: keep commands)')
+    optimize_parser.add_argument('--encoding', choices=['auto', 'hex', 'acs', 'z64', 'b64'], default='auto',
+                                 help='data encoding of ^GF commands (default: auto)')
+    optimize_parser.add_argument('--level', type=int, default=9, help='zlib compression level for z64 (default: 9)')
+    optimize_parser.add_argument('--no-verify', dest='verify', action='store_false',
+                                 help='do not decode rewritten graphics to verify them')
+
+    diff_parser = subparsers.add_parser(
+        'diff', help='compare rendered labels of baseline and candidate ZPL files (or directories)')
+    diff_parser.add_argument('baseline', help='baseline ZPL file or directory')
+    diff_parser.add_argument('candidate', help='candidate ZPL file or directory')
+    diff_parser.add_argument('-o', '--output-dir', default=None,
+                             help='directory to save images highlighting changes to (default: no images)')
+    diff_parser.add_argument('-w', '--workers', type=int, default=None,
+                             help='number of worker processes, 0 runs in process (default: number of CPUs)')
+    diff_parser.add_argument('--chunksize', type=int, default=None,
+                             help='number of files submitted to a worker at once')
+    diff_parser.add_argument('--no-text', dest='text', action='store_false', help='do not render ^FD text fields')
+    diff_parser.add_argument('--merge-distance', type=int, default=8,
+                             help='maximum distance of changes merged into a single box in pixels (default: 8)')
+
+    args = parser.parse_args(argv)
+    if args.subcommand == 'diff':
+        options = {'text': args.text, 'merge_distance': args.merge_distance}
+        return diff(args.baseline, args.candidate, args.output_dir, args.workers, args.chunksize, options)
+    if args.subcommand == 'optimize':
+        options = {'command': args.command, 'encoding': args.encoding, 'level': args.level, 'verify': args.verify}
+        return convert(args.inputs, args.output_dir, args.workers, args.chunksize, options,
+                       task_function=optimize_file, extensions=zpl_extensions)
+    options = {'command': args.command, 'encoding': args.encoding, 'level': args.level,
+               'method': args.monochrome, 'threshold': args.threshold, 'trim': args.trim}
+    return convert(args.inputs, args.output_dir, args.workers, args.chunksize, options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
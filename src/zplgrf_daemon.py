@@ -0,0 +1,691 @@
+import argparse
+import concurrent.futures
+import glob
+import http.client
+import http.server
+import io
+import ipaddress
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import deque
+
+from zplgrf import *
+from zplgrf_cli import image_to_zpl
+
+"""
+HTTP paths of requests handled by workers (POST) and their request kinds.
+"""
+request_paths = {'/render': 'render', '/convert': 'convert'}
+
+"""
+Latency percentiles reported by `RenderDaemon.stats`.
+"""
+latency_percentiles = (50, 90, 99)
+
+"""
+State of the current worker (graphic cache, text renderer and optional metrics aggregator), created once per worker
+by `init_worker` and kept warm across requests.
+"""
+worker_state = {}
+
+
+def init_worker(cache_entries=1024, cache_bytes=268435456, metrics=False):
+    """
+    Initializes state of the current worker.
+
+    :param cache_entries: maximum number of cached graphics
+    :param cache_bytes: maximum total size of cached graphics (in bytes)
+    :param metrics: instrument pipeline stages (see `MetricsAggregator`)
+    """
+    worker_state['cache'] = GraphicCache(cache_entries, cache_bytes)
+    worker_state['text_renderer'] = TextRenderer()
+    worker_state['requests'] = 0
+    if metrics and 'metrics' not in worker_state:
+        worker_state['metrics'] = MetricsAggregator()
+        add_hook(worker_state['metrics'])
+
+
+def int_param(params, name, default=None):
+    """
+    Reads an integer request parameter.
+
+    :param params: dict of parameter name to value
+    :param name: parameter name
+    :param default: value of missing parameter
+    :return: integer value
+    """
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Parameter {} must be an integer, got {!r}'.format(name, value))
+
+
+def render_request(params, body):
+    """
+    Renders one label of ZPL code to a PNG image.
+    Parameters: `label` (index of label, default 0), `width` and `height` (in dots, optional)
+    and `text` (0 skips ^FD text fields).
+
+    :param params: dict of parameter name to value
+    :param body: ZPL code (bytes)
+    :return: content type, PNG image (bytes), extra headers
+    """
+    label = int_param(params, 'label', 0)
+    text_renderer = worker_state['text_renderer'] if params.get('text', '1') != '0' else None
+    labels = render_labels(body, worker_state['cache'], int_param(params, 'width'), int_param(params, 'height'),
+                           text_renderer)
+    for index, (span, width, height, bitmap) in enumerate(labels):
+        if index < label:
+            continue
+        image = bytes_to_image(len(bitmap), -(-width // 8), bitmap)
+        if image.size[0] != width:
+            image = image.crop((0, 0, width, height))
+        out_file = io.BytesIO()
+        image.save(out_file, 'PNG')
+        return 'image/png', out_file.getvalue(), {'X-Label-Width': width, 'X-Label-Height': height}
+    raise ValueError('Label {} not found'.format(label))
+
+
+def convert_request(params, body):
+    """
+    Encodes an image to ZPL code (see `image_to_zpl`).
+    Parameters: `name`, `command`, `encoding`, `level`, `method`, `threshold` and `trim` (1 trims blank margins).
+
+    :param params: dict of parameter name to value
+    :param body: image file contents (bytes)
+    :return: content type, ZPL code (bytes), extra headers
+    """
+    from PIL import Image
+    with Image.open(io.BytesIO(body)) as image:
+        zpl = image_to_zpl(image, params.get('name', 'IMAGE'), params.get('command', 'dg'),
+                           params.get('encoding', 'auto'), int_param(params, 'level', 9),
+                           params.get('method', 'threshold'), int_param(params, 'threshold', 128),
+                           bool(int_param(params, 'trim', 0)))
+    return 'text/plain; charset=latin-1', zpl, {}
+
+
+def handle_request(kind, params, body):
+    """
+    Handles a single request inside a worker.
+
+    :param kind: request kind (`render` or `convert`)
+    :param params: dict of parameter name to value
+    :param body: request body (bytes)
+    :return: HTTP status, content type, response body (bytes), extra headers
+    """
+    if not worker_state:
+        init_worker()
+    worker_state['requests'] += 1
+    try:
+        if kind == 'render':
+            return (200,) + render_request(params, body)
+        if kind == 'convert':
+            return (200,) + convert_request(params, body)
+        return 404, 'text/plain', 'Unknown request {}\n'.format(kind).encode(), {}
+    except (ValueError, OSError, zlib.error) as e:
+        return 400, 'text/plain', '{}\n'.format(e).encode(), {}
+    except Exception as e:
+        return 500, 'text/plain', '{}: {}\n'.format(type(e).__name__, e).encode(), {}
+
+
+def process_batch(requests):
+    """
+    Handles a batch of requests inside a worker.
+
+    :param requests: list of (kind, params, body)
+    :return: list of responses (see `handle_request`), worker stats (pid, requests, graphic cache stats
+             and metrics snapshot if enabled)
+    """
+    responses = [handle_request(kind, params, body) for kind, params, body in requests]
+    cache = worker_state['cache']
+    return responses, {
+        'pid': os.getpid(),
+        'requests': worker_state['requests'],
+        'cache_hits': cache.hits,
+        'cache_misses': cache.misses,
+        'cache_entries': len(cache.entries),
+        'cache_bytes': cache.size,
+        'metrics': worker_state['metrics'].snapshot() if 'metrics' in worker_state else None,
+    }
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest rank percentile.
+
+    :param sorted_values: sorted list of values
+    :param percent: percentile (0-100)
+    :return: value (None for empty list)
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, -(-len(sorted_values) * percent // 100) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class RenderDaemon:
+    """
+    Long running renderer serving `render` and `convert` requests (see `handle_request`).
+    Workers keep their graphic cache and text renderer (with loaded fonts) warm across requests.
+    Concurrent requests are queued and collected into micro-batches (for at most `batch_window` seconds
+    or `max_batch` requests), every batch is split evenly between workers, so many small requests cost
+    one dispatch per worker instead of one per request.
+    """
+
+    def __init__(self, workers=None, batch_window=0.002, max_batch=32, cache_entries=1024, cache_bytes=268435456,
+                 latency_window=10000, request_timeout=60.0, metrics=False):
+        """
+        :param workers: number of worker processes (optional, default is number of CPUs),
+                        0 handles requests in a single thread of the current process
+        :param batch_window: time to wait for more requests after the first request of a batch (in seconds)
+        :param max_batch: maximum number of requests in a batch
+        :param cache_entries: maximum number of cached graphics per worker
+        :param cache_bytes: maximum total size of cached graphics per worker (in bytes)
+        :param latency_window: number of most recent requests used for latency percentiles
+        :param request_timeout: time to wait for a response (in seconds)
+        :param metrics: instrument pipeline stages of workers (see `metrics`)
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        self.request_timeout = request_timeout
+        self.metrics_enabled = metrics
+        self.queue = queue.Queue()
+        self.executor = None
+        self.batcher = None
+        self.lock = threading.Lock()
+        self.latencies = {kind: deque(maxlen=latency_window) for kind in request_paths.values()}
+        self.requests = dict.fromkeys(request_paths.values(), 0)
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.worker_stats = {}
+        self.started = None
+
+    def start(self):
+        """
+        Starts workers (waiting for all of them to initialize) and the batching thread.
+        """
+        if self.workers:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=init_worker, initargs=(self.cache_entries, self.cache_bytes, self.metrics_enabled))
+            futures = [self.executor.submit(process_batch, []) for _ in range(self.workers)]
+        else:
+            init_worker(self.cache_entries, self.cache_bytes, self.metrics_enabled)
+            self.executor = concurrent.futures.ThreadPoolExecutor(1)
+            futures = [self.executor.submit(process_batch, [])]
+        for future in futures:
+            self.record_worker(future.result()[1])
+        self.started = time.time()
+        self.batcher = threading.Thread(target=self.run_batcher, name='zplgrf-batcher', daemon=True)
+        self.batcher.start()
+
+    def stop(self):
+        """
+        Stops the batching thread and workers, requests still queued are handled first.
+        """
+        if self.batcher is not None:
+            self.queue.put(None)
+            self.batcher.join()
+            self.batcher = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            if not self.workers and 'metrics' in worker_state:
+                # the in process worker instruments the current process, its hook must not outlive the daemon
+                remove_hook(worker_state.pop('metrics'))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def record_worker(self, stats):
+        """
+        Stores the most recent stats of a worker.
+
+        :param stats: worker stats (see `process_batch`)
+        """
+        with self.lock:
+            self.worker_stats[stats['pid']] = stats
+
+    def submit(self, kind, params, body):
+        """
+        Queues a request and waits for its response.
+
+        :param kind: request kind (`render` or `convert`)
+        :param params: dict of parameter name to value
+        :param body: request body (bytes)
+        :return: HTTP status, content type, response body (bytes), extra headers
+        """
+        if kind not in self.requests:
+            raise ValueError('Unknown request {}'.format(kind))
+        started = time.perf_counter()
+        future = concurrent.futures.Future()
+        self.queue.put((kind, params, body, future))
+        response = future.result(self.request_timeout)
+        with self.lock:
+            self.latencies[kind].append(time.perf_counter() - started)
+            self.requests[kind] += 1
+            if response[0] != 200:
+                self.errors += 1
+        return response
+
+    def run_batcher(self):
+        """
+        Collects queued requests into batches and dispatches them to workers until `stop` is called.
+        """
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.dispatch(batch)
+
+    def dispatch(self, batch):
+        """
+        Splits a batch evenly between workers and submits every part.
+
+        :param batch: list of (kind, params, body, future)
+        """
+        with self.lock:
+            self.batches += 1
+            self.batched_requests += len(batch)
+        part_size = -(-len(batch) // max(1, self.workers))
+        for part_start in range(0, len(batch), part_size):
+            part = batch[part_start:part_start + part_size]
+            try:
+                future = self.executor.submit(process_batch, [item[:3] for item in part])
+            except RuntimeError as e:
+                for item in part:
+                    item[3].set_exception(e)
+                continue
+            future.add_done_callback(lambda done, part=part: self.complete(part, done))
+
+    def complete(self, part, done):
+        """
+        Delivers responses of a finished part of a batch.
+
+        :param part: list of (kind, params, body, future)
+        :param done: finished future of `process_batch`
+        """
+        try:
+            responses, stats = done.result()
+        except Exception as e:
+            for item in part:
+                item[3].set_exception(e)
+            return
+        self.record_worker(stats)
+        for item, response in zip(part, responses):
+            item[3].set_result(response)
+
+    def stats(self):
+        """
+        Daemon stats: uptime, requests and latency percentiles (in milliseconds) per request kind, errors,
+        batching and graphic cache stats summed over workers.
+
+        :return: dict
+        """
+        with self.lock:
+            latencies = {kind: sorted(values) for kind, values in self.latencies.items()}
+            worker_stats = list(self.worker_stats.values())
+            stats = {
+                'uptime': time.time() - self.started if self.started else 0.0,
+                'workers': self.workers,
+                'queued': self.queue.qsize(),
+                'errors': self.errors,
+                'batches': self.batches,
+                'mean_batch': self.batched_requests / self.batches if self.batches else 0.0,
+                'requests': dict(self.requests),
+            }
+        stats['latency_ms'] = {
+            kind: dict(('p{}'.format(percent), None if percentile(values, percent) is None
+                        else percentile(values, percent) * 1000) for percent in latency_percentiles)
+            for kind, values in latencies.items()}
+        for key in ('cache_hits', 'cache_misses', 'cache_entries', 'cache_bytes'):
+            stats[key] = sum(worker[key] for worker in worker_stats)
+        return stats
+
+    def metrics(self):
+        """
+        Pipeline stage metrics merged over workers (empty unless the daemon was created with `metrics`).
+
+        :return: `MetricsAggregator`
+        """
+        aggregator = MetricsAggregator()
+        with self.lock:
+            snapshots = [worker['metrics'] for worker in self.worker_stats.values() if worker['metrics']]
+        for snapshot in snapshots:
+            aggregator.merge(snapshot)
+        return aggregator
+
+
+class DaemonRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    HTTP handler of `RenderHTTPServer`:
+        POST /render, POST /convert (query string holds request parameters, body holds ZPL code or image)
+        GET /stats (JSON), GET /metrics (Prometheus text, JSON with `format=json`), GET /health
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self, status, content_type, body, headers=None):
+        """
+        Sends a response.
+
+        :param status: HTTP status
+        :param content_type: content type
+        :param body: response body (bytes)
+        :param headers: dict of extra headers (optional)
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path
+        if path == '/stats':
+            body = json.dumps(self.server.render_daemon.stats(), indent=2, sort_keys=True).encode()
+            self.respond(200, 'application/json', body + b'\n')
+        elif path == '/metrics':
+            aggregator = self.server.render_daemon.metrics()
+            if dict(urllib.parse.parse_qsl(url.query)).get('format') == 'json':
+                self.respond(200, 'application/json', aggregator.to_json().encode() + b'\n')
+            else:
+                self.respond(200, 'text/plain; version=0.0.4', aggregator.to_prometheus().encode())
+        elif path == '/health':
+            self.respond(200, 'text/plain', b'ok\n')
+        else:
+            self.respond(404, 'text/plain', b'Not found\n')
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            self.respond(411, 'text/plain', b'Content-Length required\n')
+            return
+        if int(length) > self.server.max_body:
+            self.close_connection = True
+            self.respond(413, 'text/plain', b'Request body too large\n')
+            return
+        body = self.rfile.read(int(length))
+        if url.path not in request_paths:
+            self.respond(404, 'text/plain', b'Not found\n')
+            return
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            status, content_type, response, headers = self.server.render_daemon.submit(
+                request_paths[url.path], params, body)
+        except concurrent.futures.TimeoutError:
+            status, content_type, response, headers = 503, 'text/plain', b'Request timed out\n', {}
+        self.respond(status, content_type, response, headers)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RenderHTTPServer(http.server.ThreadingHTTPServer):
+    """
+    HTTP server of a `RenderDaemon` listening on a loopback TCP address.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, render_daemon, max_body=67108864, verbose=False):
+        """
+        :param address: (host, port) tuple, host must be a loopback address
+        :param render_daemon: started `RenderDaemon`
+        :param max_body: maximum size of request body (in bytes)
+        :param verbose: log every request to stderr
+        """
+        self.render_daemon = render_daemon
+        self.max_body = max_body
+        self.verbose = verbose
+        super().__init__(address, DaemonRequestHandler)
+
+
+class UnixRenderHTTPServer(RenderHTTPServer):
+    """
+    HTTP server of a `RenderDaemon` listening on a Unix socket (only accessible by the current user).
+    """
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.TCPServer.server_bind(self)
+        os.chmod(self.server_address, 0o600)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def check_local_host(host):
+    """
+    Checks that host is a loopback address, the daemon must never be reachable from other machines.
+
+    :param host: host name or IP address
+    """
+    if host == 'localhost':
+        return
+    try:
+        if ipaddress.ip_address(host).is_loopback:
+            return
+    except ValueError:
+        pass
+    raise ValueError('Daemon only listens on loopback addresses, got {}'.format(host))
+
+
+def make_server(render_daemon, host='127.0.0.1', port=8089, unix_socket=None, max_body=67108864, verbose=False):
+    """
+    Creates HTTP server of a daemon on a loopback TCP address or on a Unix socket.
+
+    :param render_daemon: started `RenderDaemon`
+    :param host: loopback host
+    :param port: TCP port (0 picks a free port)
+    :param unix_socket: Unix socket path (optional, used instead of host and port)
+    :param max_body: maximum size of request body (in bytes)
+    :param verbose: log every request to stderr
+    :return: `RenderHTTPServer` or `UnixRenderHTTPServer`
+    """
+    if unix_socket:
+        return UnixRenderHTTPServer(unix_socket, render_daemon, max_body, verbose)
+    check_local_host(host)
+    return RenderHTTPServer((host, port), render_daemon, max_body, verbose)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP client connection over a Unix socket.
+    """
+
+    def __init__(self, path, timeout=60.0):
+        """
+        :param path: Unix socket path
+        :param timeout: socket timeout (in seconds)
+        """
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def benchmark(jobs, requests_count=1000, concurrency=8, workers=None, batch_window=0.002, max_batch=32,
+              unix_socket=None, out=sys.stdout):
+    """
+    Benchmarks rendering over HTTP: starts a daemon on a free port (or Unix socket) and posts jobs
+    (ZPL code, cycled) to /render from `concurrency` client threads with keep-alive connections.
+
+    :param jobs: list of ZPL code (bytes)
+    :param requests_count: total number of requests
+    :param concurrency: number of client threads
+    :param workers: number of worker processes (see `RenderDaemon`)
+    :param batch_window: see `RenderDaemon`
+    :param max_batch: see `RenderDaemon`
+    :param unix_socket: Unix socket path (optional)
+    :param out: stream for results
+    :return: daemon stats (see `RenderDaemon.stats`)
+    """
+    with RenderDaemon(workers, batch_window, max_batch) as render_daemon:
+        server = make_server(render_daemon, port=0, unix_socket=unix_socket)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        counter = iter(range(requests_count))
+        counter_lock = threading.Lock()
+        failures = []
+
+        def client():
+            if unix_socket:
+                connection = UnixHTTPConnection(unix_socket)
+            else:
+                connection = http.client.HTTPConnection(*server.server_address[:2], timeout=60.0)
+            while True:
+                with counter_lock:
+                    index = next(counter, None)
+                if index is None:
+                    break
+                connection.request('POST', '/render', jobs[index % len(jobs)])
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failures.append(response.status)
+            connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        server.shutdown()
+        server.server_close()
+        stats = render_daemon.stats()
+
+    latency = stats['latency_ms']['render']
+    out.write('{} requests, {} failed, {:.3f} s, {:.1f} requests/s\n'.format(
+        requests_count, len(failures), elapsed, requests_count / elapsed if elapsed else 0.0))
+    out.write('latency p50 {p50:.2f} ms, p90 {p90:.2f} ms, p99 {p99:.2f} ms\n'.format(**latency))
+    out.write('{} batches, mean batch {:.2f}, graphic cache {} hits, {} misses\n'.format(
+        stats['batches'], stats['mean_batch'], stats['cache_hits'], stats['cache_misses']))
+    return stats
+
+
+def main(argv=None):
+    """
+    Command line entry point:
+        zplgrf_daemon.py serve [--host HOST] [--port PORT] [--unix-socket PATH] [--workers N]
+                               [--batch-window SECONDS] [--max-batch N] [--verbose] [--metrics]
+        zplgrf_daemon.py bench [--requests N] [--concurrency N] [--workers N] [--batch-window SECONDS]
+                               [--max-batch N] [--unix-socket PATH] FILE...
+
+    :param argv: command line arguments (optional, default is sys.argv[1:])
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(description='Render daemon serving ZPL rendering and image conversion over a '
+                                                 'local HTTP socket.')
+    subparsers = parser.add_subparsers(dest='subcommand')
+    subparsers.required = True
+
+    def add_daemon_arguments(subparser):
+        subparser.add_argument('--unix-socket', help='listen on a Unix socket instead of TCP')
+        subparser.add_argument('--workers', type=int, default=None,
+                               help='number of worker processes, 0 renders in the daemon process '
+                                    '(default: number of CPUs)')
+        subparser.add_argument('--batch-window', type=float, default=0.002,
+                               help='seconds to collect concurrent requests into a batch (default: 0.002)')
+        subparser.add_argument('--max-batch', type=int, default=32,
+                               help='maximum number of requests in a batch (default: 32)')
+
+    serve_parser = subparsers.add_parser('serve', help='run the daemon')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='loopback host to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8089, help='port to listen on (default: 8089)')
+    serve_parser.add_argument('--verbose', action='store_true', help='log every request')
+    serve_parser.add_argument('--metrics', action='store_true',
+                              help='instrument pipeline stages, exported on GET /metrics')
+    add_daemon_arguments(serve_parser)
+
+    bench_parser = subparsers.add_parser('bench', help='benchmark rendering through a local daemon')
+    bench_parser.add_argument('files', nargs='+', help='ZPL files or glob patterns used as requests')
+    bench_parser.add_argument('--requests', type=int, default=1000, help='number of requests (default: 1000)')
+    bench_parser.add_argument('--concurrency', type=int, default=8, help='number of client threads (default: 8)')
+    add_daemon_arguments(bench_parser)
+
+    args = parser.parse_args(argv)
+    if args.subcommand == 'bench':
+        paths = sorted(set(path for pattern in args.files for path in glob.glob(pattern)))
+        jobs = []
+        for path in paths:
+            with open(path, 'rb') as in_file:
+                jobs.append(in_file.read())
+        if not jobs:
+            sys.stderr.write('No input files\n')
+            return 1
+        benchmark(jobs, args.requests, args.concurrency, args.workers, args.batch_window, args.max_batch,
+                  args.unix_socket)
+        return 0
+
+    try:
+        check_local_host(args.host)
+    except ValueError as e:
+        sys.stderr.write('{}\n'.format(e))
+        return 1
+    with RenderDaemon(args.workers, args.batch_window, args.max_batch, metrics=args.metrics) as render_daemon:
+        server = make_server(render_daemon, args.host, args.port, args.unix_socket, verbose=args.verbose)
+        sys.stderr.write('Listening on {}\n'.format(
+            args.unix_socket or 'http://{}:{}'.format(*server.server_address[:2])))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,569 @@
+import argparse
+import asyncio
+import collections
+import glob
+import sys
+import time
+
+from zplgrf import *
+
+"""
+Default raw TCP port of printers (JetDirect / raw printing).
+"""
+default_port = 9100
+
+
+def parse_printer(printer):
+    """
+    Parses printer address.
+
+    :param printer: `host`, `host:port` or (host, port) tuple
+    :return: host, port
+    """
+    if isinstance(printer, tuple):
+        return printer[0], int(printer[1])
+    host, separator, port = printer.rpartition(':')
+    if not separator or not port.isdigit():
+        return printer, default_port
+    return host, int(port)
+
+
+class PrinterPool:
+    """
+    Pool of raw TCP connections to a single printer.
+    At most `max_connections` jobs are sent at once, idle connections are reused for later jobs.
+    Jobs are written in chunks of `chunk_size` bytes and every chunk waits for the transport buffer to drain,
+    so large graphics never pile up in memory faster than the printer reads them.
+    Every connection has a task reading what the printer sends back (e.g. `~HS` status), so replies never
+    pile up in the stream buffer, and a connection closed by the printer is noticed as soon as it is closed.
+    """
+
+    def __init__(self, host, port=default_port, max_connections=2, chunk_size=65536, connect_timeout=10.0,
+                 write_timeout=60.0, resend_partial=False, max_replies=256):
+        """
+        :param host: printer host
+        :param port: printer port
+        :param max_connections: maximum number of open connections
+        :param chunk_size: number of bytes written before waiting for the transport buffer to drain
+        :param connect_timeout: connection timeout (in seconds)
+        :param write_timeout: timeout of writing a single chunk (in seconds)
+        :param resend_partial: send a job again on a new connection when a reused connection fails after part of
+                               the job was written (labels that already reached the printer are printed twice)
+        :param max_replies: number of most recent reply chunks kept in `replies`
+        """
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.chunk_size = chunk_size
+        self.connect_timeout = connect_timeout
+        self.write_timeout = write_timeout
+        self.resend_partial = resend_partial
+        self.idle = []
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.replies = collections.deque(maxlen=max_replies)
+        self.jobs = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = 0
+        self.connections = 0
+
+    async def connect(self):
+        """
+        Opens a new connection and starts reading replies from it (see `read_replies`).
+
+        :return: stream writer, reply reading task (done once the printer closed the connection)
+        """
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.connect_timeout)
+        self.connections += 1
+        return writer, asyncio.ensure_future(self.read_replies(reader))
+
+    async def read_replies(self, reader):
+        """
+        Reads data sent back by the printer until the connection is closed, keeping the most recent chunks
+        in `replies`.
+
+        :param reader: stream reader
+        """
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                self.bytes_received += len(chunk)
+                self.replies.append(chunk)
+        except (ConnectionError, OSError):
+            pass
+
+    async def write(self, writer, data):
+        """
+        Writes data in chunks, waiting for the transport buffer to drain after every chunk.
+
+        :param writer: stream writer
+        :param data: bytes
+        """
+        view = memoryview(data)
+        for chunk_start in range(0, len(view), self.chunk_size):
+            writer.write(view[chunk_start:chunk_start + self.chunk_size])
+            await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def send(self, data):
+        """
+        Sends a job. Idle connections closed by the printer are discarded before anything is written to them.
+        A job failing once writing started is not sent again, as labels that reached the printer would print twice,
+        unless `resend_partial` is set (then a job failing on a reused connection is sent on a new connection).
+
+        :param data: zpl code (bytes or string)
+        """
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+        async with self.semaphore:
+            while True:
+                reused = bool(self.idle)
+                writer, replies_task = self.idle.pop() if reused else await self.connect()
+                if reused:
+                    # let the reply reading task see a close that already arrived
+                    await asyncio.sleep(0)
+                    if writer.is_closing() or replies_task.done():
+                        await self.discard(writer, replies_task)
+                        continue
+                try:
+                    await self.write(writer, data)
+                except (ConnectionError, asyncio.TimeoutError, OSError):
+                    await self.discard(writer, replies_task)
+                    if reused and self.resend_partial:
+                        continue
+                    self.errors += 1
+                    raise
+                self.idle.append((writer, replies_task))
+                self.jobs += 1
+                self.bytes_sent += len(data)
+                return
+
+    @staticmethod
+    async def discard(writer, replies_task):
+        """
+        Closes a connection and stops reading its replies.
+
+        :param writer: stream writer
+        :param replies_task: reply reading task
+        """
+        writer.close()
+        replies_task.cancel()
+        try:
+            await replies_task
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self):
+        """
+        Closes idle connections.
+        """
+        idle, self.idle = self.idle, []
+        for writer, replies_task in idle:
+            await self.discard(writer, replies_task)
+        for writer, replies_task in idle:
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+class PrinterClient:
+    """
+    Sends jobs to many printers concurrently, with a connection pool per printer (see `PrinterPool`).
+    At most `max_pending` jobs are in flight across all printers, `send` waits for a free slot otherwise,
+    so producers are slowed down to the pace of printers instead of queuing jobs without bounds.
+    """
+
+    def __init__(self, max_connections=2, max_pending=256, chunk_size=65536, connect_timeout=10.0,
+                 write_timeout=60.0, resend_partial=False):
+        """
+        :param max_connections: maximum number of open connections per printer
+        :param max_pending: maximum number of jobs in flight across all printers
+        :param chunk_size: number of bytes written before waiting for the transport buffer to drain
+        :param connect_timeout: connection timeout (in seconds)
+        :param write_timeout: timeout of writing a single chunk (in seconds)
+        :param resend_partial: send partially written jobs again (see `PrinterPool`)
+        """
+        self.max_connections = max_connections
+        self.chunk_size = chunk_size
+        self.connect_timeout = connect_timeout
+        self.write_timeout = write_timeout
+        self.resend_partial = resend_partial
+        self.pools = {}
+        self.pending = asyncio.Semaphore(max_pending)
+
+    def pool(self, printer):
+        """
+        :param printer: printer address (see `parse_printer`)
+        :return: connection pool of printer
+        """
+        host, port = parse_printer(printer)
+        pool = self.pools.get((host, port))
+        if pool is None:
+            pool = self.pools[(host, port)] = PrinterPool(
+                host, port, self.max_connections, self.chunk_size, self.connect_timeout, self.write_timeout,
+                self.resend_partial)
+        return pool
+
+    async def send(self, printer, data):
+        """
+        Sends a job to a printer.
+
+        :param printer: printer address (see `parse_printer`)
+        :param data: zpl code (bytes or string)
+        """
+        async with self.pending:
+            await self.pool(printer).send(data)
+
+    async def send_many(self, jobs):
+        """
+        Sends jobs to their printers concurrently.
+
+        :param jobs: iterable of (printer, data) tuples
+        :return: list of None (sent) or exception (failed) for every job, in order of jobs
+        """
+        return await asyncio.gather(*(self.send(printer, data) for printer, data in jobs), return_exceptions=True)
+
+    def stats(self):
+        """
+        Generates statistics of all printers.
+
+        :return: dict of `host:port` to dict with jobs, bytes_sent, bytes_received (replies), errors and connections
+        """
+        return {
+            '{}:{}'.format(host, port): {
+                'jobs': pool.jobs,
+                'bytes_sent': pool.bytes_sent,
+                'bytes_received': pool.bytes_received,
+                'errors': pool.errors,
+                'connections': pool.connections,
+            }
+            for (host, port), pool in self.pools.items()
+        }
+
+    async def close(self):
+        """
+        Closes idle connections of all printers.
+        """
+        for pool in self.pools.values():
+            await pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class FakePrinter:
+    """
+    Local raw TCP server behaving like a printer, for tests and benchmarks without hardware.
+    Received data is split into jobs (labels) at every `^XZ` (following `^CC`/`^CT` prefix changes),
+    commands before `^XA` (e.g. `~DG`) belong to the next job, and jobs are recorded as dicts with peer, data,
+    received (time) and, with `decode`, graphics (number of decoded ~DG/^GF graphics) and errors
+    (decoding error messages).
+    `latency` seconds are spent per job before reading further, `bytes_per_second` throttles reading,
+    both push back on senders through TCP flow control like a slow printer does.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, bytes_per_second=None, decode=False,
+                 read_size=65536, keep_data=True):
+        """
+        :param host: host to listen on
+        :param port: port to listen on (0 picks a free port, see `port` after `start`)
+        :param latency: seconds spent per job
+        :param bytes_per_second: reading speed limit (optional)
+        :param decode: decode graphics of every job
+        :param read_size: number of bytes read at once
+        :param keep_data: keep data of recorded jobs (otherwise only its size is kept)
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.decode = decode
+        self.read_size = read_size
+        self.keep_data = keep_data
+        self.server = None
+        self.jobs = []
+        self.bytes_received = 0
+        self.connections = 0
+        self.handlers = {}
+
+    async def start(self):
+        """
+        Starts listening.
+
+        :return: self
+        """
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        """
+        Stops listening and closes connections, data received so far is still recorded.
+        """
+        if self.server is not None:
+            self.server.close()
+            for writer in self.handlers.values():
+                writer.close()
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+
+    async def wait_idle(self, poll_interval=0.001):
+        """
+        Waits until all connections are closed by senders and everything they sent is recorded.
+
+        :param poll_interval: seconds between checks
+        """
+        while self.handlers:
+            await asyncio.sleep(poll_interval)
+
+    @property
+    def address(self):
+        """
+        :return: `host:port` of printer (see `parse_printer`)
+        """
+        return '{}:{}'.format(self.host, self.port)
+
+    async def handle(self, reader, writer):
+        """
+        Reads jobs from a connection until it is closed.
+
+        :param reader: stream reader
+        :param writer: stream writer
+        """
+        self.connections += 1
+        self.handlers[asyncio.current_task()] = writer
+        peer = writer.get_extra_info('peername')
+        buffer = b''
+        resume = 0
+        # prefixes changed by ^CC/^CT stay in effect for the rest of the connection
+        prefixes = ('^', '~')
+        try:
+            while True:
+                chunk = await reader.read(self.read_size)
+                if not chunk:
+                    break
+                self.bytes_received += len(chunk)
+                if self.bytes_per_second:
+                    await asyncio.sleep(len(chunk) / self.bytes_per_second)
+                buffer += chunk
+                # a job can only end with a new ^XZ, large graphic payloads are not tokenized again and again,
+                # the tail includes the last command and 2 bytes before the chunk (^XZ split across reads)
+                if buffer.find(prefixes[0].encode('latin-1'), max(resume, len(buffer) - len(chunk) - 2)) == -1:
+                    continue
+                jobs, consumed, resume, prefixes = self.split_jobs(buffer, resume, *prefixes)
+                for job in jobs:
+                    await self.record(peer, job)
+                buffer = buffer[consumed:]
+                resume -= consumed
+            jobs, consumed, resume, prefixes = self.split_jobs(buffer, resume, *prefixes)
+            for job in jobs:
+                await self.record(peer, job)
+            if buffer[consumed:].strip():
+                await self.record(peer, buffer[consumed:])
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self.handlers.pop(asyncio.current_task(), None)
+
+    @staticmethod
+    def split_jobs(data, start=0, format_prefix='^', control_prefix='~'):
+        """
+        Splits complete jobs at every `^XZ`.
+
+        :param data: received zpl code
+        :param start: index to start tokenizing from (start of the last command found before more data arrived)
+        :param format_prefix: format prefix in effect at `start`
+        :param control_prefix: control prefix in effect at `start`
+        :return: list of complete jobs (bytes), number of bytes they take up, index to resume tokenizing from,
+                 (format prefix, control prefix) in effect at that index
+        """
+        jobs = []
+        job_start = 0
+        resume = start
+        prefixes = resume_prefixes = (format_prefix, control_prefix)
+        for cmd in tokenize(data, start, format_prefix, control_prefix):
+            # the last command is tokenized again, with the prefixes in effect before it
+            resume, resume_prefixes = cmd.start, prefixes
+            new_prefix = data[cmd.params_start:cmd.params_start + 1].decode('latin-1')
+            if cmd.command in ('^CC', '~CC', '^CT', '~CT') and new_prefix and not new_prefix.isspace():
+                prefixes = (new_prefix, prefixes[1]) if cmd.command.endswith('CC') else (prefixes[0], new_prefix)
+            if cmd.command == '^XZ':
+                jobs.append(data[job_start:cmd.params_start])
+                job_start = cmd.params_start
+        if job_start > resume:
+            return jobs, job_start, job_start, prefixes
+        return jobs, job_start, resume, resume_prefixes
+
+    async def record(self, peer, data):
+        """
+        Records a job, decodes its graphics and waits `latency` seconds.
+
+        :param peer: address of sender
+        :param data: job (bytes)
+        """
+        data = data.strip()
+        job = {'peer': peer, 'data': data if self.keep_data else None, 'size': len(data), 'received': time.time()}
+        if self.decode:
+            job['graphics'] = 0
+            job['errors'] = []
+            for graphic in find_graphics(data):
+                try:
+                    graphic.bitmap
+                    job['graphics'] += 1
+                except ValueError as e:
+                    job['errors'].append(str(e))
+        self.jobs.append(job)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+
+async def benchmark(jobs, printers_count=4, jobs_count=1000, latency=0.0, max_connections=2, decode=False,
+                    out=sys.stdout):
+    """
+    Sends jobs to local fake printers and reports throughput.
+
+    :param jobs: list of jobs (bytes), sent round robin
+    :param printers_count: number of fake printers
+    :param jobs_count: number of jobs to send
+    :param latency: seconds every fake printer spends per job
+    :param max_connections: maximum number of open connections per printer
+    :param decode: decode graphics of every job on fake printers
+    :param out: stream for statistics
+    :return: exit code (0 if all jobs were received intact)
+    """
+    printers = [FakePrinter(latency=latency, decode=decode, keep_data=False) for _ in range(printers_count)]
+    for printer in printers:
+        await printer.start()
+    try:
+        sent = [(printers[i % printers_count].address, jobs[i % len(jobs)]) for i in range(jobs_count)]
+        started = time.perf_counter()
+        async with PrinterClient(max_connections) as client:
+            results = await client.send_many(sent)
+        # connections are closed now, wait until printers have recorded everything that was sent
+        for printer in printers:
+            await printer.wait_idle()
+        elapsed = max(time.perf_counter() - started, 1e-9)
+    finally:
+        for printer in printers:
+            await printer.stop()
+
+    failed = sum(1 for result in results if result is not None)
+    bytes_sent = sum(len(data) for printer, data in sent)
+    bytes_received = sum(printer.bytes_received for printer in printers)
+    labels = sum(len(printer.jobs) for printer in printers)
+    errors = sum(len(job.get('errors', ())) for printer in printers for job in printer.jobs)
+    out.write('{} jobs sent ({} failed), {} labels received, {} decoding errors, {:.2f} MB in {:.2f} s\n'.format(
+        jobs_count, failed, labels, errors, bytes_sent / 1e6, elapsed))
+    out.write('{:.1f} jobs/s, {:.1f} labels/s, {:.2f} MB/s\n'.format(
+        jobs_count / elapsed, labels / elapsed, bytes_sent / 1e6 / elapsed))
+    return 0 if not failed and not errors and bytes_received == bytes_sent else 1
+
+
+async def send(printer, jobs, max_connections=2):
+    """
+    Sends jobs to a printer and reports failures.
+
+    :param printer: printer address (see `parse_printer`)
+    :param jobs: list of jobs (bytes)
+    :param max_connections: maximum number of connections
+    :return: exit code (0 if all jobs were sent)
+    """
+    async with PrinterClient(max_connections) as client:
+        results = await client.send_many((printer, data) for data in jobs)
+    for result in results:
+        if result is not None:
+            sys.stderr.write('{}: {}\n'.format(type(result).__name__, result))
+    return 1 if any(result is not None for result in results) else 0
+
+
+async def serve(host, port, latency=0.0, decode=False):
+    """
+    Runs a fake printer until interrupted, printing a line per received job.
+
+    :param host: host to listen on
+    :param port: port to listen on
+    :param latency: seconds spent per job
+    :param decode: decode graphics of every job
+    :return: exit code
+    """
+    printer = FakePrinter(host, port, latency, decode=decode, keep_data=False)
+    await printer.start()
+    sys.stdout.write('Listening on {}\n'.format(printer.address))
+    reported = 0
+    try:
+        while True:
+            await asyncio.sleep(0.1)
+            for job in printer.jobs[reported:]:
+                sys.stdout.write('{} bytes from {}{}\n'.format(job['size'], job['peer'], ', {} graphics {}'.format(
+                    job['graphics'], job['errors'] or '') if decode else ''))
+            reported = len(printer.jobs)
+    finally:
+        await printer.stop()
+
+
+def main(argv=None):
+    """
+    Command line entry point:
+        zplgrf_printer.py send PRINTER FILE...
+        zplgrf_printer.py serve [--host HOST] [--port PORT] [--latency SECONDS] [--decode]
+        zplgrf_printer.py bench [--printers N] [--jobs N] [--latency SECONDS] [--connections N] [--decode] FILE...
+
+    :param argv: command line arguments (optional, default is sys.argv[1:])
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(description='Send ZPL jobs to printers over raw TCP.')
+    subparsers = parser.add_subparsers(dest='subcommand')
+    subparsers.required = True
+
+    send_parser = subparsers.add_parser('send', help='send ZPL files to a printer')
+    send_parser.add_argument('printer', help='printer address (host or host:port, default port is 9100)')
+    send_parser.add_argument('files', nargs='+', help='ZPL files or glob patterns, every file is a job')
+    send_parser.add_argument('--connections', type=int, default=2, help='maximum number of connections (default: 2)')
+
+    serve_parser = subparsers.add_parser('serve', help='run a fake printer printing received jobs to stdout')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='host to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=default_port, help='port to listen on (default: 9100)')
+    serve_parser.add_argument('--latency', type=float, default=0.0, help='seconds spent per job (default: 0)')
+    serve_parser.add_argument('--decode', action='store_true', help='decode graphics of every job')
+
+    bench_parser = subparsers.add_parser('bench', help='benchmark sending jobs to local fake printers')
+    bench_parser.add_argument('files', nargs='+', help='ZPL files or glob patterns used as jobs')
+    bench_parser.add_argument('--printers', type=int, default=4, help='number of fake printers (default: 4)')
+    bench_parser.add_argument('--jobs', type=int, default=1000, help='number of jobs (default: 1000)')
+    bench_parser.add_argument('--latency', type=float, default=0.0, help='seconds spent per job (default: 0)')
+    bench_parser.add_argument('--connections', type=int, default=2,
+                              help='maximum number of connections per printer (default: 2)')
+    bench_parser.add_argument('--decode', action='store_true', help='decode graphics of every job')
+
+    args = parser.parse_args(argv)
+    if args.subcommand == 'serve':
+        return asyncio.run(serve(args.host, args.port, args.latency, args.decode))
+
+    paths = sorted(set(path for pattern in args.files for path in glob.glob(pattern)))
+    jobs = []
+    for path in paths:
+        with open(path, 'rb') as in_file:
+            jobs.append(in_file.read())
+    if not jobs:
+        sys.stderr.write('No input files\n')
+        return 1
+    if args.subcommand == 'bench':
+        return asyncio.run(benchmark(jobs, args.printers, args.jobs, args.latency, args.connections, args.decode))
+    return asyncio.run(send(args.printer, jobs, args.connections))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Reference implementations from the single module zplgrf.py the package was split from,
+new implementations are checked against them.
+"""
+from zplgrf import counts_repeat, repeat_counts, size_byte_to_char, substrings_of_same_consecutive_chars
+
+"""
+PIL colors.
+"""
+color_black = (0, 0, 0, 255)
+color_white = (255, 255, 255, 255)
+
+
+def compress(data, bytes_per_row):
+    """
+    Compresses ~DG command data (see `zplgrf.compress`).
+
+    :param data: decompressed ~DG command data
+    :param bytes_per_row: row width (in bytes) for ~DG command data
+    :return: compressed ~DG command data
+    """
+    chars_per_row = size_byte_to_char(bytes_per_row)
+    lines = [data[i:i + chars_per_row] for i in range(0, len(data), chars_per_row)]
+
+    repeats_values = sorted(list(repeat_counts.values()), reverse=True)
+
+    compressed_lines = []
+    for line_i in range(len(lines)):
+        line = lines[line_i]
+
+        # check if current line is the same as previous line
+        if line_i != 0:
+            if line == lines[line_i-1]:
+                compressed_lines.append(':')
+                continue
+
+        # break string into a list of substrings of same consecutive characters
+        sublines = substrings_of_same_consecutive_chars(line)
+
+        # check if current line is full of either F or 0
+        if len(sublines) == 1:
+            if line[0] == '0':
+                compressed_lines.append(',')
+            elif line[0] == 'F':
+                compressed_lines.append('!')
+            continue
+
+        # compress sublines
+        compressed_sublines = []
+        for subline_i in range(len(sublines)):
+            subline = sublines[subline_i]
+
+            if subline_i == len(sublines) - 1:
+                if subline[0] == '0':
+                    compressed_sublines.append(',')
+                elif subline[0] == 'F':
+                    compressed_sublines.append('!')
+                continue
+
+            subline_len = len(subline)
+            highest_repeats = []
+            while subline_len > 0:
+                for repeats_value in repeats_values:
+                    if repeats_value <= subline_len:
+                        highest_repeats.append(counts_repeat[repeats_value])
+                        subline_len -= repeats_value
+            compressed_subline = '{}{}'.format(''.join(highest_repeats), subline[0])
+            compressed_sublines.append(compressed_subline)
+
+        compressed_line = ''.join(compressed_sublines)
+
+        compressed_lines.append(compressed_line)
+
+    return ''.join(compressed_lines)
+
+
+def hex_char_to_bits(hex_char):
+    """
+    Turns a valid hexadecimal character to a string of 4 bits.
+
+    :param hex_char: hexadecimal character
+    :return: string of 4 bits
+    """
+    return bin(int(hex_char, 16))[2:].zfill(4)
+
+
+def bits_to_hex_char(bits):
+    """
+    Turns a string of 4 bits to a valid hexadecimal character.
+
+    :param bits: string of 4 bits
+    :return: hexadecimal character
+    """
+    return hex(int(bits, 2))[2:].upper()
+
+
+def chars_to_bits(data):
+    """
+    Turns a string of hexadecimal characters to a string of bits.
+
+    :param data: string of hexadecimal characters
+    :return: string of bits
+    """
+    data_bits = ''
+    for hex_char in data:
+        data_bits += hex_char_to_bits(hex_char)
+    return data_bits
+
+
+def bits_to_chars(data_bits):
+    """
+    Turns a string of bits to a string of hexadecimal characters.
+
+    :param data_bits: string of bits
+    :return: string of hexadecimal characters
+    """
+    data = []
+    four_bits = []
+    for bit in data_bits:
+        four_bits.append(bit)
+        if len(four_bits) % 4 == 0:
+            data.append(bits_to_hex_char(''.join(four_bits)))
+            four_bits = []
+    return ''.join(data)
+
+
+def bits_to_image(bits_total, bits_per_row, bits):
+    """
+    Generates a PIL image from bits.
+
+    :param bits_total: total number of bits
+    :param bits_per_row: number of bits per row
+    :param bits: bits to generate image from
+    :return: PIL image
+    """
+    from PIL import Image
+    height = int((bits_total / bits_per_row))
+
+    image = Image.new("RGBA", (bits_per_row, height), color_white)
+    pixels = image.load()
+
+    for y in range(height):
+        for x in range(bits_per_row):
+            i = y * bits_per_row + x
+            current_color = color_black if bits[i] == '1' else color_white
+            pixels[x, y] = current_color
+
+    return image
+
+
+def image_to_bits(image):
+    """
+    Generates a string of bits from PIL image.
+
+    :param image: PIL image
+    :return: total number of bits, number of bits per row, bits generated from image
+    """
+    image.convert('1')
+    bits_per_row = image.size[0]
+    height = image.size[1]
+    bits_total = height * bits_per_row
+    pixels = image.load()
+    bits = []
+    for y in range(height):
+        for x in range(bits_per_row):
+            bits.append('1' if pixels[x, y] == color_black else '0')
+    return bits_total, bits_per_row, ''.join(bits)
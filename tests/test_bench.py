@@ -0,0 +1,100 @@
+import glob
+import json
+import os
+
+import pytest
+
+from zplgrf import bytes_to_hex, decode_data, encode_data
+
+import zplgrf_bench
+from zplgrf_bench import (fixture_encoding, load_fixture, main, relative_name, scale_fixture, stage_functions,
+                          stages)
+
+baseline_path = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'baseline.json')
+
+bitmap = bytes(100) + b'\xff' * 100 + bytes(range(100))
+
+
+def write_fixture(tmp_path, encoding, name='fixture.zpl'):
+    encoding, data = encode_data(bitmap, 10, encoding)
+    path = tmp_path / name
+    path.write_text('^XA^FO0,0^GFA,{},{},10,{}^FS^XZ'.format(len(data), len(bitmap), data))
+    return str(path)
+
+
+def test_load_fixture_gf_uses_graphic_field_count(tmp_path):
+    bitmap = bytes(100) + b'\xff' * 100
+    encoding, data = encode_data(bitmap, 10, 'z64')
+    path = tmp_path / 'z64.zpl'
+    # binary byte count is the size of the Z64 payload, graphic field count the decoded size
+    path.write_text('^XA^FO0,0^GFA,{},{},10,{}^FS^XZ'.format(len(data), len(bitmap), data))
+    fixture = load_fixture(str(path))
+    assert fixture['cmd'] == '^GF'
+    assert fixture['bytes_total'] == len(bitmap)
+    assert fixture['bytes_per_row'] == 10
+
+
+@pytest.mark.parametrize('encoding', ['hex', 'acs', 'z64', 'b64'])
+def test_fixture_encoding(encoding):
+    assert fixture_encoding(encode_data(bitmap, 10, encoding)[1]) == encoding
+
+
+@pytest.mark.parametrize('encoding', ['hex', 'acs', 'z64', 'b64'])
+def test_scale_fixture_keeps_encoding(tmp_path, encoding):
+    fixture = load_fixture(write_fixture(tmp_path, encoding))
+    scaled = scale_fixture(fixture, 3)
+    assert fixture_encoding(scaled['data']) == encoding
+    assert scaled['bytes_total'] == 3 * len(bitmap)
+    assert decode_data(scaled['data'], scaled['bytes_total'], 10) == bitmap * 3
+    assert scaled['zpl'].count('^XZ') == 3
+
+
+@pytest.mark.parametrize('encoding', ['hex', 'acs', 'z64', 'b64'])
+def test_stage_functions(tmp_path, encoding):
+    functions = stage_functions(load_fixture(write_fixture(tmp_path, encoding)))
+    assert sorted(functions) == sorted(stages)
+    # B64 data is not ACS, it decompresses to the same hex as the other encodings
+    assert functions['decompress']()[:2 * len(bitmap)] == bytes_to_hex(bitmap)
+    assert functions['decode_bytes']() == bitmap
+    for function in functions.values():
+        function()
+
+
+def test_relative_name(tmp_path):
+    path = os.path.join(zplgrf_bench.fixtures_dir, 'zpl_gf', 'example.zpl')
+    assert relative_name(path) == 'zpl_gf/example.zpl'
+    assert relative_name(str(tmp_path / 'fixture.zpl')) == str(tmp_path / 'fixture.zpl')
+
+
+def test_main_without_fixtures(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exc_info:
+        main([str(tmp_path / '*.zpl'), '--no-imports'])
+    assert exc_info.value.code == 2
+    assert 'no fixtures found' in capsys.readouterr().err
+
+
+def test_main_compares_to_baseline(tmp_path, capsys):
+    path = write_fixture(tmp_path, 'b64')
+    saved = str(tmp_path / 'baseline.json')
+    assert main([path, '--no-imports', '--stages', 'decompress', 'compress_bytes', '--repeat', '1',
+                 '--min-time', '0', '--save', saved]) == 0
+    with open(saved) as in_file:
+        baseline = json.load(in_file)
+    assert sorted(baseline['results'][path]) == ['compress_bytes', 'decompress']
+
+    # anything is a regression with a negative threshold
+    assert main([path, '--no-imports', '--stages', 'decompress', '--repeat', '1', '--min-time', '0',
+                 '--baseline', saved, '--threshold', '-1']) == 1
+    assert '1 of 1 stages regressed' in capsys.readouterr().out
+
+
+def test_committed_baseline_matches_fixtures():
+    with open(baseline_path) as in_file:
+        baseline = json.load(in_file)
+    fixture_names = set(relative_name(path) for path in glob.glob(
+        os.path.join(zplgrf_bench.fixtures_dir, 'zpl_*', '*.zpl')))
+    for name, results in baseline['results'].items():
+        if name != 'cold start':
+            assert name.split(' (x')[0] in fixture_names
+            assert set(results) == set(stages)
+    assert fixture_names <= set(baseline['results'])
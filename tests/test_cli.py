@@ -0,0 +1,81 @@
+import io
+import os
+import shutil
+
+import pytest
+from PIL import Image
+
+from zplgrf import find_graphics
+
+from zplgrf_cli import convert, main
+
+fixtures_dir = os.path.join(os.path.dirname(__file__), '..')
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    """
+    Input directory with a ZPL fixture, an image and a broken image.
+    """
+    inputs = tmp_path / 'in'
+    inputs.mkdir()
+    shutil.copy(os.path.join(fixtures_dir, 'zpl_gf', 'example.zpl'), str(inputs / 'label.zpl'))
+    image = Image.new('L', (20, 10), 255)
+    image.paste(0, (2, 2, 12, 8))
+    image.save(str(inputs / 'logo.png'))
+    (inputs / 'broken.png').write_bytes(b'not a png')
+    return inputs
+
+
+@pytest.mark.parametrize('workers', [0, 1, 2])
+def test_convert_reports_errors_per_file(inputs, tmp_path, workers):
+    out = io.StringIO()
+    err = io.StringIO()
+    output_dir = tmp_path / 'out'
+    assert convert([str(inputs)], str(output_dir), workers=workers, chunksize=1, out=out, err=err) == 1
+    assert out.getvalue().startswith('3 files (1 failed), 2 graphics, ')
+    assert err.getvalue().startswith('{}: '.format(inputs / 'broken.png'))
+    assert err.getvalue().count('\n') == 1
+    assert sorted(os.listdir(str(output_dir))) == ['label_0.png', 'logo.zpl']
+    with open(str(output_dir / 'logo.zpl')) as in_file:
+        graphic, = find_graphics(in_file.read())
+    assert graphic.image.size == (24, 10)
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_convert_pool_matches_in_process(inputs, tmp_path, workers):
+    (inputs / 'broken.png').unlink()
+    for name in ['a.zpl', 'b.zpl', 'c.zpl']:
+        shutil.copy(str(inputs / 'label.zpl'), str(inputs / name))
+    output_dir = tmp_path / 'out'
+    assert convert([str(inputs)], str(output_dir), workers=workers, out=io.StringIO()) == 0
+    outputs = {}
+    for name in sorted(os.listdir(str(output_dir))):
+        with open(str(output_dir / name), 'rb') as in_file:
+            outputs[name] = in_file.read()
+    assert sorted(outputs) == ['a_0.png', 'b_0.png', 'c_0.png', 'label_0.png', 'logo.zpl']
+    assert outputs['a_0.png'] == outputs['label_0.png']
+
+
+def test_convert_without_inputs(tmp_path):
+    out = io.StringIO()
+    assert convert([str(tmp_path / '*.zpl')], str(tmp_path / 'out'), workers=0, out=out) == 1
+    assert out.getvalue().startswith('0 files (0 failed)')
+
+
+def test_main_convert_and_optimize(inputs, tmp_path):
+    (inputs / 'broken.png').unlink()
+    converted = tmp_path / 'converted'
+    optimized = tmp_path / 'optimized'
+    assert main(['convert', str(inputs / 'logo.png'), '-o', str(converted), '-w', '0', '--command', 'gf',
+                 '--encoding', 'z64', '--trim']) == 0
+    with open(str(converted / 'logo.zpl')) as in_file:
+        zpl = in_file.read()
+    assert '^GFA,' in zpl and ':Z64:' in zpl
+    graphic, = find_graphics(zpl)
+    assert graphic.image.size == (16, 6)
+
+    assert main(['optimize', str(converted), '-o', str(optimized), '-w', '0', '--encoding', 'hex']) == 0
+    with open(str(optimized / 'logo.zpl')) as in_file:
+        optimized_graphic, = find_graphics(in_file.read())
+    assert optimized_graphic.bitmap == graphic.bitmap
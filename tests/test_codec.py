@@ -0,0 +1,184 @@
+import glob
+import os
+import random
+
+import pytest
+
+from zplgrf import (build_gf_binary_command, bytes_to_hex, check_for_compression, compress_bytes, crc16,
+                    decode_binary_data, decode_data, decompress, decompress_to_bytes, decompress_z64_to_bytes,
+                    encode_data, find_graphics, iter_rows, iter_z64_chunks, repeat_count_chars, repeat_counts)
+from zplgrf_bench import load_fixture
+
+from tests import baseline
+
+fixture_paths = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'zpl_*', '*.zpl')))
+
+"""
+Encodings accepted by `encode_data` (besides `auto`).
+"""
+encodings = ('hex', 'acs', 'z64', 'b64')
+
+
+def random_bitmap(bytes_per_row, height, seed):
+    """
+    Packed bytes with blank, filled, repeated and random rows (all ACS repeat value cases).
+    """
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(height):
+        kind = rng.random()
+        if kind < 0.2:
+            rows.append(bytes(bytes_per_row))
+        elif kind < 0.3:
+            rows.append(b'\xff' * bytes_per_row)
+        elif kind < 0.5 and rows:
+            rows.append(rows[-1])
+        else:
+            rows.append(bytes(rng.choice([0, 0, 0xff, rng.randrange(256)]) for _ in range(bytes_per_row)))
+    return b''.join(rows)
+
+
+@pytest.mark.parametrize('encoding', encodings + ('auto',))
+@pytest.mark.parametrize('bytes_per_row, height', [(1, 1), (3, 7), (10, 40), (80, 25)])
+def test_encode_decode_round_trip(encoding, bytes_per_row, height):
+    bitmap = random_bitmap(bytes_per_row, height, seed=bytes_per_row * 1000 + height)
+    used_encoding, data = encode_data(bitmap, bytes_per_row, encoding)
+    assert encoding == 'auto' or used_encoding == encoding
+    assert decode_data(data, len(bitmap), bytes_per_row) == bitmap
+    assert b''.join(iter_rows(data, len(bitmap), bytes_per_row)) == bitmap
+
+
+@pytest.mark.parametrize('bytes_per_row, height', [(1, 1), (3, 7), (80, 25)])
+def test_acs_decoders_agree(bytes_per_row, height):
+    bitmap = random_bitmap(bytes_per_row, height, seed=height)
+    data = compress_bytes(bitmap, bytes_per_row)
+    assert check_for_compression(data)
+    assert decompress_to_bytes(data, bytes_per_row, len(bitmap), strict=True) == bitmap
+    assert bytes.fromhex(decompress(data, bytes_per_row)) == bitmap
+
+
+def test_repeat_count_chars():
+    for count in range(1, 2001):
+        chars = repeat_count_chars(count)
+        assert 'Z' not in chars
+        assert sum(repeat_counts[char] for char in chars) == count
+        # at most one lowercase below z and one uppercase besides as many z as needed
+        assert len(chars) <= count // 400 + 2
+        assert chars == ''.join(sorted(chars, key=lambda char: -repeat_counts[char]))
+
+
+@pytest.mark.parametrize('path', fixture_paths, ids=os.path.basename)
+def test_compress_bytes_is_never_longer(path):
+    fixture = load_fixture(path)
+    bitmap = decode_data(fixture['data'], fixture['bytes_total'], fixture['bytes_per_row'])
+    data = compress_bytes(bitmap, fixture['bytes_per_row'])
+    assert 'Z' not in data
+    assert len(data) <= len(bytes_to_hex(bitmap))
+    assert len(data) <= len(baseline.compress(bytes_to_hex(bitmap), fixture['bytes_per_row']))
+    assert decompress_to_bytes(data, fixture['bytes_per_row'], len(bitmap), strict=True) == bitmap
+
+
+@pytest.mark.parametrize('bytes_per_row, height', [(1, 1), (3, 7), (10, 40), (80, 25), (500, 3)])
+def test_compress_bytes_is_never_longer_than_hex(bytes_per_row, height):
+    bitmap = random_bitmap(bytes_per_row, height, seed=height)
+    data = compress_bytes(bitmap, bytes_per_row)
+    assert 'Z' not in data
+    assert len(data) <= len(bytes_to_hex(bitmap))
+
+
+@pytest.mark.parametrize('data', ['GA1Z2,', 'ZA1G2,', 'A1Z,'])
+def test_acs_rejects_invalid_count_letter(data):
+    with pytest.raises(ValueError):
+        decompress_to_bytes(data, 2, strict=True)
+    # outside of strict mode invalid characters are ignored by every decoder
+    expected = decompress_to_bytes(data.replace('Z', ''), 2)
+    assert decompress_to_bytes(data, 2) == expected
+    assert b''.join(iter_rows(data, len(expected), 2)) == expected
+
+
+@pytest.mark.parametrize('data, message', [
+    ('A1IA', 'overflows'),
+    ('0:', 'row repeat inside row'),
+    (':', 'without previous row'),
+    ('A1A', 'truncated'),
+])
+def test_acs_strict_errors(data, message):
+    with pytest.raises(ValueError, match=message):
+        decompress_to_bytes(data, 2, strict=True)
+
+
+def test_z64_crc_mismatch():
+    used_encoding, data = encode_data(random_bitmap(10, 10, seed=1), 10, 'z64')
+    crc = data[-4:]
+    corrupt = data[:-4] + ('0000' if crc != '0000' else '1111')
+    with pytest.raises(ValueError):
+        decompress_z64_to_bytes(corrupt)
+    assert decompress_z64_to_bytes(corrupt, verify=False) == decompress_z64_to_bytes(data)
+
+
+def test_z64_output_limit():
+    used_encoding, data = encode_data(bytes(10000), 100, 'z64')
+    with pytest.raises(ValueError):
+        decompress_z64_to_bytes(data, max_bytes=1000)
+
+
+
+def test_crc16():
+    # CRC-16/XMODEM check value
+    assert crc16('123456789') == crc16(b'123456789') == '31C3'
+    assert crc16('') == '0000'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 7, 8, 12, 65536])
+def test_b64_chunked_decoding(chunk_size):
+    bitmap = random_bitmap(10, 30, seed=chunk_size)
+    used_encoding, data = encode_data(bitmap, 10, 'b64')
+    assert data.startswith(':B64:')
+    chunks = list(iter_z64_chunks(data, chunk_size=chunk_size))
+    assert b''.join(chunks) == bitmap
+    # every chunk is decoded from at most chunk_size base64 characters (rounded down to a multiple of 4)
+    assert max(len(chunk) for chunk in chunks) <= max(4, chunk_size - chunk_size % 4) * 3 // 4
+    assert decompress_z64_to_bytes(data.encode('ascii')) == bitmap
+    # CRC may be missing or lowercase
+    assert decompress_z64_to_bytes(data[:data.rindex(':')]) == bitmap
+    assert decompress_z64_to_bytes(data[:-4] + data[-4:].lower()) == bitmap
+
+
+def test_b64_crc_mismatch():
+    used_encoding, data = encode_data(random_bitmap(10, 10, seed=2), 10, 'b64')
+    corrupt = data[:5] + ('A' if data[5] != 'A' else 'B') + data[6:]
+    with pytest.raises(ValueError, match='CRC mismatch'):
+        decompress_z64_to_bytes(corrupt)
+    assert len(decompress_z64_to_bytes(corrupt, verify=False)) == 100
+
+
+@pytest.mark.parametrize('encoding', ['z64', 'b64'])
+def test_output_cap_stops_early(encoding):
+    used_encoding, data = encode_data(bytes(100000), 100, encoding)
+    assert decompress_z64_to_bytes(data, max_bytes=100000) == bytes(100000)
+    decoded = 0
+    with pytest.raises(ValueError, match='exceeds 1000 bytes'):
+        for chunk in iter_z64_chunks(data, max_bytes=1000, chunk_size=64):
+            assert len(chunk) <= 64
+            decoded += len(chunk)
+    # the limit is checked before a chunk crossing it is returned
+    assert 1000 - 64 < decoded <= 1000
+    # decode_data caps output at the graphic size
+    with pytest.raises(ValueError):
+        decode_data(data, 99900, 100)
+
+
+def test_z64_rejects_other_data():
+    with pytest.raises(ValueError):
+        decompress_z64_to_bytes(':Z65:AAAA:0000')
+
+
+@pytest.mark.parametrize('compression_type', ['B', 'C'])
+def test_binary_gf_round_trip(compression_type):
+    bitmap = random_bitmap(12, 30, seed=2)
+    cmd = build_gf_binary_command(bitmap, 12, compression_type)
+    graphic, = find_graphics(b'^XA^FO0,0' + cmd + b'^FS^XZ')
+    assert graphic.compression_type == compression_type
+    assert graphic.bytes_total == len(bitmap)
+    assert graphic.bitmap == bitmap
+    assert decode_binary_data(graphic.data, compression_type, len(bitmap)) == bitmap
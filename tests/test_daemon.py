@@ -0,0 +1,117 @@
+import http.client
+import io
+import json
+import threading
+
+import pytest
+from PIL import Image
+
+from zplgrf import build_gf_command, bytes_to_hex, hooks
+
+from zplgrf_daemon import RenderDaemon, make_server, worker_state
+
+"""
+Label with a 16x8 graphic.
+"""
+label_zpl = '^XA^FO0,0{}^FS^XZ'.format(build_gf_command(16, 2, bytes_to_hex(bytes([0xF0, 0x0F] * 8)))).encode()
+
+
+def submit_all(render_daemon, requests):
+    """
+    Submits requests from one thread each, so they are queued at the same time.
+    """
+    responses = [None] * len(requests)
+
+    def submit(index):
+        responses[index] = render_daemon.submit(*requests[index])
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def test_daemon_batches_requests():
+    with RenderDaemon(workers=0, batch_window=1.0, max_batch=4) as render_daemon:
+        responses = submit_all(render_daemon, [('render', {'width': '16', 'height': '8'}, label_zpl)] * 8)
+        stats = render_daemon.stats()
+    for status, content_type, body, headers in responses:
+        assert (status, content_type, headers) == (200, 'image/png', {'X-Label-Width': 16, 'X-Label-Height': 8})
+        with Image.open(io.BytesIO(body)) as image:
+            assert image.size == (16, 8)
+    assert (stats['batches'], stats['mean_batch']) == (2, 4.0)
+    assert stats['requests'] == {'render': 8, 'convert': 0}
+    assert stats['errors'] == 0
+    assert stats['workers'] == 0
+    # the graphic is decoded once and then found in the worker cache
+    assert (stats['cache_misses'], stats['cache_hits'], stats['cache_entries']) == (1, 7, 1)
+    assert stats['latency_ms']['render']['p50'] is not None
+    assert stats['latency_ms']['convert'] == {'p50': None, 'p90': None, 'p99': None}
+
+
+def test_daemon_reports_request_errors():
+    with RenderDaemon(workers=0, batch_window=0.0) as render_daemon:
+        status, content_type, body, headers = render_daemon.submit('render', {'label': '1'}, label_zpl)
+        assert (status, body) == (400, b'Label 1 not found\n')
+        status, content_type, body, headers = render_daemon.submit('render', {'width': 'wide'}, label_zpl)
+        assert status == 400
+        with pytest.raises(ValueError):
+            render_daemon.submit('print', {}, label_zpl)
+        assert render_daemon.stats()['errors'] == 2
+
+
+@pytest.fixture
+def server():
+    """
+    HTTP server of an in process daemon with metrics on a free loopback port.
+    """
+    with RenderDaemon(workers=0, batch_window=0.0, metrics=True) as render_daemon:
+        server = make_server(render_daemon, port=0)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+    # stopping the daemon removes the metrics hook of the in process worker
+    assert 'metrics' not in worker_state
+    assert not hooks
+
+
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=10.0)
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    result = response.status, response.getheader('Content-Type'), response.read()
+    connection.close()
+    return result
+
+
+def test_daemon_http_stats_and_metrics(server):
+    status, content_type, body = request(server, 'POST', '/render?width=16&height=8', label_zpl)
+    assert (status, content_type) == (200, 'image/png')
+    image = Image.new('1', (16, 8), 1)
+    out_file = io.BytesIO()
+    image.save(out_file, 'PNG')
+    status, content_type, body = request(server, 'POST', '/convert?command=gf&encoding=hex', out_file.getvalue())
+    assert (status, body) == (200, b'^XA^FO0,0^GFA,16,16,2,' + b'0' * 32 + b'^FS^XZ')
+    assert request(server, 'GET', '/health') == (200, 'text/plain', b'ok\n')
+    assert request(server, 'GET', '/missing')[0] == 404
+    assert request(server, 'POST', '/missing', b'')[0] == 404
+
+    status, content_type, body = request(server, 'GET', '/stats')
+    assert (status, content_type) == (200, 'application/json')
+    stats = json.loads(body.decode())
+    assert stats['requests'] == {'render': 1, 'convert': 1}
+    assert stats['batches'] == 2
+
+    status, content_type, body = request(server, 'GET', '/metrics?format=json')
+    assert (status, content_type) == (200, 'application/json')
+    stages = {stage['stage']: stage for stage in json.loads(body.decode())['stages']}
+    assert stages['graphic_cache']['cache_misses'] == 1
+    assert stages['encode_data']['count'] == 1
+
+    status, content_type, body = request(server, 'GET', '/metrics')
+    assert (status, content_type) == (200, 'text/plain; version=0.0.4')
+    assert 'zplgrf_cache_misses_total{stage="graphic_cache"} 1\n' in body.decode()
@@ -0,0 +1,240 @@
+import glob
+import os
+
+import pytest
+
+from zplgrf import (DirectoryCacheTier, Graphic, GraphicCache, MetricsAggregator, build_gf_binary_command,
+                    build_gf_command, decode_data, dedupe_graphics, encode_data, find_graphics, instrumentation,
+                    optimize_zpl, render_labels)
+
+"""
+Bundled ZPL fixtures.
+"""
+fixture_paths = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'zpl_*', '*.zpl')))
+
+"""
+Packed bytes of a 16x8 graphic.
+"""
+logo = bytes([0xF0, 0x0F, 0x0F, 0xF0] * 4)
+
+"""
+Two labels recalling a graphic named LOGO, downloaded again with different data before the second label.
+"""
+redownload_zpl = (
+    '~DGR:LOGO.GRF,2,1,F00F'
+    '^XA^FO0,0^XGR:LOGO.GRF,1,1^FS^XZ'
+    '~DGR:LOGO.GRF,2,1,FFFF'
+    '^XA^FO0,0^XGR:LOGO.GRF,1,1^FS^XZ'
+)
+
+
+def rendered(zpl, width=16, height=8):
+    return [bitmap for span, width, height, bitmap in render_labels(zpl, width=width, height=height)]
+
+
+def repeated_gf_zpl(labels=4):
+    """
+    Labels with the same graphic inline in different encodings, a ~DG already named DUP1 and text fields.
+    """
+    zpl = '~DGR:DUP1.GRF,2,1,FFFF'
+    for label_i in range(labels):
+        encoding, data = encode_data(logo, 2, ('hex', 'acs', 'z64', 'b64')[label_i % 4])
+        zpl += '^XA^FO{},4{}^FS^FO0,0^XGR:DUP1.GRF,1,1^FS^FDlabel {}^FS^XZ'.format(
+            label_i, build_gf_command(len(logo), 2, data), label_i)
+    return zpl
+
+
+def test_dedupe_keeps_rendered_labels():
+    zpl = repeated_gf_zpl()
+    output, report = dedupe_graphics(zpl)
+    assert (report['graphics'], report['deduplicated'], report['replaced']) == (4, 1, 4)
+    assert output.count('^GF') == 0 and output.count('~DG') == 2
+    # the existing DUP1 download is kept, the new one gets a free name
+    assert '~DGR:DUP2.GRF' in output
+    assert rendered(output, 32, 16) == rendered(zpl, 32, 16)
+    assert report['bytes_saved'] == len(zpl) - len(output) > 0
+
+
+def test_dedupe_skips_single_graphics():
+    zpl = repeated_gf_zpl(1)
+    output, report = dedupe_graphics(zpl)
+    assert output == zpl and report['deduplicated'] == 0
+    output, report = dedupe_graphics(zpl, min_count=1, only_if_smaller=False)
+    assert report['deduplicated'] == 1
+    assert rendered(output, 32, 16) == rendered(zpl, 32, 16)
+
+
+def test_optimize_gf_redownloaded_name():
+    output, report = optimize_zpl(redownload_zpl, 'gf')
+    assert '~DG' not in output and '^XG' not in output
+    assert output.count('^GF') == 2
+    assert rendered(output) == rendered(redownload_zpl)
+    assert len(rendered(output)) == 2
+
+
+def test_optimize_gf_keeps_unresolved_recall():
+    zpl = '^XA^FO0,0^XGR:MISSING.GRF,1,1^FS^XZ' + redownload_zpl
+    output, report = optimize_zpl(zpl, 'gf')
+    assert output.startswith('^XA^FO0,0^XGR:MISSING.GRF,1,1^FS^XZ')
+    assert rendered(output) == rendered(zpl)
+
+
+@pytest.mark.parametrize('command', [None, 'dg', 'gf'])
+@pytest.mark.parametrize('path', fixture_paths)
+def test_optimize_keeps_rendered_labels(path, command):
+    with open(path, 'rb') as zpl_file:
+        zpl = zpl_file.read()
+    output, report = optimize_zpl(zpl, command)
+    assert isinstance(output, bytes)
+    assert report['verify_failures'] == 0
+    assert report['bytes_out'] == len(output)
+    assert [label[1:] for label in render_labels(output)] == [label[1:] for label in render_labels(zpl)]
+    if command is None:
+        assert len(output) <= len(zpl)
+
+
+def test_optimize_gf_applies_magnification():
+    zpl = '~DGR:LOGO.GRF,16,2,{}^XA^FO0,0^XGR:LOGO.GRF,2,3^FS^XZ'.format(logo.hex().upper())
+    output, report = optimize_zpl(zpl, 'gf')
+    assert '^XG' not in output and report['converted'] == 1
+    assert rendered(output, 32, 24) == rendered(zpl, 32, 24)
+
+
+def test_cache_key_distinguishes_latin_1_data():
+    keys = set(GraphicCache.key(data, 2, 1) for data in ['F\xe9', 'F\xe8', 'F?', 'F\u20ac'])
+    assert len(keys) == 4
+    assert GraphicCache.key('F\xe9', 2, 1) == GraphicCache.key('F\xe9'.encode('latin-1'), 2, 1)
+    assert GraphicCache.key('FF', 2, 1) != GraphicCache.key('FF', 2, 2)
+
+
+def test_cache_evicts_least_recently_used_entries():
+    cache = GraphicCache(max_entries=2)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    assert cache.get('a') == b'1'
+    cache.put('c', b'3')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1'
+    assert cache.get('c') == b'3'
+    assert cache.stats() == {'entries': 2, 'size': 2, 'hits': 3, 'misses': 1, 'tier_hits': 0, 'evictions': 1,
+                             'hit_ratio': 0.75}
+
+
+def test_cache_evicts_by_size():
+    cache = GraphicCache(max_bytes=10)
+    cache.put('a', bytes(4))
+    cache.put('b', bytes(4))
+    cache.get('a')
+    cache.put('c', bytes(4))
+    assert sorted(cache.entries) == ['a', 'c']
+    # replacing an entry only counts its new size
+    cache.put('c', bytes(6))
+    assert cache.size == 10
+    assert cache.stats()['evictions'] == 1
+
+
+def test_cache_rejects_entries_larger_than_max_bytes():
+    cache = GraphicCache(max_bytes=10)
+    cache.put('a', bytes(4))
+    cache.put('b', bytes(11))
+    assert cache.get('b') is None
+    assert cache.get('a') == bytes(4)
+    assert cache.stats()['evictions'] == 0
+
+
+def test_cache_fills_from_tier(tmp_path):
+    tier = DirectoryCacheTier(str(tmp_path / 'tier'))
+    data = encode_data(logo, 2, 'z64')[1]
+    first = GraphicCache(tier=tier)
+    assert decode_data(data, len(logo), 2, first) == logo
+    assert first.stats()['misses'] == 1
+    key = GraphicCache.key(data, len(logo), 2)
+    assert tier.get(key) == logo
+
+    # a new cache misses in memory, is filled from the tier and then hits in memory
+    second = GraphicCache(tier=tier)
+    assert decode_data(data, len(logo), 2, second) == logo
+    assert decode_data(data, len(logo), 2, second) == logo
+    stats = second.stats()
+    assert (stats['hits'], stats['misses'], stats['tier_hits'], stats['entries']) == (1, 1, 1, 1)
+    assert tier.get('missing') is None
+    assert [path.name for path in (tmp_path / 'tier').iterdir()] == ['{}.bin'.format(key)]
+
+
+def decoded_stages(aggregator):
+    return dict((stage['stage'], stage['count']) for stage in aggregator.summary()
+                if stage['stage'] in ('decode_data', 'decode_binary_data'))
+
+
+@pytest.mark.parametrize('path', fixture_paths, ids=os.path.basename)
+def test_graphic_metadata_does_not_decode(path):
+    with open(path, 'rb') as in_file:
+        zpl = in_file.read()
+    with instrumentation(MetricsAggregator()) as aggregator:
+        graphics = list(find_graphics(zpl))
+        for graphic in graphics:
+            assert graphic.width * graphic.height == graphic.bytes_total * 8
+            assert 0 < graphic.payload_size < len(zpl)
+            assert graphic.cmd.startswith(graphic.command)
+            assert graphic.cmd.endswith(graphic.data)
+            repr(graphic)
+            assert not graphic.is_decoded
+    assert graphics
+    assert decoded_stages(aggregator) == {}
+
+    with instrumentation(MetricsAggregator()) as aggregator:
+        graphic = graphics[0]
+        bitmap = graphic.bitmap
+        assert graphic.is_decoded
+        assert graphic.bitmap is bitmap
+        assert graphic.image.size == (graphic.width, graphic.height)
+    assert decoded_stages(aggregator) == {'decode_data': 1}
+    assert bitmap == decode_data(graphic.data, graphic.bytes_total, graphic.bytes_per_row)
+
+
+def test_graphic_headers():
+    zpl = ('~DGE:LOGO.GRF,16,2,' + encode_data(logo, 2, 'acs')[1] + '^XA^FO0,0' + build_gf_command(
+        16, 2, encode_data(logo, 2, 'z64')[1]) + '^FS').encode('latin-1')
+    zpl += build_gf_binary_command(logo, 2, 'C') + b'^XZ'
+    dg, gf, binary = find_graphics(zpl)
+    assert (dg.command, dg.device, dg.image_name, dg.extension) == ('~DG', 'E:', 'LOGO', '.GRF')
+    # ASCII ^GF commands are built with binary byte count equal to graphic field count
+    assert (gf.command, gf.compression_type, gf.binary_byte_count) == ('^GF', 'A', 16)
+    assert (binary.compression_type, binary.binary_byte_count) == ('C', binary.payload_size)
+    for graphic in (dg, gf, binary):
+        assert (graphic.width, graphic.height, graphic.bytes_total) == (16, 8, 16)
+        assert graphic.bitmap == logo
+    # bytes, str and bytearray zpl decode the same
+    assert [graphic.bitmap for graphic in find_graphics(zpl.decode('latin-1'))] == [logo] * 3
+    assert [graphic.bitmap for graphic in find_graphics(bytearray(zpl))] == [logo] * 3
+
+
+def test_graphic_errors_are_deferred():
+    data = encode_data(logo, 2, 'z64')[1]
+    zpl = '^XA' + build_gf_command(16, 2, data[:-4] + '0000') + '^XZ'
+    graphic, = find_graphics(zpl)
+    assert graphic.height == 8
+    with pytest.raises(ValueError):
+        graphic.bitmap
+    assert not graphic.is_decoded
+    with pytest.raises(ValueError):
+        next(find_graphics('^XA^GFA,16,16^XZ'))
+
+
+def test_graphic_slots_and_cache():
+    cache = GraphicCache()
+    zpl = build_gf_command(16, 2, encode_data(logo, 2, 'acs')[1]) * 2
+    first, second = find_graphics(zpl, cache)
+    assert not hasattr(first, '__dict__')
+    assert first.bitmap == second.bitmap == logo
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert isinstance(first, Graphic)
+
+
+def test_graphic_to_numpy():
+    numpy = pytest.importorskip('numpy')
+    graphic, = find_graphics(build_gf_command(16, 2, encode_data(logo, 2, 'hex')[1]))
+    pixels = graphic.to_numpy()
+    assert pixels.shape == (8, 16) and pixels.dtype == bool
+    assert pixels[0].tolist() == [True] * 4 + [False] * 8 + [True] * 4
+    assert numpy.packbits(pixels, axis=1).tobytes() == logo
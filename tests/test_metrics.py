@@ -0,0 +1,109 @@
+import json
+
+from zplgrf import (Event, MetricsAggregator, compress_z64, decode_data, duration_buckets, hooks, instrumentation,
+                    instrumented)
+
+"""
+Events of two stages, `encode` without cache lookups and `cache` with two hits and a miss
+(durations are exact binary fractions, so their sums are exact too).
+"""
+events = [
+    Event('encode', 0.25, 100, 40, None),
+    Event('encode', 0.5, 300, 60, None),
+    Event('cache', 2 ** -13, 0, 10, True),
+    Event('cache', 2 ** -13, 0, 10, True),
+    Event('cache', 2 ** -8, 0, 0, False),
+]
+
+
+def aggregate(events):
+    aggregator = MetricsAggregator()
+    for event in events:
+        aggregator(event)
+    return aggregator
+
+
+def test_aggregator_json():
+    exported = json.loads(aggregate(events).to_json())
+    assert exported['duration_buckets'] == list(duration_buckets)
+    encode, cache = exported['stages']
+    # hot paths first
+    assert (encode['stage'], cache['stage']) == ('encode', 'cache')
+    assert encode['count'] == 2
+    assert encode['seconds'] == 0.75 and encode['max_seconds'] == 0.5 and encode['mean_ms'] == 375.0
+    assert (encode['bytes_in'], encode['bytes_out'], encode['ratio']) == (400, 100, 0.25)
+    assert encode['buckets'] == [0, 0, 0, 0, 0, 0, 0, 2, 0, 0]
+    assert (cache['cache_hits'], cache['cache_misses'], cache['ratio']) == (2, 1, None)
+    assert cache['buckets'] == [0, 2, 0, 1, 0, 0, 0, 0, 0, 0]
+
+
+def test_aggregator_prometheus():
+    lines = aggregate(events).to_prometheus().splitlines()
+    assert lines[:2] == ['# HELP zplgrf_stage_seconds Time spent in pipeline stage.',
+                         '# TYPE zplgrf_stage_seconds histogram']
+    # stages are sorted by name, buckets are cumulative
+    assert lines[2:15] == [
+        'zplgrf_stage_seconds_bucket{stage="cache",le="0.0001"} 0',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="0.0005"} 2',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="0.001"} 2',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="0.005"} 3',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="0.01"} 3',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="0.05"} 3',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="0.1"} 3',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="0.5"} 3',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="1.0"} 3',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="5.0"} 3',
+        'zplgrf_stage_seconds_bucket{stage="cache",le="+Inf"} 3',
+        'zplgrf_stage_seconds_sum{stage="cache"} 0.004150390625',
+        'zplgrf_stage_seconds_count{stage="cache"} 3',
+    ]
+    assert 'zplgrf_stage_seconds_bucket{stage="encode",le="0.1"} 0' in lines
+    assert 'zplgrf_stage_seconds_bucket{stage="encode",le="0.5"} 2' in lines
+    assert 'zplgrf_stage_seconds_sum{stage="encode"} 0.75' in lines
+    assert lines[-14:] == [
+        '# HELP zplgrf_stage_bytes_in_total Bytes passed into pipeline stage.',
+        '# TYPE zplgrf_stage_bytes_in_total counter',
+        'zplgrf_stage_bytes_in_total{stage="cache"} 0',
+        'zplgrf_stage_bytes_in_total{stage="encode"} 400',
+        '# HELP zplgrf_stage_bytes_out_total Bytes produced by pipeline stage.',
+        '# TYPE zplgrf_stage_bytes_out_total counter',
+        'zplgrf_stage_bytes_out_total{stage="cache"} 20',
+        'zplgrf_stage_bytes_out_total{stage="encode"} 100',
+        # stages without cache lookups have no cache counters
+        '# HELP zplgrf_cache_hits_total Cache lookups that found a decoded graphic.',
+        '# TYPE zplgrf_cache_hits_total counter',
+        'zplgrf_cache_hits_total{stage="cache"} 2',
+        '# HELP zplgrf_cache_misses_total Cache lookups that did not find a decoded graphic.',
+        '# TYPE zplgrf_cache_misses_total counter',
+        'zplgrf_cache_misses_total{stage="cache"} 1',
+    ]
+    assert aggregate(events).to_prometheus('zpl').startswith('# HELP zpl_stage_seconds ')
+
+
+def test_aggregator_merge_and_reset():
+    merged = aggregate(events[:3])
+    merged.merge(aggregate(events[3:]).snapshot())
+    merged.merge(MetricsAggregator().snapshot())
+    assert merged.snapshot() == aggregate(events).snapshot()
+    merged.reset()
+    assert merged.summary() == []
+    assert merged.to_prometheus().splitlines()[2] == '# HELP zplgrf_stage_bytes_in_total Bytes passed into ' \
+                                                     'pipeline stage.'
+
+
+def test_instrumentation_of_pipeline():
+    @instrumented()
+    def double(data):
+        return data * 2
+
+    with instrumentation(MetricsAggregator()) as aggregator:
+        assert double(b'ab') == b'abab'
+        assert double(data=b'a') == b'aa'
+        decode_data(compress_z64(bytes(100)), 100, 10)
+    assert not hooks
+    double(b'abc')
+    stages = dict((stage['stage'], stage) for stage in aggregator.summary())
+    assert (stages['double']['count'], stages['double']['bytes_in'], stages['double']['bytes_out']) == (2, 3, 6)
+    assert stages['decode_data']['bytes_out'] == 100
+    # nested stages are reported too
+    assert stages['clean']['count'] == 1
@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+import zplgrf
+
+
+def run_python(statement):
+    """
+    Runs a statement in a fresh interpreter importing zplgrf from the tested source tree.
+    """
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(zplgrf.__file__)))
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    return subprocess.run([sys.executable, '-c', statement], capture_output=True, text=True, check=True,
+                          env=env).stdout
+
+
+def test_lazy_pil_modules():
+    from PIL import Image, ImageDraw
+    assert zplgrf.Image is Image
+    assert zplgrf.ImageDraw is ImageDraw
+
+
+def test_star_import_does_not_load_pil():
+    output = run_python('import sys; from zplgrf import *; print("PIL" in sys.modules, "Image" in dir())')
+    assert output.split() == ['False', 'False']
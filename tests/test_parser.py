@@ -0,0 +1,127 @@
+import glob
+import io
+import os
+
+import pytest
+
+from zplgrf import build_gf_binary_command, index_commands, resolve_fields, stream_tokenize, tokenize
+
+"""
+Bundled ZPL fixtures.
+"""
+fixture_paths = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'zpl_*', '*.zpl')))
+
+"""
+Label with label level commands between fields, a font before a position and a field without position.
+"""
+fields_zpl = ('^XA^PW400^LS0^FO10,10^A0N,20^FDabc^FS'
+              '^BY2^A0N,5^FT5,5^BCN^FD123^FS'
+              '^LH0,0^FDx^FS'
+              '^FO1,1^FO2,2^GFA,1,1,1,FF^XZ')
+
+
+def test_field_spans_start_at_position():
+    spans = [fields_zpl[field.start:field.end] for field in resolve_fields(fields_zpl)]
+    assert spans == ['^FO10,10^A0N,20^FDabc^FS', '^FT5,5^BCN^FD123^FS', '^FDx^FS', '^FO2,2^GFA,1,1,1,FF']
+
+
+def test_field_state():
+    fields = list(resolve_fields(fields_zpl))
+    assert [(field.field_type, field.x, field.y, field.data) for field in fields] == [
+        ('text', 10, 10, 'abc'), ('barcode', 5, 5, '123'), ('text', 0, 0, 'x'), ('graphic', 2, 2, None)]
+    # the font set before ^FT belongs to the barcode field, later fields use the default font
+    assert [field.font_name for field in fields] == ['0', '0', 'A', 'A']
+
+
+def stream_commands(zpl, chunk_size):
+    """
+    Commands of `stream_tokenize` over a file object, with absolute positions and command text.
+    """
+    commands = []
+    for buffer, buffer_offset, cmd in stream_tokenize(io.BytesIO(zpl), chunk_size=chunk_size):
+        commands.append((cmd.start + buffer_offset, cmd.end + buffer_offset, cmd.command, cmd.prefix,
+                         cmd.params_start + buffer_offset, bytes(buffer[cmd.start:cmd.end])))
+    return commands
+
+
+@pytest.mark.parametrize('path', fixture_paths)
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 4096, 1048576])
+def test_stream_tokenize_matches_tokenize(path, chunk_size):
+    with open(path, 'rb') as zpl_file:
+        zpl = zpl_file.read()
+    expected = [tuple(cmd) + (zpl[cmd.start:cmd.end],) for cmd in tokenize(zpl)]
+    assert stream_commands(zpl, chunk_size) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 16])
+def test_stream_tokenize_prefixes_and_binary_data(chunk_size):
+    binary = build_gf_binary_command(b'^XZ~DG\x00\xff' * 4, 4)
+    zpl = b'^XA^FO0,0' + binary + b'^FS^FDa~b^FS^CC$~CT+$XA$FDx^y$FS+JR$XZ'
+    expected = [tuple(cmd) + (zpl[cmd.start:cmd.end],) for cmd in tokenize(zpl)]
+    assert [cmd[2] for cmd in expected] == ['^XA', '^FO', '^GF', '^FS', '^FD', '^FS', '^CC', '~CT', '^XA', '^FD',
+                                            '^FS', '~JR', '^XZ']
+    assert stream_commands(zpl, chunk_size) == expected
+
+
+def test_index_commands():
+    index = index_commands(fields_zpl)
+    assert [cmd.start for cmd in index['^FS']] == [cmd.start for cmd in tokenize(fields_zpl) if cmd.command == '^FS']
+    assert len(index['^FO']) == 3
+
+
+def spans(zpl, **kwargs):
+    return [(cmd.command, cmd.prefix, zpl[cmd.start:cmd.end], zpl[cmd.params_start:cmd.end])
+            for cmd in tokenize(zpl, **kwargs)]
+
+
+@pytest.mark.parametrize('change', ['^CC$', '~CC$'])
+def test_tokenize_format_prefix_change(change):
+    zpl = '^XA' + change + '$FO1,1$FDa^b~c$FS$CC^^XZ'
+    assert spans(zpl) == [
+        ('^XA', '^', '^XA', ''),
+        (change[:3], change[0], change, '$'),
+        ('^FO', '$', '$FO1,1', '1,1'),
+        # the old format prefix is plain field data, the control prefix does not end field data either
+        ('^FD', '$', '$FDa^b~c', 'a^b~c'),
+        ('^FS', '$', '$FS', ''),
+        ('^CC', '$', '$CC^', '^'),
+        ('^XZ', '^', '^XZ', ''),
+    ]
+
+
+@pytest.mark.parametrize('change', ['^CT+', '~CT+'])
+def test_tokenize_control_prefix_change(change):
+    zpl = change + '^XA^FO0,0^FD~x^FS+JR~JR^XZ+CT~~DGR:A.GRF,1,1,00'
+    commands = [(command, prefix, span) for command, prefix, span, params in spans(zpl)]
+    assert commands == [
+        (change[:3], change[0], change),
+        ('^XA', '^', '^XA'),
+        ('^FO', '^', '^FO0,0'),
+        ('^FD', '^', '^FD~x'),
+        ('^FS', '^', '^FS'),
+        # ~JR is not a command any more, it belongs to +JR
+        ('~JR', '+', '+JR~JR'),
+        ('^XZ', '^', '^XZ'),
+        ('~CT', '+', '+CT~'),
+        ('~DG', '~', '~DGR:A.GRF,1,1,00'),
+    ]
+
+
+def test_tokenize_ignores_blank_prefix_change():
+    zpl = '^CC ^CC\n^XA^FDa^FS^XZ'
+    assert [command for command, prefix, span, params in spans(zpl)] == ['^CC', '^CC', '^XA', '^FD', '^FS', '^XZ']
+
+
+def test_tokenize_resumes_with_prefixes():
+    zpl = '^XA^CC$$FDa^b$FS$XZ'
+    resumed = zpl.index('$FD')
+    assert spans(zpl, start=resumed, format_prefix='$') == spans(zpl)[2:]
+    # without the prefix in effect, ^ inside field data starts a command
+    assert [span for command, prefix, span, params in spans(zpl, start=resumed)] == ['^b$FS$XZ']
+
+
+def test_tokenize_bytes_matches_text():
+    zpl = '^XA^CC$~CT+$FO1,1$FDa^b~c$FS+JR$XZ'
+    expected = [tuple(cmd) for cmd in tokenize(zpl)]
+    assert [tuple(cmd) for cmd in tokenize(zpl.encode('latin-1'))] == expected
+    assert [tuple(cmd) for cmd in tokenize(bytearray(zpl.encode('latin-1')))] == expected
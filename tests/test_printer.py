@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from zplgrf_printer import FakePrinter, PrinterPool
+
+"""
+Two labels sent with changed format and control prefixes.
+"""
+prefixed_zpl = b'^CC$~CT+$XA$FO0,0$FDA$FS$XZ+JR$XA$FO0,0$FDB$FS$XZ'
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 8, len(prefixed_zpl)])
+def test_split_jobs_keeps_prefixes_between_chunks(chunk_size):
+    jobs = []
+    buffer = b''
+    resume = 0
+    prefixes = ('^', '~')
+    for chunk_start in range(0, len(prefixed_zpl), chunk_size):
+        buffer += prefixed_zpl[chunk_start:chunk_start + chunk_size]
+        new_jobs, consumed, resume, prefixes = FakePrinter.split_jobs(buffer, resume, *prefixes)
+        jobs.extend(new_jobs)
+        buffer = buffer[consumed:]
+        resume -= consumed
+    assert jobs == [b'^CC$~CT+$XA$FO0,0$FDA$FS$XZ', b'+JR$XA$FO0,0$FDB$FS$XZ']
+    assert prefixes == ('$', '+')
+
+
+def test_fake_printer_records_prefixed_jobs():
+    async def send():
+        async with FakePrinter(read_size=3) as printer:
+            pool = PrinterPool(printer.host, printer.port)
+            await pool.send(prefixed_zpl)
+            await pool.close()
+            await printer.wait_idle()
+            return printer.jobs
+
+    jobs = run(send())
+    assert [job['data'] for job in jobs] == [b'^CC$~CT+$XA$FO0,0$FDA$FS$XZ', b'+JR$XA$FO0,0$FDB$FS$XZ']
+
+
+class ReplyingPrinter:
+    """
+    Printer replying to every received chunk and optionally closing connections after the first one.
+    """
+
+    def __init__(self, close_after_reply=False):
+        self.close_after_reply = close_after_reply
+        self.received = b''
+
+    async def handle(self, reader, writer):
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            self.received += chunk
+            writer.write(b'\x02STATUS\x03' * 1000)
+            await writer.drain()
+            if self.close_after_reply:
+                break
+        writer.close()
+
+
+def test_replies_are_read_and_closed_connections_discarded():
+    async def send():
+        printer = ReplyingPrinter(close_after_reply=True)
+        server = await asyncio.start_server(printer.handle, '127.0.0.1', 0)
+        pool = PrinterPool('127.0.0.1', server.sockets[0].getsockname()[1])
+        await pool.send(b'^XA^XZ')
+        # wait until the printer closed the idle connection and its replies were read
+        for _ in range(1000):
+            if pool.idle and pool.idle[0][1].done():
+                break
+            await asyncio.sleep(0.001)
+        await pool.send(b'^XA^XZ')
+        await pool.close()
+        server.close()
+        await server.wait_closed()
+        return pool, printer
+
+    pool, printer = run(send())
+    assert pool.connections == 2
+    assert pool.jobs == 2 and pool.errors == 0
+    assert pool.bytes_received >= len(b'\x02STATUS\x03') * 1000
+    assert printer.received == b'^XA^XZ^XA^XZ'
+
+
+@pytest.mark.parametrize('resend_partial', [False, True])
+def test_partially_written_job_is_not_resent(resend_partial):
+    async def send():
+        async with FakePrinter() as printer:
+            pool = PrinterPool(printer.host, printer.port, resend_partial=resend_partial)
+            await pool.send(b'^XA^XZ')
+            write = pool.write
+            failures = []
+
+            async def fail_once(writer, data):
+                if not failures:
+                    failures.append(data)
+                    raise ConnectionResetError('connection reset while writing')
+                await write(writer, data)
+
+            pool.write = fail_once
+            try:
+                await pool.send(b'^XA^FDB^FS^XZ')
+            except ConnectionResetError:
+                pass
+            await pool.close()
+            await printer.wait_idle()
+            return pool
+
+    pool = run(send())
+    if resend_partial:
+        assert (pool.connections, pool.jobs, pool.errors) == (2, 2, 0)
+    else:
+        assert (pool.connections, pool.jobs, pool.errors) == (1, 1, 1)
+
+
+@pytest.mark.parametrize('split', [1, 2, 3])
+def test_fake_printer_records_job_split_inside_xz(split):
+    # the connection stays open, so the job has to be recorded as soon as its ^XZ is complete
+    zpl = b'^XA^FO0,0^FDsplit^FS^XZ'
+    split_at = len(zpl) - split
+
+    async def send():
+        async with FakePrinter() as printer:
+            reader, writer = await asyncio.open_connection(printer.host, printer.port)
+            writer.write(zpl[:split_at])
+            await writer.drain()
+            await asyncio.sleep(0.01)
+            writer.write(zpl[split_at:])
+            await writer.drain()
+            for _ in range(1000):
+                if printer.jobs:
+                    break
+                await asyncio.sleep(0.001)
+            jobs = [job['data'] for job in printer.jobs]
+            writer.close()
+            return jobs
+
+    assert run(send()) == [zpl]
@@ -0,0 +1,346 @@
+import io
+import random
+
+import pytest
+from PIL import Image, ImageChops
+
+from zplgrf import (bitmap_digest, bits_to_chars, bits_to_image, bytes_to_image, changed_boxes, chars_to_bits,
+                    crop_bitmap, diff_bitmaps, diff_image, encode_data, image_to_bits, image_to_monochrome,
+                    invert_bitmap, iter_row_tiles, magnify_bitmap, otsu_threshold, rotate_bitmap, save_png,
+                    trim_bitmap, write_png_rows)
+
+from tests import baseline
+
+"""
+Random cases: seed, bytes per row, height.
+"""
+cases = [(seed, 1 + seed % 6, 1 + seed * 7 % 23) for seed in range(40)]
+
+
+def random_bitmap(bytes_per_row, height, seed, density=0.3):
+    rng = random.Random(seed)
+    return bytes(rng.randrange(256) if rng.random() < density else 0 for _ in range(bytes_per_row * height))
+
+
+def to_image(bitmap, bytes_per_row):
+    """
+    Image of packed bytes (mode `1`, black = 0).
+    """
+    return bytes_to_image(len(bitmap), bytes_per_row, bitmap)
+
+
+def padded(image):
+    """
+    Image padded with white to a whole number of bytes per row, as packed bytes of it are.
+    """
+    result = Image.new('1', (-(-image.size[0] // 8) * 8, image.size[1]), 255)
+    result.paste(image, (0, 0))
+    return result
+
+
+def assert_same(bitmap, bytes_per_row, image):
+    result = to_image(bitmap, bytes_per_row)
+    expected = padded(image)
+    assert result.size == expected.size
+    assert result.tobytes() == expected.tobytes()
+
+
+
+def random_bits(bits_per_row, height, seed):
+    rng = random.Random(seed)
+    return ''.join(rng.choice('0001') for _ in range(bits_per_row * height))
+
+
+@pytest.mark.parametrize('seed, bits_per_row, height', [(seed, 1 + seed * 5 % 37, 1 + seed % 9) for seed in range(20)])
+def test_bits_wrappers_match_baseline(seed, bits_per_row, height):
+    bits = random_bits(bits_per_row, height, seed)
+    image = bits_to_image(len(bits), bits_per_row, bits)
+    expected = baseline.bits_to_image(len(bits), bits_per_row, bits)
+    assert (image.mode, image.size) == (expected.mode, expected.size)
+    assert image.tobytes() == expected.tobytes()
+    assert image_to_bits(expected) == baseline.image_to_bits(expected) == (len(bits), bits_per_row, bits)
+    # an incomplete last row is dropped by both
+    bits += bits[:bits_per_row - 1]
+    assert bits_to_image(len(bits), bits_per_row, bits).tobytes() == expected.tobytes()
+    assert baseline.bits_to_image(len(bits), bits_per_row, bits).tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_chars_wrappers_match_baseline(seed):
+    rng = random.Random(seed)
+    chars = ''.join(rng.choice('0123456789ABCDEF') for _ in range(rng.randrange(1, 200)))
+    assert chars_to_bits(chars) == baseline.chars_to_bits(chars)
+    assert chars_to_bits(chars.lower()) == baseline.chars_to_bits(chars)
+    bits = baseline.chars_to_bits(chars)
+    assert bits_to_chars(bits) == baseline.bits_to_chars(bits) == chars
+    # trailing bits that do not make a whole character are dropped
+    assert bits_to_chars(bits + '11') == baseline.bits_to_chars(bits + '11') == chars
+    assert chars_to_bits('') == baseline.chars_to_bits('') == ''
+    assert bits_to_chars('') == baseline.bits_to_chars('') == ''
+
+
+@pytest.mark.parametrize('seed, bytes_per_row, height', cases)
+@pytest.mark.parametrize('rotation, transpose', [(90, Image.ROTATE_270), (180, Image.ROTATE_180),
+                                                 (270, Image.ROTATE_90)])
+def test_rotate_matches_pil(seed, bytes_per_row, height, rotation, transpose):
+    bitmap = random_bitmap(bytes_per_row, height, seed)
+    image = to_image(bitmap, bytes_per_row)
+    assert_same(*rotate_bitmap(bitmap, bytes_per_row, rotation), image.transpose(transpose))
+    width = random.Random(seed).randint(1, bytes_per_row * 8)
+    assert_same(*rotate_bitmap(bitmap, bytes_per_row, rotation, width),
+                image.crop((0, 0, width, height)).transpose(transpose))
+
+
+def test_rotate_orientations():
+    bitmap = random_bitmap(3, 5, seed=1)
+    for orientation, rotation in (('N', 0), ('R', 90), ('I', 180), ('B', 270)):
+        assert rotate_bitmap(bitmap, 3, orientation) == rotate_bitmap(bitmap, 3, rotation)
+    with pytest.raises(ValueError):
+        rotate_bitmap(bitmap, 3, 45)
+
+
+@pytest.mark.parametrize('seed, bytes_per_row, height', cases)
+def test_crop_matches_pil(seed, bytes_per_row, height):
+    rng = random.Random(seed)
+    bitmap = random_bitmap(bytes_per_row, height, seed)
+    image = to_image(bitmap, bytes_per_row)
+    width = bytes_per_row * 8
+    for _ in range(10):
+        left, top = rng.randint(-10, width + 5), rng.randint(-5, height + 3)
+        crop_width, crop_height = rng.randint(1, width + 8), rng.randint(1, height + 4)
+        cropped, cropped_bytes_per_row = crop_bitmap(bitmap, bytes_per_row, left, top, crop_width, crop_height)
+        # area outside of the bitmap is white
+        expected = Image.new('1', (crop_width, crop_height), 255)
+        expected.paste(image, (-left, -top))
+        assert_same(cropped, cropped_bytes_per_row, expected)
+
+
+@pytest.mark.parametrize('seed, bytes_per_row, height', cases)
+def test_invert_matches_pil(seed, bytes_per_row, height):
+    bitmap = random_bitmap(bytes_per_row, height, seed)
+    image = to_image(bitmap, bytes_per_row)
+    assert_same(invert_bitmap(bitmap, bytes_per_row), bytes_per_row, ImageChops.invert(image))
+    width = random.Random(seed).randint(0, bytes_per_row * 8)
+    # padding bits beyond width stay white
+    expected = Image.new('1', image.size, 255)
+    expected.paste(ImageChops.invert(image).crop((0, 0, width, height)), (0, 0))
+    assert_same(invert_bitmap(bitmap, bytes_per_row, width), bytes_per_row, expected)
+
+
+@pytest.mark.parametrize('seed, bytes_per_row, height', cases)
+def test_trim_matches_pil_bbox(seed, bytes_per_row, height):
+    bitmap = random_bitmap(bytes_per_row, height, seed, density=0.05)
+    image = to_image(bitmap, bytes_per_row)
+    trimmed, trimmed_bytes_per_row, x, y = trim_bitmap(bitmap, bytes_per_row)
+    bbox = ImageChops.invert(image).getbbox()
+    if bbox is None:
+        assert (trimmed, trimmed_bytes_per_row, x, y) == (b'\x00', 1, 0, 0)
+        return
+    assert (x, y) == bbox[:2]
+    assert len(trimmed) == trimmed_bytes_per_row * (bbox[3] - bbox[1])
+    assert_same(trimmed, trimmed_bytes_per_row, image.crop(bbox))
+
+
+@pytest.mark.parametrize('magnify_x, magnify_y', [(1, 1), (2, 1), (1, 3), (3, 2)])
+def test_magnify_matches_pil(magnify_x, magnify_y):
+    bitmap = random_bitmap(3, 5, seed=magnify_x * 10 + magnify_y)
+    image = to_image(bitmap, 3)
+    expected = image.resize((image.size[0] * magnify_x, image.size[1] * magnify_y), Image.NEAREST)
+    assert_same(*magnify_bitmap(bitmap, 3, magnify_x, magnify_y), expected)
+
+
+@pytest.mark.parametrize('seed, bytes_per_row, height', cases)
+def test_diff_matches_pil(seed, bytes_per_row, height):
+    rng = random.Random(seed)
+    bitmap_a = random_bitmap(bytes_per_row, height, seed)
+    changed = bytearray(bitmap_a)
+    for _ in range(rng.randint(1, 5)):
+        changed[rng.randrange(len(changed))] ^= 1 << rng.randrange(8)
+    bitmap_b = bytes(changed)
+    diff = diff_bitmaps(bitmap_a, bytes_per_row, bitmap_b)
+    xor_image = ImageChops.logical_xor(to_image(bitmap_a, bytes_per_row), to_image(bitmap_b, bytes_per_row))
+    changed_count = sum(xor_image.histogram()[1:])
+    assert diff.identical == (changed_count == 0)
+    assert diff.changed_pixels == changed_count
+    assert (diff.width, diff.height) == (bytes_per_row * 8, height)
+    # boxes cover every changed pixel, are tight and together span the PIL bounding box
+    pixels = {(x, y) for y in range(height) for x in range(bytes_per_row * 8) if xor_image.getpixel((x, y))}
+    assert all(any(left <= x < right and top <= y < bottom for left, top, right, bottom in diff.boxes)
+               for x, y in pixels)
+    for left, top, right, bottom in diff.boxes:
+        inside = [(x, y) for x, y in pixels if left <= x < right and top <= y < bottom]
+        assert min(x for x, y in inside) == left and max(x for x, y in inside) == right - 1
+        assert min(y for x, y in inside) == top and max(y for x, y in inside) == bottom - 1
+    if diff.boxes:
+        assert (min(box[0] for box in diff.boxes), min(box[1] for box in diff.boxes),
+                max(box[2] for box in diff.boxes), max(box[3] for box in diff.boxes)) == xor_image.getbbox()
+
+
+def test_diff_identical_and_padded():
+    bitmap = random_bitmap(2, 4, seed=3)
+    digest = bitmap_digest(bitmap, 2)
+    assert diff_bitmaps(bitmap, 2, bitmap, digest_a=digest, digest_b=digest).identical
+    # a smaller bitmap is padded with white
+    wider = b''.join(bitmap[i:i + 2] + b'\x00' for i in range(0, len(bitmap), 2)) + bytes(3)
+    diff = diff_bitmaps(bitmap, 2, wider, 3)
+    assert diff.identical and (diff.width, diff.height) == (24, 5)
+
+
+def test_changed_boxes_merge_distance():
+    row = bytes([0x80, 0, 0, 0, 0x01])
+    xor = row + bytes(5) * 2 + row
+    assert changed_boxes(xor, 5, merge_distance=40) == [(0, 0, 40, 4)]
+    assert changed_boxes(xor, 5, merge_distance=8) == [(0, 0, 1, 4), (39, 0, 40, 4)]
+    assert changed_boxes(xor, 5, merge_distance=1) == [(0, 0, 1, 1), (39, 0, 40, 1), (0, 3, 1, 4), (39, 3, 40, 4)]
+
+
+def test_diff_image_colors():
+    # row 4: pixels 12 and 13 removed and added, pixel 16 black in both
+    before = bytes(16) + bytes([0, 0b00001000, 0b10000000, 0]) + bytes(12)
+    after = bytes(16) + bytes([0, 0b00000100, 0b10000000, 0]) + bytes(12)
+    diff = diff_bitmaps(before, 4, after)
+    assert diff.changed_pixels == 2 and diff.boxes == [(12, 4, 14, 5)]
+    image = diff_image(before, 4, after, 4, diff)
+    assert image.getpixel((12, 4))[:3] == (255, 0, 0)
+    assert image.getpixel((13, 4))[:3] == (0, 160, 0)
+    assert image.getpixel((16, 4))[:3] == (0, 0, 0)
+    assert image.getpixel((30, 0))[:3] == (255, 255, 255)
+    # changed regions are outlined
+    assert (0, 0, 255) in {image.getpixel((x, 2))[:3] for x in range(8, 18)}
+
+
+def black_count(image):
+    return image.convert('L').histogram()[0]
+
+
+def flat_image(value, size=64, mode='L'):
+    return Image.new(mode, (size, size), value)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_otsu_matches_brute_force(seed):
+    rng = random.Random(seed)
+    histogram = [rng.randrange(100) if rng.random() < 0.3 else 0 for _ in range(256)]
+    histogram[rng.randrange(128)] += 1
+    histogram[128 + rng.randrange(128)] += 1
+
+    def between_class_variance(threshold):
+        background = [(value, histogram[value]) for value in range(threshold)]
+        foreground = [(value, histogram[value]) for value in range(threshold, 256)]
+        counts = [sum(count for value, count in pixels) for pixels in (background, foreground)]
+        if not all(counts):
+            return -1.0
+        means = [sum(value * count for value, count in pixels) / total
+                 for pixels, total in zip((background, foreground), counts)]
+        return counts[0] * counts[1] * (means[0] - means[1]) ** 2
+
+    variances = [between_class_variance(threshold) for threshold in range(1, 256)]
+    assert variances[otsu_threshold(histogram) - 1] == pytest.approx(max(variances))
+
+
+def test_otsu_splits_two_levels():
+    image = Image.new('L', (40, 10), 200)
+    image.paste(60, (0, 0, 30, 10))
+    assert 60 < otsu_threshold(image.histogram()) <= 200
+    # a fixed threshold of 50 keeps everything white, Otsu's method finds the darker level
+    assert black_count(image_to_monochrome(image, 'threshold', 50)) == 0
+    monochrome = image_to_monochrome(image, 'otsu')
+    assert monochrome.mode == '1'
+    assert black_count(monochrome) == 300
+    assert monochrome.getpixel((29, 0)) == 0 and monochrome.getpixel((30, 0)) == 255
+
+
+@pytest.mark.parametrize('value', [0, 1, 64, 128, 129, 192, 254, 255])
+def test_ordered_dithering_levels(value):
+    monochrome = image_to_monochrome(flat_image(value), 'ordered')
+    # Bayer thresholds are 4 * k + 1 for k in 0-63, a pixel is black if its value does not exceed the threshold
+    assert black_count(monochrome) == 64 * sum(1 for k in range(64) if value <= 4 * k + 1)
+    # every 8x8 tile is dithered the same way
+    tile = monochrome.crop((0, 0, 8, 8)).tobytes()
+    assert all(monochrome.crop((x, y, x + 8, y + 8)).tobytes() == tile for x in (8, 56) for y in (16, 40))
+
+
+@pytest.mark.parametrize('value', [0, 32, 128, 200, 255])
+def test_floyd_steinberg_keeps_mean(value):
+    monochrome = image_to_monochrome(flat_image(value), 'floyd-steinberg')
+    assert monochrome.mode == '1'
+    assert abs(black_count(monochrome) / 4096 - (255 - value) / 255) < 0.02
+
+
+@pytest.mark.parametrize('method', ['threshold', 'otsu', 'floyd-steinberg', 'ordered'])
+def test_monochrome_transparency_is_white(method):
+    image = Image.new('RGBA', (16, 16), (0, 0, 0, 0))
+    image.paste((0, 0, 0, 255), (0, 0, 8, 16))
+    monochrome = image_to_monochrome(image, method)
+    assert black_count(monochrome) == 128
+    assert monochrome.getpixel((7, 0)) == 0 and monochrome.getpixel((8, 0)) == 255
+
+
+def test_monochrome_method_errors_and_passthrough():
+    image = Image.new('1', (8, 8), 0)
+    assert image_to_monochrome(image, 'otsu') is image
+    with pytest.raises(ValueError):
+        image_to_monochrome(flat_image(128), 'atkinson')
+
+
+def rows_of(bitmap, bytes_per_row):
+    return [bitmap[start:start + bytes_per_row] for start in range(0, len(bitmap), bytes_per_row)]
+
+
+def read_png(out_file):
+    out_file.seek(0)
+    with Image.open(out_file) as image:
+        assert image.mode == '1'
+        return image.size, image.tobytes()
+
+
+@pytest.mark.parametrize('seed, bytes_per_row, height', cases[:10] + [(1, 250, 400)])
+def test_write_png_rows_matches_pil(seed, bytes_per_row, height):
+    # 250 random bytes per row do not compress, so 400 rows are written as several IDAT chunks
+    bitmap = random_bitmap(bytes_per_row, height, seed, density=1.0 if bytes_per_row == 250 else 0.3)
+    out_file = io.BytesIO()
+    assert write_png_rows(iter(rows_of(bitmap, bytes_per_row)), bytes_per_row, height, out_file) == height
+    image = to_image(bitmap, bytes_per_row)
+    assert read_png(out_file) == (image.size, image.tobytes())
+
+
+def test_write_png_rows_pads_and_truncates(tmp_path):
+    bitmap = random_bitmap(3, 6, seed=1)
+    rows = rows_of(bitmap, 3)
+    out_file = io.BytesIO()
+    # missing rows are white
+    assert write_png_rows(rows[:4], 3, 6, out_file) == 4
+    assert read_png(out_file) == ((24, 6), to_image(bitmap[:12] + bytes(6), 3).tobytes())
+    # extra rows are not consumed
+    remaining = iter(rows)
+    path = str(tmp_path / 'rows.png')
+    assert write_png_rows(remaining, 3, 2, path) == 2
+    assert next(remaining) == rows[2]
+    with open(path, 'rb') as in_file:
+        assert read_png(io.BytesIO(in_file.read())) == ((24, 2), to_image(bitmap[:6], 3).tobytes())
+
+
+@pytest.mark.parametrize('tile_height', [1, 3, 7, 8, 100])
+def test_iter_row_tiles(tile_height):
+    bitmap = random_bitmap(2, 7, seed=tile_height)
+    tiles = list(iter_row_tiles(rows_of(bitmap, 2), 2, tile_height, mode='L'))
+    assert [top for top, tile in tiles] == list(range(0, 7, tile_height))
+    assert all(tile.mode == 'L' and tile.size == (16, min(tile_height, 7 - top)) for top, tile in tiles)
+    full = Image.new('L', (16, 7))
+    for top, tile in tiles:
+        full.paste(tile, (0, top))
+    assert full.tobytes() == to_image(bitmap, 2).convert('L').tobytes()
+    assert list(iter_row_tiles([], 2, tile_height)) == []
+
+
+@pytest.mark.parametrize('encoding', ['hex', 'acs', 'z64', 'b64'])
+@pytest.mark.parametrize('first_row, last_row', [(0, None), (3, 9), (10, 100), (12, 12)])
+def test_save_png_crops_rows(encoding, first_row, last_row):
+    bitmap = random_bitmap(4, 12, seed=5)
+    data = encode_data(bitmap, 4, encoding)[1]
+    out_file = io.BytesIO()
+    rows = 12 - first_row if last_row is None else max(min(last_row, 12) - first_row, 0)
+    assert save_png(data, len(bitmap), 4, out_file, first_row, last_row) == rows
+    if rows:
+        expected = to_image(bitmap, 4).crop((0, first_row, 32, first_row + rows))
+        assert read_png(out_file) == (expected.size, expected.tobytes())
@@ -0,0 +1,36 @@
+import pytest
+
+from zplgrf import FontRegistry, TextRenderer, default_font_path
+
+
+def black_rows(bitmap, bytes_per_row):
+    return [row for row in range(len(bitmap) // bytes_per_row)
+            if any(bitmap[row * bytes_per_row:(row + 1) * bytes_per_row])]
+
+
+@pytest.mark.parametrize('char_height, font_size, baseline, glyph_rows', [
+    (57, 60, 43, (2, 42)),
+    (29, 30, 22, (1, 21)),
+    (114, 120, 86, (2, 84)),
+])
+def test_default_font_glyph_height(char_height, font_size, baseline, glyph_rows):
+    text_renderer = TextRenderer()
+    bitmap, bytes_per_row, run_baseline = text_renderer.render('H', 'E:', 'TT0003M_', char_height)
+    assert list(text_renderer.registry.fonts) == [(default_font_path, font_size)]
+    assert run_baseline == baseline
+    # first and last row of H, it sits on the baseline up to rounding of font metrics
+    rows = black_rows(bitmap, bytes_per_row)
+    assert (rows[0], rows[-1]) == glyph_rows
+    assert len(rows) == glyph_rows[1] - glyph_rows[0] + 1
+
+
+def test_registered_font_scales():
+    registry = FontRegistry()
+    registry.register('E:', 'TT0003M_', default_font_path, size_scale=2.0)
+    text_renderer = TextRenderer(registry)
+    bitmap, bytes_per_row, baseline = text_renderer.render('H', 'E:', 'TT0003M_.TTF', 30)
+    # without baseline scale the baseline is the font ascent
+    assert list(registry.fonts) == [(default_font_path, 60)]
+    assert baseline == 43
+    assert text_renderer.render('H', 'E:', 'TT0003M_.TTF', 30) == (bitmap, bytes_per_row, baseline)
+    assert text_renderer.stats()['hits'] == 1